@@ -39,12 +39,23 @@ CREATE TABLE product (
     status TINYINT DEFAULT 1 COMMENT '1-在售, 0-已售, 2-下架',
     publish_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     view_count INT DEFAULT 0,
+    favorite_count INT NOT NULL DEFAULT 0 COMMENT '收藏数，由收藏接口在事务内增减，app.py定期与favorites表对账',
     FOREIGN KEY (category_id) REFERENCES category(category_id),
     FOREIGN KEY (user_id) REFERENCES user(user_id),
     INDEX idx_category (category_id),
     INDEX idx_user (user_id),
     INDEX idx_status (status),
-    INDEX idx_publish_time (publish_time DESC)
+    INDEX idx_publish_time (publish_time DESC),
+    -- 商品列表键集分页：status=1 + 类别筛选 + (publish_time, product_id) 排序/游标
+    INDEX idx_status_category_time (status, category_id, publish_time, product_id),
+    -- 不按类别筛选时的商品列表分页
+    INDEX idx_status_time (status, publish_time, product_id),
+    -- /api/popular_products 按浏览量排序
+    INDEX idx_status_views (status, view_count),
+    -- /api/popular_products?sort=favorites 按收藏数排序
+    INDEX idx_status_favorites (status, favorite_count),
+    -- /api/search 关键词搜索（ngram解析器按二元组切分，中文无需分词）
+    FULLTEXT INDEX ft_product_text (product_name, description) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 收藏表
@@ -57,7 +68,8 @@ CREATE TABLE favorites (
     FOREIGN KEY (product_id) REFERENCES product(product_id) ON DELETE CASCADE,
     UNIQUE KEY unique_favorite (user_id, product_id),
     INDEX idx_user (user_id),
-    INDEX idx_product (product_id)
+    INDEX idx_product (product_id),
+    INDEX idx_created_at (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 订单表
@@ -76,7 +88,36 @@ CREATE TABLE orders (
     FOREIGN KEY (seller_id) REFERENCES user(user_id) ON DELETE CASCADE,
     INDEX idx_buyer (buyer_id),
     INDEX idx_seller (seller_id),
-    INDEX idx_status (status)
+    INDEX idx_status (status),
+    INDEX idx_order_time (order_time)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 在售商品统计汇总表（由发布/下单事务增量维护，app.py定期全量纠偏）
+-- 类别在售数
+CREATE TABLE category_stats (
+    category_id INT PRIMARY KEY,
+    on_sale_count INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (category_id) REFERENCES category(category_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 价格区间在售数（区间定义见app.py中的PRICE_BUCKETS）
+CREATE TABLE price_bucket_stats (
+    bucket_id TINYINT PRIMARY KEY COMMENT '1: 0-50, 2: 51-100, 3: 101-200, 4: 201-500, 5: 501以上',
+    on_sale_count INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 趋势汇总表：按天、类别累计发布数/金额、订单数/成交额（不含已取消）、完成订单数/金额
+-- （由发布/下单事务增量维护，app.py启动时回填历史并定期重算最近几天）
+CREATE TABLE daily_stats (
+    stat_date DATE NOT NULL,
+    category_id INT NOT NULL,
+    publish_count INT NOT NULL DEFAULT 0,
+    publish_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    order_count INT NOT NULL DEFAULT 0,
+    order_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    completed_count INT NOT NULL DEFAULT 0,
+    completed_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (stat_date, category_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 3. 插入测试数据
@@ -113,12 +154,34 @@ INSERT INTO favorites (user_id, product_id) VALUES
 (3, 5),
 (4, 3);
 
+UPDATE product p
+SET p.favorite_count = (SELECT COUNT(*) FROM favorites f WHERE f.product_id = p.product_id);
+
 -- 订单数据（修正：使用NOW()而不是NOM()）
 INSERT INTO orders (product_id, buyer_id, seller_id, price, status, order_time) VALUES
 (3, 1, 3, 20.00, 4, DATE_SUB(NOW(), INTERVAL 5 DAY)),
 (5, 2, 1, 80.00, 2, DATE_SUB(NOW(), INTERVAL 3 DAY)),
 (7, 4, 3, 15.00, 3, DATE_SUB(NOW(), INTERVAL 1 DAY));
 
+-- 统计汇总表初始数据
+INSERT INTO category_stats (category_id, on_sale_count)
+SELECT c.category_id, COUNT(p.product_id)
+FROM category c
+LEFT JOIN product p ON c.category_id = p.category_id AND p.status = 1
+GROUP BY c.category_id;
+
+INSERT INTO price_bucket_stats (bucket_id, on_sale_count) VALUES (1, 0), (2, 0), (3, 0), (4, 0), (5, 0);
+UPDATE price_bucket_stats s
+JOIN (
+    SELECT CASE WHEN price <= 50 THEN 1 WHEN price <= 100 THEN 2 WHEN price <= 200 THEN 3
+                WHEN price <= 500 THEN 4 ELSE 5 END AS bucket_id,
+           COUNT(*) AS cnt
+    FROM product
+    WHERE status = 1
+    GROUP BY bucket_id
+) t ON s.bucket_id = t.bucket_id
+SET s.on_sale_count = t.cnt;
+
 -- 4. 验证数据
 SELECT '✅ 数据库初始化完成！' as message;
 SELECT '📱 测试账号:' as info, 'test/123456, admin/admin123, 张三/123456, 李四/123456' as credentials;
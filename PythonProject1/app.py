@@ -1,103 +1,3772 @@
 
-from flask import Flask, request, jsonify, make_response, send_from_directory
+import os
+
+# APP_SERVER=gevent 时以gevent协程模式运行，必须在导入threading/socket等模块之前打补丁
+if os.environ.get('APP_SERVER') == 'gevent':
+    from gevent import monkey
+
+    monkey.patch_all()
+
+from flask import Flask, Response, request, g, jsonify, make_response, send_file, has_request_context
 from flask_cors import CORS
 import json
+import atexit
+import base64
+import csv
+import functools
+import gzip
+import hashlib
+import io
+import posixpath
+import zlib
+import bisect
+import heapq
+import math
+import pickle
+import random
+import re
+import signal
+import socket
 import sys
-import os
-from datetime import datetime
+import time
+import threading
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from decimal import Decimal, InvalidOperation
+from array import array
+from collections import deque, OrderedDict
+from itertools import islice
+from datetime import datetime, date, timedelta
+
+# 设置系统编码
+if sys.version_info[0] >= 3:
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+# 使用PyMySQL作为MySQLdb的替代
+import pymysql
+
+pymysql.install_as_MySQLdb()
+import MySQLdb
+from MySQLdb import OperationalError, ProgrammingError, IntegrityError
+import traceback
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# 可选的高性能JSON编码器，未安装时使用标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 可选的brotli压缩，未安装时静态资源只预压缩gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 可选的Pillow，未安装时上传的图片只保存原图，不生成缩略图
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# 可选的Redis客户端，查询结果缓存使用redis后端时需要
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# 可选的NumPy/SciPy，未安装时相似商品矩阵用纯Python逐用户累加共现
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+# 初始化Flask应用
+# 静态文件由serve_static按资源清单提供，不使用Flask内置的静态目录（否则会直接暴露app.py等源码）
+app = Flask(__name__, static_folder=None)
+CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+
+
+def env(name, default):
+    """读取环境变量覆盖配置项，按默认值的类型转换；未设置时返回默认值"""
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+    return value
+
+
+# 部署相关的配置项可由环境变量覆盖，变量名见各处的env()调用
+
+# 数据库配置
+DB_CONFIG = {
+    'host': env('DB_HOST', 'localhost'),
+    'port': env('DB_PORT', 3306),
+    'user': env('DB_USER', 'root'),
+    'passwd': env('DB_PASSWORD', '123456'),
+    'db': env('DB_NAME', 'campus_secondhand_simple'),
+    'charset': 'utf8mb4',
+    'autocommit': False
+}
+
+# 数据库熔断：连续失败达到阈值后直接拒绝借出连接，不再每个请求都等满连接/借出超时
+DB_BREAKER_FAILURE_THRESHOLD = 5   # 连续失败（建连失败、借出超时、查询时连接断开）次数
+DB_BREAKER_RESET_TIMEOUT = 10      # 熔断后每隔该秒数放行一个探测请求，成功即恢复
+
+# JSON编码器：'auto'（有orjson则用orjson）、'orjson' 或 'json'
+JSON_ENCODER = env('JSON_ENCODER', 'auto')
+
+# 连接池配置
+POOL_CONFIG = {
+    'min_size': env('DB_POOL_MIN_SIZE', 2),    # 启动时预热、并常驻的最少连接数
+    'max_size': env('DB_POOL_MAX_SIZE', 20),   # 连接总数上限（每个工作进程）
+    'idle_timeout': 300,           # 空闲超过该秒数且总数多于min_size的连接会被回收
+    'health_check_interval': 30,   # 空闲超过该秒数的连接在借出前先ping一次
+    'checkout_timeout': 5          # 没有空闲连接时最多等待的秒数
+}
+
+# 只读副本：每项在DB_CONFIG基础上覆盖host/port等，留空则所有请求都走主库
+# 环境变量DB_REPLICAS为逗号分隔的host:port，如 10.0.0.2:3306,10.0.0.3:3306
+REPLICA_CONFIGS = [
+    {'host': host, 'port': int(port or 3306)}
+    for host, _, port in (item.strip().partition(':') for item in env('DB_REPLICAS', '').split(',') if item.strip())
+]
+REPLICA_POOL_CONFIG = dict(POOL_CONFIG, min_size=1, checkout_timeout=1)
+REPLICA_MAX_LAG = 5            # 复制延迟超过该秒数的副本暂停接收读请求
+REPLICA_CHECK_INTERVAL = 2     # 检查副本连通性与复制延迟的间隔（秒）
+READ_YOUR_WRITES_WINDOW = 5    # 用户写入后该秒数内其读请求仍走主库，应不小于REPLICA_MAX_LAG
+
+# 查询结果缓存：按(SQL, 参数)缓存只读查询结果，写接口按标签失效
+QUERY_CACHE_ENABLED = True
+QUERY_CACHE_BACKEND = env('QUERY_CACHE_BACKEND', 'memory')  # memory：进程内LRU；redis：本机Redis，多个工作进程共享缓存与失效
+QUERY_CACHE_REDIS_URL = env('REDIS_URL', 'redis://localhost:6379/0')
+QUERY_CACHE_TTL = 30               # 默认有效期（秒），兜底不做显式失效的变化（浏览量写回、收藏数对账、副本延迟）
+QUERY_CACHE_MAX_ENTRIES = 5000     # memory后端最多缓存的结果数（LRU淘汰）
+QUERY_CACHE_MAX_ROWS = 5000        # 结果行数超过该值不缓存
+QUERY_CACHE_WAIT = 5               # 并发未命中时等待同一查询结果的最长秒数，超时后自行查询
+QUERY_CACHE_TAG_TTL = 86400        # redis后端标签版本号的过期时间，需远大于任何结果的有效期
+QUERY_CACHE_STALE_MAX_ENTRIES = 2000  # 每个查询保留最近一次成功的结果，数据库不可用时作为过期数据返回
+QUERY_CACHE_STALE_MAX_AGE = 86400     # 超过该秒数的过期数据不再返回
+
+# 监控指标与慢查询日志
+METRICS_ENABLED = True
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_QUERY_THRESHOLD = 0.2   # 超过该秒数的查询记入慢查询日志
+SLOW_QUERY_LOG_SIZE = 100    # 保留最近的慢查询条数
+SLOW_QUERY_MAX_SQL = 2000    # 慢查询日志中SQL/参数的最大长度
+
+# 条件GET：目录与统计接口带ETag，客户端缓存仍有效时直接返回304
+CONDITIONAL_GET_ENABLED = True
+CONDITIONAL_GET_MAX_AGE = 0   # Cache-Control的max-age，0表示每次使用缓存前都向服务端校验
+VERSION_TTL = 60              # ETag时间片（秒）：多进程部署下其他进程的写入最晚在该时间后使旧ETag失效
+
+# 静态资源：启动时建立清单并预压缩
+STATIC_ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.json': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.ico': 'image/x-icon',
+    '.woff2': 'font/woff2'
+}
+STATIC_COMPRESSIBLE = {'.html', '.js', '.css', '.json', '.svg'}
+STATIC_COMPRESS_MIN_SIZE = 1024         # 小于该字节数的文件不压缩
+STATIC_SENDFILE_MIN_SIZE = 256 * 1024   # 达到该大小的原文件不常驻内存，经sendfile零拷贝发送
+STATIC_IMMUTABLE_MAX_AGE = 31536000     # 带指纹文件名的资源内容不变，缓存一年
+
+# 实时推送（Server-Sent Events）
+SSE_BUFFER_SIZE = 1000         # 保留最近的事件数，断线重连时按Last-Event-ID补发
+SSE_HEARTBEAT_INTERVAL = 15    # 无事件时发送注释行保活的间隔（秒），同时用于发现已断开的连接
+SSE_RETRY_MS = 3000            # 建议浏览器断线后重连的等待时间（毫秒）
+SSE_MAX_CONNECTIONS = 5000     # 单进程最多的推送连接数，线程模式下每个连接占一个线程
+
+# 商品图片：原图按内容哈希存储，缩略图在进程池中生成
+IMAGE_STORE_ROOT = os.path.join(STATIC_ROOT, 'media')
+IMAGE_MAX_BYTES = 5 * 1024 * 1024   # 单张图片大小上限
+IMAGE_MAX_PER_PRODUCT = 3
+IMAGE_THUMB_SIZES = {'small': 200, 'medium': 480, 'large': 1080}  # 缩略图名 -> 最长边像素
+IMAGE_THUMB_QUALITY = 85
+IMAGE_WORKERS = 2                   # 生成缩略图的进程数
+IMAGE_THUMB_WAIT = 3                # 缩略图尚未生成时，请求最多等待的秒数，超时返回原图
+IMAGE_UPLOAD_CHUNK = 64 * 1024
+
+# 商品列表分页配置
+PRODUCT_PAGE_SIZE = 20        # 未指定limit时的每页条数
+PRODUCT_PAGE_SIZE_MAX = 100   # limit的服务端上限
+
+# 商品列表可投影的字段：字段名 -> SELECT表达式
+PRODUCT_LIST_FIELDS = {
+    'product_id': 'p.product_id',
+    'product_name': 'p.product_name',
+    'price': 'p.price',
+    'description': 'p.description',
+    'category_id': 'p.category_id',
+    'category_name': 'c.category_name',
+    'seller_name': 'u.username AS seller_name',
+    'publish_time': 'p.publish_time',
+    'view_count': 'p.view_count',
+    'favorite_count': 'p.favorite_count',
+    'thumbnail': "CASE WHEN JSON_VALID(p.images) THEN JSON_UNQUOTE(JSON_EXTRACT(p.images, '$[0].thumbs.small')) END AS thumbnail"
+}
+PRODUCT_LIST_DEFAULT_FIELDS = ['product_id', 'product_name', 'price', 'description',
+                               'category_name', 'seller_name']
+
+# 相似商品推荐（收藏/购买共现，后台批量计算）
+RECOMMEND_TOP_K = 20                # 每件商品保留的近邻数
+RECOMMEND_REBUILD_INTERVAL = 1800   # 重算相似度矩阵的间隔（秒）
+RECOMMEND_ORDER_WEIGHT = 3.0        # 购买信号相对收藏的权重
+RECOMMEND_MAX_USER_ITEMS = 500      # 交互商品数超过该值的用户不参与共现计算，避免矩阵乘法按平方膨胀
+RECOMMEND_MAX_SEEDS = 50            # 个性化推荐最多以用户最近的多少件收藏/购买作为种子
+RECOMMEND_PAGE_SIZE = 10
+
+# 商品目录内存索引：开启后/product_list直接由内存索引应答
+CATALOG_INDEX_ENABLED = True
+CATALOG_RECONCILE_INTERVAL = 300  # 与MySQL全量对账的间隔（秒）
+
+# 价格区间：(区间ID, 价格上限（含，None表示不设上限）, 标签)
+PRICE_BUCKETS = [
+    (1, 50, '0-50元'),
+    (2, 100, '51-100元'),
+    (3, 200, '101-200元'),
+    (4, 500, '201-500元'),
+    (5, None, '501元以上')
+]
+STATS_RECOMPUTE_INTERVAL = 3600  # 统计汇总表全量纠偏的间隔（秒）
+
+# 趋势汇总表（按天、类别累计发布与订单）
+TRENDS_RECONCILE_DAYS = 3           # 定期纠偏时重算最近多少天的汇总行
+TRENDS_RECONCILE_INTERVAL = 3600    # 纠偏间隔（秒）
+TRENDS_DEFAULT_BUCKETS = {'day': 30, 'week': 12, 'month': 12}  # 未指定from时返回的桶数
+TRENDS_MAX_BUCKETS = 400            # 单次查询最多的桶数
+
+# 数据导出：表名 -> 导出列（首列为主键）与增量导出的时间列
+EXPORT_TABLES = {
+    'product': {
+        'columns': ['product_id', 'product_name', 'price', 'description', 'category_id', 'user_id',
+                    'images', 'status', 'publish_time', 'view_count'],
+        'time_column': 'publish_time'
+    },
+    'orders': {
+        'columns': ['order_id', 'product_id', 'buyer_id', 'seller_id', 'price', 'status',
+                    'order_time', 'pay_time', 'complete_time'],
+        'time_column': 'order_time'
+    },
+    'favorites': {
+        'columns': ['favorite_id', 'user_id', 'product_id', 'created_at'],
+        'time_column': 'created_at'
+    }
+}
+EXPORT_CHUNK_ROWS = 1000  # 每次从服务端读取/编码的行数
+
+# 收藏状态批量查询与按用户缓存
+FAVORITE_BATCH_MAX = 500          # 批量查询一次最多的商品数
+FAVORITE_CACHE_MAX_USERS = 10000  # 最多缓存的用户数（LRU淘汰）
+FAVORITE_CACHE_MAX_ITEMS = 2000   # 收藏数超过该值的用户不缓存，直接IN查询
+FAVORITE_CACHE_TTL = 300          # 缓存有效期（秒），兜底多进程部署下的失效
+FAVORITE_RECONCILE_INTERVAL = 3600  # product.favorite_count 与favorites表对账的间隔（秒）
+FAVORITE_RECONCILE_CHUNK = 5000     # 对账时每段（每个事务）覆盖的product_id数
+
+# 批量导入
+IMPORT_BATCH_SIZE = 500      # 默认每批插入/提交的行数
+IMPORT_BATCH_SIZE_MAX = 5000
+IMPORT_MAX_ERRORS = 1000     # 响应中最多返回的逐行错误数
+IMPORT_MAX_ELEMENT_CHARS = 1024 * 1024  # JSON数组中单个元素的最大字符数，超过即判为非法，避免缓冲整个请求体
+
+# 下单遇到死锁/锁等待超时时的重试策略
+ORDER_MAX_RETRIES = 3
+ORDER_RETRY_BACKOFF = 0.02   # 首次重试前等待的秒数，之后指数退避并加随机抖动
+LOCK_CONFLICT_ERRORS = (1205, 1213)  # ER_LOCK_WAIT_TIMEOUT, ER_LOCK_DEADLOCK
+# 表示数据库本身不可用的错误，计入熔断；SQL错误（如1054未知列）等其他OperationalError按普通错误处理
+# CR_CONNECTION_ERROR, CR_CONN_HOST_ERROR, CR_SERVER_GONE_ERROR, CR_SERVER_LOST, CR_MALFORMED_PACKET,
+# ER_CON_COUNT_ERROR, ER_QUERY_TIMEOUT
+CONNECTION_ERRORS = (2002, 2003, 2006, 2013, 2055, 1040, 3024)
+
+# 浏览量写后缓冲
+VIEW_FLUSH_INTERVAL = 5       # 写回间隔（秒）
+VIEW_FLUSH_THRESHOLD = 1000   # 累计浏览达到该次数时提前写回
+VIEW_FLUSH_CHUNK = 500        # 每条多行UPDATE包含的商品数
+VIEW_PENDING_MAX_KEYS = 100000  # 缓冲区最多的商品数；目录索引未就绪时无法校验商品ID，超出后新商品的浏览直接丢弃
+
+# 商品搜索配置
+SEARCH_KEYWORD_MAX_LENGTH = 50
+SEARCH_MAX_OFFSET = 1000
+
+# 限流与过载保护
+RATE_LIMIT_ENABLED = env('RATE_LIMIT_ENABLED', True)
+RATE_LIMIT_BACKEND = env('RATE_LIMIT_BACKEND', 'memory')  # memory：进程内令牌桶；redis：本机Redis，多个工作进程共享令牌桶
+RATE_LIMIT_REDIS_URL = env('REDIS_URL', 'redis://localhost:6379/0')
+RATE_LIMIT_MAX_KEYS = 100000    # memory后端最多跟踪的客户端数（LRU淘汰，被淘汰的客户端重新从满桶开始）
+RATE_LIMIT_TRUST_PROXY = env('RATE_LIMIT_TRUST_PROXY', False)  # 部署在反向代理之后时开启，从X-Forwarded-For取客户端IP
+RATE_LIMIT_PROXY_HOPS = env('RATE_LIMIT_PROXY_HOPS', 1)        # 客户端与本服务之间受信任的代理层数
+# 不限流的直连客户端IP，逗号分隔（如本机压测时设为127.0.0.1,::1）；默认为空，
+# 因为反向代理与本服务同机部署时，所有经代理的请求都来自127.0.0.1
+RATE_LIMIT_EXEMPT_IPS = {ip.strip() for ip in env('RATE_LIMIT_EXEMPT_IPS', '').split(',') if ip.strip()}
+# 预算名 -> (每秒补充的令牌数, 桶容量)；每个请求消耗客户端IP桶，写请求体带有调用方user_id时同时消耗该用户的桶
+RATE_LIMIT_BUDGETS = {
+    'default': (20, 40),
+    'list': (10, 20),       # 列表/搜索按limit计费，每PRODUCT_PAGE_SIZE条消耗一个令牌
+    'write': (5, 10),
+    'auth': (1, 5),
+    'import': (0.1, 2),
+    'export': (0.02, 2),
+    'expensive': (0.1, 1),
+}
+# 接口（视图函数名）-> 预算名，未列出的接口使用default
+RATE_LIMIT_ROUTES = {
+    'product_list': 'list', 'search_products': 'list', 'popular_products': 'list',
+    'publish_product': 'write', 'create_order': 'write', 'toggle_favorite': 'write', 'upload_image': 'write',
+    'login': 'auth', 'register': 'auth',
+    'bulk_publish': 'import',
+    'export_table': 'export',
+    'debug_tables': 'expensive',
+}
+RATE_LIMIT_LIST_BUDGETS = {'list'}
+RATE_LIMIT_BODY_MAX = 64 * 1024  # 从JSON请求体中取user_id时，只解析不超过该字节数的请求体
+# 不经过限流与并发控制的接口：健康检查、监控、长连接推送和静态资源
+ADMISSION_EXEMPT_ROUTES = {'health', 'metrics', 'event_stream', 'index', 'serve_static', 'serve_media'}
+MAX_CONCURRENT_REQUESTS = env('MAX_CONCURRENT_REQUESTS', 64)  # 单进程同时处理的请求数上限，超出的请求立即返回503（线程模式下由accept时的排队上限先行拒绝）
+ROUTE_CONCURRENCY = {            # 昂贵接口单独的并发上限（单进程）
+    'debug_tables': 1,
+    'export_table': 2,
+    'bulk_publish': 2,
+}
+ADMISSION_RETRY_AFTER = 1        # 因并发已满被拒绝时建议的重试等待（秒）
+
+# 服务进程：python app.py 启动，主进程监听端口后fork出工作进程，每个工作进程用固定大小的线程池处理请求
+# 多个工作进程之间不同步内存状态：商品目录/搜索索引、实时推送、memory后端的查询缓存与收藏缓存都只反映本进程的写入，
+# 其他进程要等定期对账（CATALOG_RECONCILE_INTERVAL）或缓存过期后才看到变化，推送事件也只发给本进程的订阅者。
+# 因此默认单进程；需要多进程时，查询缓存与限流应改用redis后端，并接受列表/搜索最长数分钟的延迟
+SERVER_HOST = env('APP_HOST', '0.0.0.0')
+SERVER_PORT = env('APP_PORT', 5000)
+SERVER_WORKERS = env('APP_WORKERS', 1)  # 工作进程数；不支持fork的平台（Windows）固定为单进程
+SERVER_THREADS = env('APP_THREADS', 16)                   # 每个工作进程处理请求的线程数（gevent模式下不限）
+SERVER_BACKLOG = env('APP_BACKLOG', 1024)                 # 监听队列长度，容纳accept循环来不及取走的新连接
+SERVER_QUEUE_SIZE = env('APP_QUEUE_SIZE', 8)              # 线程都忙时在进程内排队的连接数，排满后新连接直接返回503
+SERVER_REQUEST_TIMEOUT = env('APP_REQUEST_TIMEOUT', 30)   # 客户端连接单次读写的超时（秒），避免慢客户端长期占用线程
+SERVER_SHUTDOWN_TIMEOUT = env('APP_SHUTDOWN_TIMEOUT', 30) # 停止时等待进行中请求完成的最长秒数，超时后强制退出
+
+
+# ==================== 数据库连接池 ====================
+class PoolTimeout(Exception):
+    """等待空闲连接超时"""
+
+
+class CircuitOpen(PoolTimeout):
+    """熔断中，未尝试借出连接"""
+
+
+class CircuitBreaker:
+    """数据库熔断器
+
+    closed：正常放行，记录连续失败次数，达到阈值转为open；
+    open：直接拒绝，reset_timeout秒后转为half_open；
+    half_open：每reset_timeout秒只放行一个探测请求，探测成功转为closed，失败回到open。
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=10):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        if self.state == 'closed':
+            return True
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_timeout:
+                # 放行一个探测请求；下一个探测至少再等reset_timeout
+                self.state = 'half_open'
+                self._opened_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        if self.state == 'closed' and not self._failures:
+            return
+        with self._lock:
+            if self.state != 'closed':
+                print(f"数据库{self.name}熔断恢复")
+            self.state = 'closed'
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self._failures >= self.failure_threshold):
+                if self.state == 'closed':
+                    self.opened += 1
+                    print(f"数据库{self.name}连续失败{self._failures}次，熔断{self.reset_timeout}秒")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected
+            }
+
+
+class ConnectionPool:
+    """线程安全的有界MySQL连接池
+
+    空闲连接按后进先出复用，使常用连接保持活跃、多余连接自然老化被回收；
+    只有空闲较久的连接才会在借出前ping检查，避免每次请求都多一次往返。
+    """
+
+    def __init__(self, db_config, min_size=2, max_size=20, idle_timeout=300,
+                 health_check_interval=30, checkout_timeout=5):
+        self.db_config = db_config
+        self.breaker = CircuitBreaker(f"{db_config.get('host')}:{db_config.get('port', 3306)}",
+                                      DB_BREAKER_FAILURE_THRESHOLD, DB_BREAKER_RESET_TIMEOUT)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, 归还时间)，右端为最近归还
+        self._size = 0        # 已建立（含正在建立）的连接总数
+        self._in_use = 0
+        self._closed = False
+
+        # 统计信息
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        if METRICS_ENABLED:
+            return InstrumentedConnection(**self.db_config)
+        return MySQLdb.connect(**self.db_config)
+
+    def _open_slot(self):
+        """在已占用名额的前提下建立新连接，失败时归还名额"""
+        try:
+            conn = self._connect()
+        except Exception:
+            self.breaker.record_failure()
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self.breaker.record_success()
+        conn.owner_pool = self
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def warmup(self):
+        """预热：建立连接直到达到min_size"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            conn = self._open_slot()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _reap_idle_locked(self, now):
+        """取出空闲超时的多余连接（需持有锁），由调用方在锁外关闭"""
+        expired = []
+        while (self._idle and self._size > self.min_size
+               and now - self._idle[0][1] > self.idle_timeout):
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+            self._discarded += 1
+        return expired
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except:
+            pass
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        """借出一个连接，超过timeout秒仍无可用连接时抛出PoolTimeout，熔断中直接抛出CircuitOpen"""
+        if not self.breaker.allow():
+            raise CircuitOpen(f"数据库{self.breaker.name}熔断中")
+        if timeout is None:
+            timeout = self.checkout_timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            conn = None
+            last_used = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("连接池已关闭")
+                    expired = self._reap_idle_locked(time.monotonic())
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        # 连接都被借出只说明本进程繁忙，不代表数据库故障，不计入熔断
+                        self._timeouts += 1
+                        raise PoolTimeout(f"等待数据库连接超过{timeout}秒")
+                    self._cond.wait(remaining)
+            for old in expired:
+                self._close_quietly(old)
+
+            if conn is None:
+                conn = self._open_slot()
+            elif (time.monotonic() - last_used > self.health_check_interval
+                  and not self._is_alive(conn)):
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._in_use += 1
+                self._checkouts += 1
+                self._wait_total += waited
+                if waited > self._wait_max:
+                    self._wait_max = waited
+            return conn
+
+    def release(self, conn, discard=False):
+        """归还连接；结束未提交的事务，失败则视为坏连接丢弃"""
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if not discard and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+        self._close_quietly(conn)
+
+    def close_all(self):
+        """关闭连接池，释放所有空闲连接"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """连接池统计信息"""
+        with self._cond:
+            return {
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "wait_time_avg_ms": round(self._wait_total * 1000 / self._checkouts, 3) if self._checkouts else 0,
+                "wait_time_max_ms": round(self._wait_max * 1000, 3),
+                "breaker": self.breaker.stats()
+            }
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def init_db_pool():
+    """创建并预热全局连接池"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+    try:
+        _db_pool.warmup()
+    except Exception as e:
+        print(f"连接池预热失败：{str(e)}")
+    return _db_pool
+
+
+# ==================== 读写分离 ====================
+class Replica:
+    """一个只读副本及其最近一次健康检查结果"""
+    __slots__ = ('name', 'pool', 'healthy', 'lag', 'error')
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = False  # 首次检查通过前不接收读请求
+        self.lag = None
+        self.error = None
+
+
+class ReplicaRouter:
+    """只读请求轮询分发到健康副本，写请求与刚写过数据的用户的读请求走主库
+
+    后台任务定期检查每个副本的连通性与复制延迟，连接失败、复制中断或延迟超过max_lag
+    的副本被摘除，恢复后自动加回。写后读粘滞按user_id记录在进程内，多进程部署时
+    仅对落在同一进程的请求生效，其余情况由粘滞窗口不小于最大延迟兜底。
+    """
+
+    def __init__(self, replica_configs, pool_config, max_lag, sticky_window):
+        self.replicas = []
+        for override in replica_configs:
+            config = dict(DB_CONFIG, **override)
+            name = f"{config['host']}:{config.get('port', 3306)}"
+            self.replicas.append(Replica(name, ConnectionPool(config, **pool_config)))
+        self.max_lag = max_lag
+        self.sticky_window = sticky_window
+        self._lock = threading.Lock()
+        self._next = 0
+        self._recent_writers = {}  # user_id -> 粘滞到期时间
+
+        # 统计信息
+        self._replica_reads = 0
+        self._primary_reads = 0
+        self._sticky_reads = 0
+        self._failovers = 0
+
+    def mark_write(self, user_id):
+        """记录用户刚写入，粘滞窗口内其读请求走主库"""
+        with self._lock:
+            self._recent_writers[user_id] = time.monotonic() + self.sticky_window
+
+    def pick(self, user_id=None):
+        """为只读请求选择副本，返回None表示应走主库"""
+        with self._lock:
+            if user_id is not None and self._recent_writers.get(user_id, 0) > time.monotonic():
+                self._sticky_reads += 1
+                return None
+            healthy = [r for r in self.replicas if r.healthy]
+            if not healthy:
+                self._primary_reads += 1
+                return None
+            self._next += 1
+            self._replica_reads += 1
+            return healthy[self._next % len(healthy)]
+
+    def evict(self, replica, error):
+        """借出连接失败时立即摘除副本，等下次健康检查恢复"""
+        with self._lock:
+            replica.healthy = False
+            replica.error = str(error)
+            self._failovers += 1
+
+    def _replication_lag(self, replica):
+        """返回复制延迟秒数；复制未运行时返回None"""
+        conn = replica.pool.acquire()
+        cur = None
+        try:
+            cur = conn.cursor(MySQLdb.cursors.DictCursor)
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except MySQLdb.ProgrammingError:
+                # MySQL 8.0.22之前只有SHOW SLAVE STATUS
+                cur.execute("SHOW SLAVE STATUS")
+            row = cur.fetchone()
+        finally:
+            close_db_resource(conn, cur)
+        if not row:
+            return None
+        lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+        return None if lag is None else int(lag)
+
+    def check(self):
+        """检查所有副本，按连通性与复制延迟摘除或恢复，并清理过期的粘滞记录"""
+        for replica in self.replicas:
+            try:
+                lag = self._replication_lag(replica)
+                if lag is None:
+                    error = "复制未运行"
+                elif lag > self.max_lag:
+                    error = f"复制延迟{lag}秒，超过{self.max_lag}秒"
+                else:
+                    error = None
+            except Exception as e:
+                lag, error = None, str(e)
+            with self._lock:
+                if replica.healthy and error:
+                    print(f"摘除只读副本{replica.name}：{error}")
+                elif not replica.healthy and not error:
+                    print(f"只读副本{replica.name}已恢复")
+                replica.healthy = error is None
+                replica.lag = lag
+                replica.error = error
+
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writers = {uid: until for uid, until in self._recent_writers.items() if until > now}
+
+    def close_all(self):
+        for replica in self.replicas:
+            replica.pool.close_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "replica_reads": self._replica_reads,
+                "primary_reads": self._primary_reads,
+                "sticky_reads": self._sticky_reads,
+                "failovers": self._failovers,
+                "sticky_users": len(self._recent_writers),
+                "replicas": [{
+                    "name": r.name,
+                    "healthy": r.healthy,
+                    "lag_seconds": r.lag,
+                    "error": r.error,
+                    "pool": r.pool.stats()
+                } for r in self.replicas]
+            }
+
+
+_replica_router = None
+
+
+def init_replica_router():
+    """按REPLICA_CONFIGS创建副本连接池并启动健康检查任务，未配置副本时返回None"""
+    global _replica_router
+    if not REPLICA_CONFIGS or _replica_router is not None:
+        return _replica_router
+    _replica_router = ReplicaRouter(REPLICA_CONFIGS, REPLICA_POOL_CONFIG, REPLICA_MAX_LAG, READ_YOUR_WRITES_WINDOW)
+    _replica_router.check()
+    start_background_job('replica-check', REPLICA_CHECK_INTERVAL, _replica_router.check)
+    return _replica_router
+
+
+def mark_user_write(user_id):
+    """用户写入成功后调用，使其随后的读请求在粘滞窗口内走主库"""
+    if _replica_router is not None and user_id is not None:
+        _replica_router.mark_write(int(user_id))
+
+
+# ==================== 监控指标 ====================
+class Histogram:
+    """Prometheus风格的直方图，按标签值分别累计"""
+
+    def __init__(self, name, help_text, labels=(), buckets=METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}  # 标签值 -> [各桶计数..., 超出最大桶的计数, 总和, 次数]
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+            series[i] += 1  # 只计入所在桶，输出时再累加为累计分布
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for label_values, series in sorted(items):
+            base = format_labels(self.labels, label_values)
+            cumulative = 0
+            for upper, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), label_values + (upper,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), label_values + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{base} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{base} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """Prometheus风格的计数器"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', '请求处理耗时', ('route', 'method', 'status'))
+DB_ACQUIRE_LATENCY = Histogram('db_connection_acquire_seconds', 'get_db_connection()借出连接耗时', ('route',))
+DB_QUERY_LATENCY = Histogram('db_query_duration_seconds', 'cur.execute()耗时', ('route',))
+SERIALIZE_LATENCY = Histogram('response_serialize_seconds', 'JSON序列化耗时', ('route',))
+DB_ROWS = Counter('db_rows_returned_total', '查询返回的行数', ('route',))
+SLOW_QUERIES = Counter('db_slow_queries_total', f'耗时超过{SLOW_QUERY_THRESHOLD}秒的查询数', ('route',))
+REJECTED_REQUESTS = Counter('http_requests_rejected_total', '被限流(rate_limit)或过载保护(overload)拒绝的请求数',
+                            ('route', 'reason'))
+METRICS = [REQUEST_LATENCY, DB_ACQUIRE_LATENCY, DB_QUERY_LATENCY, SERIALIZE_LATENCY, DB_ROWS, SLOW_QUERIES,
+           REJECTED_REQUESTS]
+
+# 最近的慢查询记录
+slow_query_log = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+
+def current_route():
+    """当前请求的路由模板（如/api/user_products/<int:user_id>），请求外为后台任务"""
+    if not has_request_context():
+        return 'background'
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def record_query(sql, args, elapsed, rows):
+    """记录一次查询的耗时与行数，超过阈值写入慢查询日志"""
+    if not METRICS_ENABLED:
+        return
+    route = current_route()
+    DB_QUERY_LATENCY.observe(elapsed, route)
+    if rows:
+        DB_ROWS.inc(rows, route)
+    if has_request_context():
+        g.db_query_time = g.get('db_query_time', 0) + elapsed
+    if elapsed >= SLOW_QUERY_THRESHOLD:
+        SLOW_QUERIES.inc(1, route)
+        sql_text = ' '.join(str(sql).split())[:SLOW_QUERY_MAX_SQL]
+        params = repr(args)[:SLOW_QUERY_MAX_SQL] if args is not None else None
+        slow_query_log.append({
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "route": route,
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "sql": sql_text,
+            "params": params
+        })
+        print(f"慢查询 {elapsed * 1000:.1f}ms [{route}]：{sql_text} 参数：{params}")
+
+
+class TimedCursorMixin:
+    """为游标的execute()计时；executemany()内部也经由execute()"""
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        pool = getattr(self.connection, 'owner_pool', None)
+        breaker = pool.breaker if pool is not None else None
+        try:
+            result = super().execute(query, args)
+            if breaker is not None:
+                breaker.record_success()
+            return result
+        except (OperationalError, MySQLdb.InterfaceError) as e:
+            # 只有连接断开/服务端无响应计入熔断；锁冲突、SQL错误等与数据库可用性无关
+            if breaker is not None and is_connection_error(e):
+                breaker.record_failure()
+            raise
+        finally:
+            rowcount = self.rowcount
+            # 无缓冲游标的rowcount无意义（为-1或2^64-1），不计行数
+            rows = rowcount if 0 < rowcount < 2 ** 63 and not isinstance(self, MySQLdb.cursors.SSCursor) else 0
+            record_query(query, args, time.perf_counter() - start, rows)
+
+
+class TimedCursor(TimedCursorMixin, MySQLdb.cursors.Cursor):
+    pass
+
+
+class TimedDictCursor(TimedCursorMixin, MySQLdb.cursors.DictCursor):
+    pass
+
+
+class TimedSSCursor(TimedCursorMixin, MySQLdb.cursors.SSCursor):
+    pass
+
+
+TIMED_CURSORS = {
+    MySQLdb.cursors.Cursor: TimedCursor,
+    MySQLdb.cursors.DictCursor: TimedDictCursor,
+    MySQLdb.cursors.SSCursor: TimedSSCursor
+}
+
+
+class InstrumentedConnection(pymysql.connections.Connection):
+    """cursor()自动换成计时游标的连接，调用方代码无需改动"""
+
+    def cursor(self, cursor=None):
+        cursor = cursor or self.cursorclass
+        return super().cursor(TIMED_CURSORS.get(cursor, cursor))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """记录请求耗时，并通过Server-Timing头给出本次请求的耗时拆分"""
+    start = g.get('request_start')
+    if start is None or not METRICS_ENABLED:
+        return response
+    elapsed = time.perf_counter() - start
+    REQUEST_LATENCY.observe(elapsed, current_route(), request.method, str(response.status_code))
+    response.headers['Server-Timing'] = (
+        f"db-acquire;dur={g.get('db_acquire_time', 0) * 1000:.2f}, "
+        f"db-query;dur={g.get('db_query_time', 0) * 1000:.2f}, "
+        f"serialize;dur={g.get('serialize_time', 0) * 1000:.2f}, "
+        f"total;dur={elapsed * 1000:.2f}"
+    )
+    return response
+
+
+def record_acquire(elapsed):
+    if METRICS_ENABLED:
+        DB_ACQUIRE_LATENCY.observe(elapsed, current_route())
+        if has_request_context():
+            g.db_acquire_time = g.get('db_acquire_time', 0) + elapsed
+
+
+def record_serialize(elapsed):
+    if METRICS_ENABLED:
+        SERIALIZE_LATENCY.observe(elapsed, current_route())
+        if has_request_context():
+            g.serialize_time = g.get('serialize_time', 0) + elapsed
+
+
+def render_metrics():
+    """以Prometheus文本格式输出全部指标"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    if _db_pool is not None:
+        stats = _db_pool.stats()
+        for key in ('size', 'in_use', 'idle'):
+            lines.append(f"# TYPE db_pool_{key} gauge")
+            lines.append(f"db_pool_{key} {stats[key]}")
+        lines.append("# TYPE db_pool_checkout_timeouts_total counter")
+        lines.append(f"db_pool_checkout_timeouts_total {stats['timeouts']}")
+    if _replica_router is not None:
+        replicas = _replica_router.stats()['replicas']
+        lines.append("# TYPE db_replica_healthy gauge")
+        for r in replicas:
+            lines.append(f"db_replica_healthy{format_labels(('replica',), (r['name'],))} {int(r['healthy'])}")
+        lines.append("# TYPE db_replica_lag_seconds gauge")
+        for r in replicas:
+            if r['lag_seconds'] is not None:
+                lines.append(f"db_replica_lag_seconds{format_labels(('replica',), (r['name'],))} {r['lag_seconds']}")
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== JSON序列化 ====================
+def json_default(obj):
+    """序列化json模块/orjson不原生支持的数据库列类型"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (bytes, bytearray)):
+        try:
+            return obj.decode('utf-8')
+        except UnicodeDecodeError:
+            return base64.b64encode(obj).decode('ascii')
+    raise TypeError(f"类型 {type(obj).__name__} 无法序列化为JSON")
+
+
+def _dumps_stdlib(data, pretty=False):
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, default=json_default,
+                          indent=2, separators=(',', ': ')).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, default=json_default,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def _dumps_orjson(data, pretty=False):
+    option = orjson.OPT_NON_STR_KEYS
+    if pretty:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, default=json_default, option=option)
+
+
+# 可用的JSON编码器，均返回UTF-8字节串；datetime统一为ISO 8601格式
+JSON_ENCODERS = {'json': _dumps_stdlib}
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = _dumps_orjson
+
+
+def set_json_encoder(name):
+    """切换JSON编码器：'auto'优先使用已安装的orjson，否则回退到标准库json"""
+    global dumps_json
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in JSON_ENCODERS else 'json'
+    if name not in JSON_ENCODERS:
+        raise ValueError(f"JSON编码器不可用：{name}")
+    dumps_json = JSON_ENCODERS[name]
+    return name
+
+
+dumps_json = _dumps_stdlib
+set_json_encoder(JSON_ENCODER)
+
+
+# ==================== 辅助函数 ====================
+def json_response(data, status_code=200, pretty=None):
+    """自定义JSON响应，确保中文不被转义
+
+    默认输出紧凑格式；请求带 ?pretty=1 时缩进输出，便于调试。
+    """
+    if pretty is None:
+        pretty = has_request_context() and request.args.get('pretty') in ('1', 'true')
+    if has_request_context() and g.get('stale_since') is not None and isinstance(data, dict):
+        data = dict(data, stale=True, stale_age=int(time.time() - g.stale_since))
+    start = time.perf_counter()
+    body = dumps_json(data, pretty)
+    record_serialize(time.perf_counter() - start)
+    response = make_response(body)
+    response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    response.status_code = status_code
+    return response
+
+
+def encode_cursor(publish_time, product_id):
+    """把(publish_time, product_id)编码为不透明的分页游标"""
+    raw = f"{publish_time.strftime('%Y-%m-%d %H:%M:%S')}|{product_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析分页游标，格式非法时返回None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        time_str, product_id = raw.split('|')
+        return datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S'), int(product_id)
+    except Exception:
+        return None
+
+
+def parse_fields(fields_arg):
+    """解析fields=投影参数，返回字段列表；含未知字段时返回None"""
+    if not fields_arg:
+        return list(PRODUCT_LIST_DEFAULT_FIELDS)
+    fields = ['product_id']
+    for name in fields_arg.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in PRODUCT_LIST_FIELDS:
+            return None
+        fields.append(name)
+    return fields
+
+
+def parse_price(value):
+    """解析价格筛选参数，为空或无法解析时返回None（忽略该筛选）
+
+    nan/inf能被float()解析，但无法与价格比较，抛出ValueError由接口返回400。
+    """
+    if not value:
+        return None
+    try:
+        price = Decimal(str(float(value)))
+    except (TypeError, ValueError, ArithmeticError):
+        return None
+    if not price.is_finite():
+        raise ValueError("价格必须为有限数值")
+    return price
+
+
+def is_lock_conflict(e):
+    """是否为可重试的锁冲突（死锁或锁等待超时）"""
+    return isinstance(e, MySQLdb.MySQLError) and bool(e.args) and e.args[0] in LOCK_CONFLICT_ERRORS
+
+
+def is_connection_error(e):
+    """是否为连接层面的失败（连不上、连接断开、连接数已满、查询超时），只有这类错误计入熔断"""
+    if isinstance(e, MySQLdb.InterfaceError):
+        return True  # 在已关闭的连接上执行
+    return isinstance(e, OperationalError) and bool(e.args) and e.args[0] in CONNECTION_ERRORS
+
+
+def _acquire_replica(user_id):
+    """从选中的只读副本借出连接，副本不可用时返回None由调用方回退到主库"""
+    replica = _replica_router.pick(user_id)
+    if replica is None:
+        return None
+    try:
+        return replica.pool.acquire()
+    except PoolTimeout:
+        return None
+    except Exception as e:
+        _replica_router.evict(replica, e)
+        print(f"只读副本{replica.name}连接失败，回退到主库：{str(e)}")
+        return None
+
+
+def get_db_connection(read_only=False, user_id=None):
+    """借出数据库连接
+
+    read_only=True的请求在配置了副本时分发到健康的只读副本；
+    传入user_id时，该用户刚写入过数据则仍走主库，保证读到自己的写入。
+    """
+    start = time.perf_counter()
+    try:
+        conn = _acquire_replica(user_id) if read_only and _replica_router is not None else None
+        if conn is not None:
+            record_acquire(time.perf_counter() - start)
+            return conn
+        pool = _db_pool or init_db_pool()
+        conn = pool.acquire()
+        record_acquire(time.perf_counter() - start)
+        return conn
+    except CircuitOpen:
+        pass
+    except PoolTimeout as e:
+        print(f"获取数据库连接超时：{str(e)}")
+    except OperationalError as e:
+        print(f"数据库连接失败：{str(e)}")
+    except Exception as e:
+        print(f"数据库连接异常：{traceback.format_exc()}")
+    mark_degraded()
+    return None
+
+
+def mark_degraded():
+    """标记当前响应为兜底数据，不参与条件GET缓存"""
+    if has_request_context():
+        g.degraded = True
+
+
+def mark_stale(stored_at):
+    """标记当前响应含有数据库不可用时返回的过期数据，json_response会附加stale标记"""
+    if has_request_context():
+        g.degraded = True
+        g.stale_since = min(g.get('stale_since', stored_at), stored_at)
+
+
+def db_unavailable_response():
+    """数据库不可用且没有过期数据可返回时的503响应"""
+    response = json_response({"code": 503, "success": False, "message": "数据库暂不可用，请稍后重试"}, 503)
+    response.headers['Retry-After'] = str(DB_BREAKER_RESET_TIMEOUT)
+    return response
+
+
+def close_db_resource(conn, cur):
+    """关闭游标并将连接归还连接池"""
+    if cur:
+        try:
+            cur.close()
+        except:
+            pass
+    if conn:
+        conn.owner_pool.release(conn)
+
+
+@app.after_request
+def after_request(response):
+    """添加CORS头部"""
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Allow-Credentials', 'true')
+    return response
+
+
+# ==================== 条件GET ====================
+class ResourceVersions:
+    """按资源维护单调递增的版本号，用于在查询数据库之前判断客户端缓存是否仍然有效
+
+    写接口提交后bump相应资源。版本号只在本进程内递增，ETag中带上进程标识与时间片，
+    重启后旧ETag全部失效；多进程部署时其他进程的写入最晚在VERSION_TTL秒后生效。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+
+    def bump(self, *resources):
+        with self._lock:
+            for resource in resources:
+                self._versions[resource] = self._versions.get(resource, 0) + 1
+
+    def etag(self, resources, variant=b''):
+        """由资源版本号与请求变体（查询参数）生成ETag值"""
+        with self._lock:
+            versions = '.'.join(str(self._versions.get(r, 0)) for r in resources)
+        slot = int(time.time() // VERSION_TTL)
+        return f"{self.epoch}-{slot:x}-{versions}-{zlib.crc32(variant):08x}"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._versions)
+
+
+resource_versions = ResourceVersions()
+
+
+def conditional_get(resources):
+    """GET接口的ETag/304装饰器
+
+    resources为接口依赖的资源名元组，或按当前请求返回该元组的函数。If-None-Match命中时
+    直接返回304，不执行视图函数；数据库不可用时返回的兜底数据不带ETag。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not CONDITIONAL_GET_ENABLED:
+                return view(*args, **kwargs)
+            names = resources() if callable(resources) else resources
+            etag = resource_versions.etag(names, request.query_string)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or g.get('degraded'):
+                    return response
+            response.set_etag(etag, weak=True)
+            if CONDITIONAL_GET_MAX_AGE:
+                response.headers['Cache-Control'] = f"public, max-age={CONDITIONAL_GET_MAX_AGE}"
+            else:
+                response.headers['Cache-Control'] = "public, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
+# ==================== 查询结果缓存 ====================
+_CACHE_MISS = object()
+
+
+class DatabaseUnavailable(Exception):
+    """取不到数据库连接"""
+
+
+class MemoryCacheBackend:
+    """进程内LRU + TTL后端
+
+    标签只记版本号：写入结果时带上查询前各标签的版本，读取时版本已变即视为未命中，
+    这样失效时不用遍历结果，查询进行中发生的失效也不会被随后写入的旧结果覆盖。
+    """
+    name = 'memory'
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (过期时间, 标签版本, 结果)
+        self._tags = {}
+        self._epoch = 0
+
+    def _versions_locked(self, tags):
+        return (self._epoch,) + tuple(self._tags.get(tag, 0) for tag in tags)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return self._versions_locked(tags)
+
+    def get(self, key, tags):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _CACHE_MISS
+            expires, versions, value = entry
+            if expires < time.monotonic() or versions != self._versions_locked(tags):
+                del self._entries[key]
+                return _CACHE_MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, versions, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+            # 按用户的标签只增不减，过多时整体清空并推进epoch，使已有结果与进行中的查询全部作废
+            if len(self._tags) > self.max_entries * 2:
+                self._tags.clear()
+                self._entries.clear()
+                self._epoch += 1
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisCacheBackend:
+    """本机Redis后端：多个工作进程共享结果与标签版本，结果用pickle序列化
+
+    一次MGET同时取结果与其标签的当前版本；标签版本号设置过期时间，
+    过期前引用它的结果早已过期，不会因版本号归零而误命中。
+    """
+    name = 'redis'
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def tag_versions(self, tags):
+        return tuple(self.client.mget([f"qc:tag:{tag}" for tag in tags])) if tags else ()
+
+    def get(self, key, tags):
+        values = self.client.mget([f"qc:{key}"] + [f"qc:tag:{tag}" for tag in tags])
+        if values[0] is None:
+            return _CACHE_MISS
+        versions, value = pickle.loads(values[0])
+        if versions != tuple(values[1:]):
+            return _CACHE_MISS
+        return value
+
+    def set(self, key, versions, value, ttl):
+        self.client.set(f"qc:{key}", pickle.dumps((versions, value), pickle.HIGHEST_PROTOCOL), ex=ttl)
+
+    def invalidate(self, tags):
+        pipe = self.client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(f"qc:tag:{tag}")
+            pipe.expire(f"qc:tag:{tag}", QUERY_CACHE_TAG_TTL)
+        pipe.execute()
+
+    def size(self):
+        return None
+
+
+class _Flight:
+    """一次进行中的查询，同一key的并发未命中等待它的结果"""
+    __slots__ = ('done', 'result', 'error', 'stale_at')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.stale_at = None  # 结果为过期数据时，其写入时间
+
+
+def run_query(sql, args=(), dict_rows=False, read_only=True, user_id=None):
+    """借出连接执行一条只读查询并返回全部行；取不到连接时抛出DatabaseUnavailable"""
+    conn = get_db_connection(read_only=read_only, user_id=user_id)
+    if not conn:
+        raise DatabaseUnavailable("数据库连接失败")
+    cur = None
+    try:
+        cur = conn.cursor(MySQLdb.cursors.DictCursor) if dict_rows else conn.cursor()
+        cur.execute(sql, args)
+        return cur.fetchall()
+    finally:
+        close_db_resource(conn, cur)
+
+
+class QueryCache:
+    """只读查询结果缓存
+
+    - 以(SQL, 参数, 行格式)为key，结果带标签（表名或按用户的"表:user:ID"），写接口提交后按标签失效
+    - 同一key的并发未命中只有一个请求查库（single-flight），其余等待并共享其结果
+    - 后端异常时退化为直接查库，不影响接口可用性
+    - 每个查询保留最近一次成功的结果（不受TTL与失效影响）；数据库不可用或熔断时返回它并标记stale，
+      没有时抛出DatabaseUnavailable
+    返回的行被多个请求共享，调用方不得修改。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stale = OrderedDict()  # key -> (写入时间, 结果)
+        self.stale_served = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.backend_errors = 0
+
+    @staticmethod
+    def make_key(sql, args, dict_rows):
+        text = repr((' '.join(sql.split()), tuple(args), dict_rows))
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _backend_error(self, action):
+        self.backend_errors += 1
+        print(f"查询缓存{action}异常：{traceback.format_exc(limit=1)}")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._stale[key] = (time.time(), value)
+            self._stale.move_to_end(key)
+            while len(self._stale) > QUERY_CACHE_STALE_MAX_ENTRIES:
+                self._stale.popitem(last=False)
+
+    def _last_good(self, key):
+        with self._lock:
+            entry = self._stale.get(key)
+        if entry is None or time.time() - entry[0] > QUERY_CACHE_STALE_MAX_AGE:
+            return None
+        return entry
+
+    def fetchall(self, sql, args=(), tags=(), ttl=QUERY_CACHE_TTL, dict_rows=False, read_only=True, user_id=None):
+        """返回查询的全部行，命中缓存时不访问数据库
+
+        ttl=0表示不缓存新鲜结果，只做并发合并与数据库不可用时的过期数据兜底（用于组合过多、难以失效的查询）。
+        """
+        if not QUERY_CACHE_ENABLED:
+            return run_query(sql, args, dict_rows, read_only, user_id)
+        key = self.make_key(sql, args, dict_rows)
+        value = _CACHE_MISS
+        if ttl > 0:
+            try:
+                value = self.backend.get(key, tags)
+            except Exception:
+                self._backend_error('读取')
+        if value is not _CACHE_MISS:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            if flight.done.wait(QUERY_CACHE_WAIT):
+                if flight.error is not None:
+                    raise flight.error
+                if flight.stale_at is not None:
+                    mark_stale(flight.stale_at)
+                return flight.result
+            return run_query(sql, args, dict_rows, read_only, user_id)
+
+        try:
+            versions = None
+            if ttl > 0:
+                try:
+                    versions = self.backend.tag_versions(tags)
+                except Exception:
+                    self._backend_error('读取标签')
+            flight.result = run_query(sql, args, dict_rows, read_only, user_id)
+            if versions is not None and len(flight.result) <= QUERY_CACHE_MAX_ROWS:
+                try:
+                    self.backend.set(key, versions, flight.result, ttl)
+                except Exception:
+                    self._backend_error('写入')
+            if len(flight.result) <= QUERY_CACHE_MAX_ROWS:
+                self._remember(key, flight.result)
+            return flight.result
+        except (DatabaseUnavailable, OperationalError, MySQLdb.InterfaceError) as e:
+            if not isinstance(e, DatabaseUnavailable) and not is_connection_error(e):
+                # 锁冲突、SQL错误等不是数据库不可用，按普通异常交给接口处理（500），不返回过期数据
+                flight.error = e
+                raise
+            last_good = self._last_good(key)
+            if last_good is None:
+                if isinstance(e, DatabaseUnavailable):
+                    flight.error = e
+                    raise
+                flight.error = DatabaseUnavailable(str(e))
+                raise flight.error from e
+            self.stale_served += 1
+            flight.stale_at, flight.result = last_good
+            mark_stale(flight.stale_at)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, *tags):
+        """使带有这些标签的结果失效（写接口提交后调用）"""
+        if not QUERY_CACHE_ENABLED or not tags:
+            return
+        self.invalidations += 1
+        try:
+            self.backend.invalidate(tags)
+        except Exception:
+            self._backend_error('失效')
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._flights)
+        return {
+            "enabled": QUERY_CACHE_ENABLED,
+            "backend": self.backend.name,
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": in_flight,
+            "invalidations": self.invalidations,
+            "backend_errors": self.backend_errors,
+            "stale_entries": len(self._stale),
+            "stale_served": self.stale_served
+        }
+
+
+def create_query_cache_backend():
+    if QUERY_CACHE_BACKEND == 'redis':
+        if redis is not None:
+            return RedisCacheBackend(QUERY_CACHE_REDIS_URL)
+        print("未安装redis包，查询结果缓存改用进程内后端")
+    return MemoryCacheBackend(QUERY_CACHE_MAX_ENTRIES)
+
+
+query_cache = QueryCache(create_query_cache_backend())
+
+
+# ==================== 限流与过载保护 ====================
+class MemoryRateLimitBackend:
+    """进程内令牌桶，按key记录(剩余令牌数, 上次补充时间)，LRU淘汰"""
+    name = 'memory'
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, keys, cost, rate, burst):
+        """各key的桶都有cost个令牌时一起扣除并返回0，否则不扣除，返回还需等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key in keys:
+                tokens, stamp = self._buckets.get(key, (burst, now))
+                levels.append(min(burst, tokens + (now - stamp) * rate))
+            wait = max([(cost - tokens) / rate for tokens in levels if tokens < cost], default=0)
+            if wait > 0:
+                return wait
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - cost, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0
+
+    def size(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class RedisRateLimitBackend:
+    """本机Redis令牌桶：多个工作进程共享同一份额度，Lua脚本原子地检查并扣除多个桶
+
+    时间戳由调用方传入，各进程在同一台机器上，时钟一致；桶在补满所需的时间后过期。
+    """
+    name = 'redis'
+    SCRIPT = """
+        local now, cost = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local rate, burst = tonumber(ARGV[3]), tonumber(ARGV[4])
+        local levels, wait = {}, 0
+        for i, key in ipairs(KEYS) do
+            local bucket = redis.call('HMGET', key, 'tokens', 'stamp')
+            local tokens = tonumber(bucket[1]) or burst
+            local stamp = tonumber(bucket[2]) or now
+            tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+            levels[i] = tokens
+            if tokens < cost then
+                wait = math.max(wait, (cost - tokens) / rate)
+            end
+        end
+        if wait > 0 then
+            return tostring(wait)
+        end
+        local ttl = math.ceil(burst / rate) + 1
+        for i, key in ipairs(KEYS) do
+            redis.call('HSET', key, 'tokens', levels[i] - cost, 'stamp', now)
+            redis.call('EXPIRE', key, ttl)
+        end
+        return '0'
+    """
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, keys, cost, rate, burst):
+        return float(self._take(keys=[f"rl:{key}" for key in keys], args=[time.time(), cost, rate, burst]))
+
+    def size(self):
+        return None
+
+
+class ConcurrencyLimiter:
+    """非阻塞的并发计数：名额已满时立即拒绝，不排队等待"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"limit": self.limit, "in_flight": self.in_flight, "peak": self.peak, "rejected": self.rejected}
+
+
+# 请求体需要由接口流式读取，不能为取user_id提前解析
+_STREAMED_BODY_ROUTES = {'bulk_publish', 'upload_image'}
+
+
+def client_ip():
+    """返回(客户端IP, 是否取自X-Forwarded-For)
+
+    X-Forwarded-For左侧的条目可由客户端任意伪造，只采用右侧由受信任代理追加的第RATE_LIMIT_PROXY_HOPS项。
+    """
+    if RATE_LIMIT_TRUST_PROXY:
+        hops = [item.strip() for item in request.headers.get('X-Forwarded-For', '').split(',') if item.strip()]
+        if hops:
+            return hops[-min(max(RATE_LIMIT_PROXY_HOPS, 1), len(hops))], True
+    return request.remote_addr or 'unknown', False
+
+
+def request_user_id(endpoint):
+    """发起请求的用户：写请求JSON体中的user_id（下单为buyer_id）
+
+    路径与查询参数中的user_id是被查看的用户而非调用方，按它计桶会让许多客户端共用一个桶，
+    也能被任意客户端用来耗尽他人的额度，因此不采用。
+    """
+    user_id = None
+    if (request.method != 'GET' and request.is_json and endpoint not in _STREAMED_BODY_ROUTES
+            and 0 < (request.content_length or 0) <= RATE_LIMIT_BODY_MAX):
+        # get_json会缓存解析结果，接口中的request.json不会重复解析
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            user_id = data.get('user_id') or data.get('buyer_id')
+    user_id = str(user_id) if user_id is not None else ''
+    return user_id if user_id.isdigit() and len(user_id) <= 20 else None
+
+
+def request_cost(budget):
+    """列表类预算按请求的条数计费，每PRODUCT_PAGE_SIZE条一个令牌；其余每个请求一个令牌"""
+    if budget not in RATE_LIMIT_LIST_BUDGETS:
+        return 1
+    limit = request.args.get('limit', '')
+    limit = min(int(limit), PRODUCT_PAGE_SIZE_MAX) if limit.isdigit() and int(limit) > 0 else PRODUCT_PAGE_SIZE
+    return math.ceil(limit / PRODUCT_PAGE_SIZE)
+
+
+class AdmissionControl:
+    """请求准入：先按接口的预算扣令牌桶（超额返回429），再占用并发名额（已满返回503）
+
+    - 令牌桶按客户端IP与调用方user_id分别计，两者都有余额才放行；昂贵接口使用单独的、更紧的预算
+    - 并发名额分全局与昂贵接口两级，在响应体发送完毕后归还，流式导出在整个下载期间占用名额
+    - 限流后端异常时放行请求，限流失效不影响接口可用性
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.global_limiter = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS)
+        self.route_limiters = {endpoint: ConcurrencyLimiter(limit) for endpoint, limit in ROUTE_CONCURRENCY.items()}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = {}  # 预算名 -> 被限流的请求数
+        self.backend_errors = 0
+
+    def check_rate(self, endpoint):
+        """扣除本次请求的令牌，返回还需等待的秒数，0表示放行"""
+        if not RATE_LIMIT_ENABLED:
+            return 0
+        ip, forwarded = client_ip()
+        # 豁免只看直连地址；带X-Forwarded-For的请求经过了代理（即使未开启RATE_LIMIT_TRUST_PROXY），照常限流
+        if not forwarded and ip in RATE_LIMIT_EXEMPT_IPS and 'X-Forwarded-For' not in request.headers:
+            return 0
+        budget = RATE_LIMIT_ROUTES.get(endpoint, 'default')
+        rate, burst = RATE_LIMIT_BUDGETS[budget]
+        keys = [f"{budget}:ip:{ip}"]
+        user_id = request_user_id(endpoint)
+        if user_id is not None:
+            keys.append(f"{budget}:user:{user_id}")
+        try:
+            wait = self.backend.take(keys, min(request_cost(budget), burst), rate, burst)
+        except Exception:
+            self.backend_errors += 1
+            print(f"限流后端异常：{traceback.format_exc(limit=1)}")
+            return 0
+        with self._lock:
+            if wait > 0:
+                self.limited[budget] = self.limited.get(budget, 0) + 1
+            else:
+                self.allowed += 1
+        return wait
+
+    def acquire_slots(self, endpoint):
+        """占用全局与接口的并发名额，返回占用的限流器列表；任一名额已满时返回None"""
+        limiters = [self.route_limiters[endpoint]] if endpoint in self.route_limiters else []
+        if MAX_CONCURRENT_REQUESTS > 0:
+            limiters.append(self.global_limiter)
+        acquired = []
+        for limiter in limiters:
+            if not limiter.try_acquire():
+                release_slots(acquired)
+                return None
+            acquired.append(limiter)
+        return acquired
+
+    def stats(self):
+        with self._lock:
+            limited = dict(self.limited)
+        return {
+            "rate_limit_enabled": RATE_LIMIT_ENABLED,
+            "backend": self.backend.name,
+            "tracked_keys": self.backend.size(),
+            "budgets": {name: {"rate": rate, "burst": burst} for name, (rate, burst) in RATE_LIMIT_BUDGETS.items()},
+            "allowed": self.allowed,
+            "limited": limited,
+            "backend_errors": self.backend_errors,
+            "concurrency": self.global_limiter.stats(),
+            "route_concurrency": {endpoint: limiter.stats() for endpoint, limiter in self.route_limiters.items()}
+        }
+
+
+def release_slots(limiters):
+    for limiter in limiters:
+        limiter.release()
+
+
+def create_rate_limit_backend():
+    if RATE_LIMIT_BACKEND == 'redis':
+        if redis is not None:
+            return RedisRateLimitBackend(RATE_LIMIT_REDIS_URL)
+        print("未安装redis包，限流改用进程内令牌桶")
+    return MemoryRateLimitBackend(RATE_LIMIT_MAX_KEYS)
+
+
+admission = AdmissionControl(create_rate_limit_backend())
+
+
+def rejection_response(status_code, message, retry_after, reason):
+    REJECTED_REQUESTS.inc(1, current_route(), reason)
+    response = json_response({"code": status_code, "success": False, "message": message}, status_code)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+@app.before_request
+def admit_request():
+    """在进入接口前拒绝超额请求，避免它们占用工作线程与数据库连接"""
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in ADMISSION_EXEMPT_ROUTES or request.method == 'OPTIONS':
+        return None
+    wait = admission.check_rate(endpoint)
+    if wait > 0:
+        return rejection_response(429, "请求过于频繁，请稍后重试", wait, 'rate_limit')
+    slots = admission.acquire_slots(endpoint)
+    if slots is None:
+        return rejection_response(503, "服务繁忙，请稍后重试", ADMISSION_RETRY_AFTER, 'overload')
+    g.admission_slots = slots
+    return None
+
+
+@app.after_request
+def release_admission_slots(response):
+    """并发名额在响应体发送完毕（WSGI服务器关闭响应）时归还"""
+    slots = g.pop('admission_slots', None)
+    if slots:
+        response.call_on_close(functools.partial(release_slots, slots))
+    return response
+
+
+@app.teardown_request
+def release_admission_slots_on_error(exc):
+    # 未生成响应（after_request未执行）时在此归还
+    slots = g.pop('admission_slots', None)
+    if slots:
+        release_slots(slots)
+
+
+# ==================== 实时推送 ====================
+class EventBroker:
+    """进程内发布/订阅，用于SSE推送
+
+    事件只追加到一个环形缓冲区并notify_all，订阅者各自记录读到的事件ID，
+    发布开销与连接数无关，空闲连接只是阻塞在同一个条件变量上，不占用额外的队列内存。
+    落后超过缓冲区长度的订阅者收到reset事件，由客户端重新拉取全量数据。
+    事件ID从进程启动时的毫秒时间戳开始递增，重启前的Last-Event-ID一定早于缓冲区，同样触发reset。
+    """
+
+    def __init__(self, buffer_size=1000):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=buffer_size)  # (事件ID, 事件类型, 编码后的SSE消息)
+        self._next_id = int(time.time() * 1000)
+        self._subscribers = 0
+        self._closed = False
+        self.published = 0
+
+    def publish(self, event_type, data):
+        payload = dumps_json(data)
+        with self._cond:
+            event_id = self._next_id
+            self._next_id += 1
+            message = f"id: {event_id}\nevent: {event_type}\ndata: ".encode('utf-8') + payload + b"\n\n"
+            self._events.append((event_id, event_type, message))
+            self.published += 1
+            self._cond.notify_all()
+
+    def subscribe(self, last_event_id=None, max_subscribers=None):
+        """登记订阅者，返回起始位置；超过max_subscribers时返回None
+
+        last_event_id为客户端重连时带回的ID，从其后补发；无效或缺省时只接收之后的新事件。
+        """
+        with self._cond:
+            if self._closed or (max_subscribers is not None and self._subscribers >= max_subscribers):
+                return None
+            self._subscribers += 1
+            newest = self._next_id - 1
+            if last_event_id is None or last_event_id > newest:
+                return newest
+            return last_event_id
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def read(self, last_id, timeout):
+        """等待last_id之后的事件，返回(新的last_id, [(事件类型, 消息)])
+
+        超时返回空列表；订阅者落后太多时返回[('reset', ...)]；broker关闭时返回None。
+        """
+        with self._cond:
+            if not self._closed and (not self._events or self._events[-1][0] <= last_id):
+                self._cond.wait(timeout)
+            if self._closed:
+                return None
+            if not self._events or self._events[-1][0] <= last_id:
+                return last_id, []
+            first = self._events[0][0]
+            newest = self._events[-1][0]
+            if last_id < first - 1:
+                message = f"id: {newest}\nevent: reset\ndata: {{}}\n\n".encode('utf-8')
+                return newest, [('reset', message)]
+            events = [(event_type, message)
+                      for _, event_type, message in islice(self._events, last_id - first + 1, None)]
+            return newest, events
+
+    def close(self):
+        """关闭broker，结束所有推送连接"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "subscribers": self._subscribers,
+                "published": self.published,
+                "buffered": len(self._events),
+                "last_event_id": self._next_id - 1
+            }
+
+
+event_broker = EventBroker(SSE_BUFFER_SIZE)
+_category_names = {}
+
+
+def category_name(cur, category_id):
+    """类别名称，进程内缓存（类别表极少变化）"""
+    name = _category_names.get(category_id)
+    if name is None:
+        cur.execute("SELECT category_id, category_name FROM category")
+        _category_names.update(cur.fetchall())
+        name = _category_names.get(category_id, "其他")
+    return name
+
+
+def publish_stats_delta(cur, category_deltas, bucket_deltas):
+    """推送类别与价格区间在售数的变化，需在事务提交后调用
+
+    以图表上显示的类别名/区间名为键，chart.html可以直接在现有数据上增减。
+    """
+    labels = {bucket_id: label for bucket_id, _, label in PRICE_BUCKETS}
+    event_broker.publish('stats_delta', {
+        "categories": {category_name(cur, cid): delta for cid, delta in category_deltas.items() if delta},
+        "price_ranges": {labels[bid]: delta for bid, delta in bucket_deltas.items() if delta}
+    })
+
+
+# ==================== 后台任务 ====================
+_background_jobs = []
+
+
+def start_background_job(name, interval, func, wake=None):
+    """启动周期性后台任务（守护线程），每interval秒执行一次func
+
+    传入wake事件时，其他线程set()该事件可让任务提前执行。
+    """
+    stop = threading.Event()
+    wake = wake or stop
+
+    def run():
+        while True:
+            wake.wait(interval)
+            if stop.is_set():
+                return
+            wake.clear()
+            try:
+                func()
+            except Exception:
+                print(f"后台任务{name}异常：{traceback.format_exc()}")
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    _background_jobs.append((name, stop, wake, thread))
+    return stop
+
+
+def stop_background_jobs(timeout=5):
+    """通知所有后台任务停止并等待其退出"""
+    for _, stop, wake, _ in _background_jobs:
+        stop.set()
+        wake.set()
+    for _, _, _, thread in _background_jobs:
+        thread.join(timeout)
+    _background_jobs.clear()
+
+
+# ==================== 统计汇总表 ====================
+def price_bucket(price):
+    """返回价格所属的价格区间ID"""
+    for bucket_id, upper, _ in PRICE_BUCKETS:
+        if upper is None or price <= upper:
+            return bucket_id
+
+
+def price_bucket_case(column):
+    """生成把价格列映射为价格区间ID的CASE表达式"""
+    whens = ' '.join(f"WHEN {column} <= {upper} THEN {bucket_id}"
+                     for bucket_id, upper, _ in PRICE_BUCKETS if upper is not None)
+    return f"CASE {whens} ELSE {PRICE_BUCKETS[-1][0]} END"
+
+
+def update_product_stats(cur, category_id, price, delta):
+    """在调用方事务内增减在售商品的类别/价格区间计数（发布+1，售出-1）"""
+    apply_product_stats(cur, {category_id: delta}, {price_bucket(price): delta})
+
+
+def apply_product_stats(cur, category_deltas, bucket_deltas):
+    """在调用方事务内按{类别: 增量}、{价格区间: 增量}批量调整计数
+
+    两张表总是按 category_stats -> price_bucket_stats、表内按主键升序加锁，
+    与全量重算及其他写入一致，避免死锁。
+    """
+    cur.executemany("""
+        INSERT INTO category_stats (category_id, on_sale_count) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE on_sale_count = on_sale_count + VALUES(on_sale_count)
+    """, sorted((int(k), v) for k, v in category_deltas.items()))
+    cur.executemany("""
+        INSERT INTO price_bucket_stats (bucket_id, on_sale_count) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE on_sale_count = on_sale_count + VALUES(on_sale_count)
+    """, sorted(bucket_deltas.items()))
+
+
+def recompute_product_stats():
+    """从product表全量重算统计汇总表，修正增量维护产生的偏差
+
+    先锁住汇总行再做一致性读，这样快照包含锁前已提交的全部发布/下单，
+    而被锁阻塞的事务会在重算提交后再各自增减，结果不会重复或遗漏。
+    """
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT category_id FROM category_stats FOR UPDATE")
+        cur.execute("SELECT bucket_id FROM price_bucket_stats FOR UPDATE")
+
+        cur.execute("""
+            SELECT c.category_id, COUNT(p.product_id)
+            FROM category c
+            LEFT JOIN product p ON c.category_id = p.category_id AND p.status = 1
+            GROUP BY c.category_id
+        """)
+        category_counts = cur.fetchall()
+
+        cur.execute(f"""
+            SELECT {price_bucket_case('price')} AS bucket_id, COUNT(*)
+            FROM product
+            WHERE status = 1
+            GROUP BY bucket_id
+        """)
+        bucket_counts = dict(cur.fetchall())
+
+        cur.executemany("""
+            INSERT INTO category_stats (category_id, on_sale_count) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE on_sale_count = VALUES(on_sale_count)
+        """, category_counts)
+        cur.executemany("""
+            INSERT INTO price_bucket_stats (bucket_id, on_sale_count) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE on_sale_count = VALUES(on_sale_count)
+        """, [(bucket_id, bucket_counts.get(bucket_id, 0)) for bucket_id, _, _ in PRICE_BUCKETS])
+        conn.commit()
+        query_cache.invalidate('category_stats', 'price_bucket_stats')
+        return True
+    except Exception:
+        conn.rollback()
+        print(f"重算统计汇总表异常：{traceback.format_exc()}")
+        return False
+    finally:
+        close_db_resource(conn, cur)
+
+
+def init_product_stats():
+    """启动时全量重算一次统计汇总表，并启动定期纠偏任务"""
+    recompute_product_stats()
+    start_background_job('stats-recompute', STATS_RECOMPUTE_INTERVAL, recompute_product_stats)
+
+
+# ==================== 趋势汇总表 ====================
+# 指标名 -> daily_stats中的(笔数列, 金额列)
+TREND_METRICS = {
+    'publish': ('publish_count', 'publish_amount'),
+    'order': ('order_count', 'order_amount'),
+    'completed': ('completed_count', 'completed_amount')
+}
+# 时间粒度 -> 把stat_date映射为所在桶起始日的SQL表达式
+TREND_BUCKET_SQL = {
+    'day': "stat_date",
+    'week': "stat_date - INTERVAL WEEKDAY(stat_date) DAY",
+    'month': "stat_date - INTERVAL (DAYOFMONTH(stat_date) - 1) DAY"
+}
+
+
+def trend_bucket_start(day, granularity):
+    """返回日期所在桶的起始日（周从周一开始）"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def shift_trend_bucket(start, granularity, n):
+    """把桶起始日前后移动n个桶"""
+    if granularity == 'week':
+        return start + timedelta(weeks=n)
+    if granularity == 'month':
+        year, month = divmod(start.year * 12 + start.month - 1 + n, 12)
+        return date(year, month + 1, 1)
+    return start + timedelta(days=n)
+
+
+def apply_trend_stats(cur, metric, deltas):
+    """在调用方事务内按{类别: (笔数, 金额)}累加当天的趋势汇总行
+
+    日期取数据库的CURDATE()，与写入的publish_time/order_time = NOW()同一时区。
+    在category_stats/price_bucket_stats之后调用，保持各汇总表的加锁顺序一致。
+    """
+    count_col, amount_col = TREND_METRICS[metric]
+    cur.executemany(f"""
+        INSERT INTO daily_stats (stat_date, category_id, {count_col}, {amount_col})
+        VALUES (CURDATE(), %s, %s, %s)
+        ON DUPLICATE KEY UPDATE {count_col} = {count_col} + VALUES({count_col}),
+                                {amount_col} = {amount_col} + VALUES({amount_col})
+    """, sorted((int(k), count, amount) for k, (count, amount) in deltas.items()))
+
+
+def recompute_trend_stats(days=None):
+    """从product/orders表重算最近days天（含今天）的趋势汇总行；days为None或汇总表为空时回填全部历史
+
+    订单按下单日统计（不含已取消），完成订单按完成日统计。与统计汇总表的全量纠偏相同，
+    先锁住范围内的汇总行再做一致性读，被阻塞的发布/下单在重算提交后再各自累加。
+    """
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        since = None
+        if days is not None:
+            cur.execute("SELECT EXISTS(SELECT 1 FROM daily_stats)")
+            if cur.fetchone()[0]:
+                cur.execute("SELECT CURDATE() - INTERVAL %s DAY", (days - 1,))
+                since = cur.fetchone()[0]
+        args = (since,) if since else ()
+        cur.execute(f"SELECT stat_date FROM daily_stats {'WHERE stat_date >= %s' if since else ''} FOR UPDATE",
+                    args)
+
+        queries = {
+            'publish': f"""
+                SELECT DATE(publish_time), category_id, COUNT(*), SUM(price)
+                FROM product
+                {'WHERE publish_time >= %s' if since else ''}
+                GROUP BY 1, 2
+            """,
+            'order': f"""
+                SELECT DATE(o.order_time), p.category_id, COUNT(*), SUM(o.price)
+                FROM orders o JOIN product p ON o.product_id = p.product_id
+                WHERE o.status <> 5 {'AND o.order_time >= %s' if since else ''}
+                GROUP BY 1, 2
+            """,
+            'completed': f"""
+                SELECT DATE(o.complete_time), p.category_id, COUNT(*), SUM(o.price)
+                FROM orders o JOIN product p ON o.product_id = p.product_id
+                WHERE o.status = 4 AND o.complete_time {'>= %s' if since else 'IS NOT NULL'}
+                GROUP BY 1, 2
+            """
+        }
+        rows = {}
+        for i, metric in enumerate(TREND_METRICS):
+            cur.execute(queries[metric], args)
+            for stat_date, category_id, count, amount in cur.fetchall():
+                row = rows.setdefault((stat_date, category_id), [0, 0] * len(TREND_METRICS))
+                row[2 * i] = count
+                row[2 * i + 1] = amount
+
+        columns = [col for cols in TREND_METRICS.values() for col in cols]
+        cur.execute(f"DELETE FROM daily_stats {'WHERE stat_date >= %s' if since else ''}", args)
+        cur.executemany(f"""
+            INSERT INTO daily_stats (stat_date, category_id, {', '.join(columns)})
+            VALUES (%s, %s, {', '.join(['%s'] * len(columns))})
+        """, [(*key, *values) for key, values in sorted(rows.items())])
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        print(f"重算趋势汇总表异常：{traceback.format_exc()}")
+        return False
+    finally:
+        close_db_resource(conn, cur)
+
+
+def init_trend_stats():
+    """启动时纠偏最近几天（首次启动时回填全部历史），并启动定期纠偏任务"""
+    recompute_trend_stats(TRENDS_RECONCILE_DAYS)
+    start_background_job('trends-reconcile', TRENDS_RECONCILE_INTERVAL,
+                         lambda: recompute_trend_stats(TRENDS_RECONCILE_DAYS))
+
+
+# ==================== 数据导出 ====================
+def parse_since(value):
+    """解析增量导出起点，支持 2024-09-01 / 2024-09-01 08:00:00 / ISO 8601，非法时返回None"""
+    try:
+        return datetime.fromisoformat(value.strip())
+    except (ValueError, AttributeError):
+        return None
+
+
+def iter_export_rows(cur, table, since=None):
+    """用无缓冲游标按主键顺序分块读取，逐行产出，内存占用与表大小无关"""
+    spec = EXPORT_TABLES[table]
+    sql = f"SELECT {', '.join(spec['columns'])} FROM {table}"
+    params = []
+    if since:
+        sql += f" WHERE {spec['time_column']} >= %s"
+        params.append(since)
+    sql += f" ORDER BY {spec['columns'][0]}"
+
+    # 客户端下载较慢时服务端写超时会断开无缓冲查询，导出期间放宽
+    cur.execute("SET SESSION net_write_timeout = 600")
+    cur.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            return
+        yield from rows
+
+
+def encode_csv(columns, rows):
+    """把行编码为CSV，每EXPORT_CHUNK_ROWS行产出一块字节"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= EXPORT_CHUNK_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(columns, rows):
+    """把行编码为NDJSON（每行一个JSON对象），分块产出字节"""
+    chunk = []
+    for row in rows:
+        chunk.append(dumps_json(dict(zip(columns, row))))
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            chunk.append(b'')
+            yield b'\n'.join(chunk)
+            chunk = []
+    if chunk:
+        chunk.append(b'')
+        yield b'\n'.join(chunk)
+
+
+EXPORT_ENCODERS = {
+    'csv': (encode_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (encode_ndjson, 'application/x-ndjson; charset=utf-8')
+}
+
+
+def gzip_chunks(chunks):
+    """流式gzip压缩"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(conn, table, fmt='csv', since=None, compress=False):
+    """导出生成器：无缓冲读取 -> 编码 -> （可选）压缩，接管conn的归还
+
+    正常结束时归还连接；下载中途中断时结果集未读完，连接无法复用，直接丢弃。
+    调用方应先取出第一块数据再开始响应，以便查询错误能在发送响应头之前暴露。
+    """
+    cur = None
+    finished = False
+    try:
+        cur = conn.cursor(MySQLdb.cursors.SSCursor)
+        encode, _ = EXPORT_ENCODERS[fmt]
+        chunks = encode(EXPORT_TABLES[table]['columns'], iter_export_rows(cur, table, since))
+        if compress:
+            chunks = gzip_chunks(chunks)
+        yield from chunks
+        finished = True
+    finally:
+        if finished:
+            try:
+                # 恢复iter_export_rows放宽的写超时，连接归还后会被其他请求复用
+                cur.execute("SET SESSION net_write_timeout = DEFAULT")
+            except Exception:
+                finished = False
+        if finished:
+            close_db_resource(conn, cur)
+        else:
+            conn.owner_pool.release(conn, discard=True)
+
+
+# ==================== 收藏状态缓存 ====================
+class FavoriteSetCache:
+    """按用户缓存已收藏商品ID集合（LRU + TTL），toggle_favorite提交后失效
+
+    加载与失效可能并发：加载前取版本号，写入时版本已变则丢弃结果，避免旧集合覆盖失效。
+    """
+
+    def __init__(self, max_users=10000, ttl=300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (收藏集合, 过期时间)
+        self._versions = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def begin_load(self, user_id):
+        """开始从数据库加载前调用，返回写入时需要校验的版本"""
+        with self._lock:
+            return self._epoch, self._versions.get(user_id, 0)
+
+    def put(self, user_id, product_ids, token):
+        with self._lock:
+            if token != (self._epoch, self._versions.get(user_id, 0)):
+                return
+            self._entries[user_id] = (product_ids, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            # 版本表只增不减，过大时整体清空并推进epoch，使进行中的加载全部作废
+            if len(self._versions) > self.max_users * 2:
+                self._versions.clear()
+                self._entries.clear()
+                self._epoch += 1
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+favorite_cache = FavoriteSetCache(FAVORITE_CACHE_MAX_USERS, FAVORITE_CACHE_TTL)
+
+
+def load_favorite_set(cur, user_id):
+    """一次查询取出用户全部收藏并写入缓存；收藏数超过FAVORITE_CACHE_MAX_ITEMS时不缓存，返回None"""
+    token = favorite_cache.begin_load(user_id)
+    cur.execute("SELECT product_id FROM favorites WHERE user_id=%s LIMIT %s",
+                (user_id, FAVORITE_CACHE_MAX_ITEMS + 1))
+    product_ids = [row[0] for row in cur.fetchall()]
+    if len(product_ids) > FAVORITE_CACHE_MAX_ITEMS:
+        return None
+    favorited = frozenset(product_ids)
+    favorite_cache.put(user_id, favorited, token)
+    return favorited
+
+
+def reconcile_favorite_counts():
+    """按product_id分段把product.favorite_count修正为favorites表中的实际行数，返回修正的商品数
+
+    先用一致性读找出计数不符的商品，再在短事务内用子查询重新计数并写回；写回时锁住商品行，
+    与toggle_favorite同样先锁product再读favorites，不会覆盖并发的收藏操作。
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cur = None
+    fixed = 0
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT COALESCE(MAX(product_id), 0) FROM product")
+        max_id = cur.fetchone()[0]
+        conn.commit()
+        for start in range(0, max_id, FAVORITE_RECONCILE_CHUNK):
+            cur.execute("""
+                SELECT p.product_id
+                FROM product p
+                LEFT JOIN (
+                    SELECT product_id, COUNT(*) AS cnt FROM favorites
+                    WHERE product_id > %s AND product_id <= %s
+                    GROUP BY product_id
+                ) f ON p.product_id = f.product_id
+                WHERE p.product_id > %s AND p.product_id <= %s
+                  AND p.favorite_count <> COALESCE(f.cnt, 0)
+            """, (start, start + FAVORITE_RECONCILE_CHUNK) * 2)
+            drifted = [row[0] for row in cur.fetchall()]
+            if drifted:
+                cur.execute(f"""
+                    UPDATE product p
+                    SET p.favorite_count = (SELECT COUNT(*) FROM favorites f WHERE f.product_id = p.product_id)
+                    WHERE p.product_id IN ({', '.join(['%s'] * len(drifted))})
+                """, drifted)
+                fixed += cur.rowcount
+            conn.commit()
+        if fixed:
+            resource_versions.bump('favorites')
+            print(f"收藏数对账：修正了{fixed}件商品")
+        return fixed
+    except Exception:
+        conn.rollback()
+        print(f"收藏数对账异常：{traceback.format_exc()}")
+        return None
+    finally:
+        close_db_resource(conn, cur)
+
+
+def init_favorite_counts():
+    """启动收藏数对账任务；首次对账立即在后台执行（兼容刚加上favorite_count列的旧库）"""
+    wake = threading.Event()
+    wake.set()
+    start_background_job('favorite-reconcile', FAVORITE_RECONCILE_INTERVAL, reconcile_favorite_counts, wake)
+
+
+# ==================== 批量导入 ====================
+def validate_product(data):
+    """校验发布商品的字段，单条发布与批量导入共用
+
+    返回 (插入参数元组, None)，校验失败时返回 (None, 错误信息)。
+    """
+    product_name = str(data.get('product_name') or '').strip()
+    price = data.get('price')
+    category_id = data.get('category_id')
+    user_id = data.get('user_id')
+    description = data.get('description') or ''
+
+    if not product_name:
+        return None, "商品名称不能为空"
+    try:
+        price = Decimal(str(price)) if price not in (None, '') else None
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite() or price <= 0:
+        return None, "价格必须大于0"
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        category_id = None
+    if not category_id:
+        return None, "请选择商品类别"
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        user_id = None
+    if not user_id:
+        return None, "用户信息错误"
+    return (product_name, price, description, category_id, user_id), None
+
+
+def iter_json_array(stream, chunk_size=65536):
+    """增量解析顶层JSON数组，逐个产出元素，不把整个请求体读入内存"""
+    decoder = json.JSONDecoder()
+    reader = io.TextIOWrapper(stream, encoding='utf-8')
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("请求体不是JSON数组")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise
+                if len(buffer) - pos > IMPORT_MAX_ELEMENT_CHARS:
+                    raise ValueError(f"单个元素超过{IMPORT_MAX_ELEMENT_CHARS}字符") from e
+                # 截断只会使出错位置落在缓冲区末尾附近（被截断的true/null、转义序列），或是字符串未结束；
+                # 否则元素本身非法，继续读取也无济于事
+                if not e.msg.startswith('Unterminated string') and len(buffer) - e.pos > 8:
+                    raise
+                break  # 元素不完整，继续读取
+            if end == len(buffer) and not eof:
+                break  # 数字等元素可能被截断，读到更多数据后再解析
+            pos = end
+            yield item
+        buffer = buffer[pos:]
+        if eof:
+            raise ValueError("JSON数组不完整")
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+
+def iter_ndjson(stream):
+    """逐行解析NDJSON，空行跳过；单行JSON非法时产出None，由调用方记为该行错误"""
+    for line in io.TextIOWrapper(stream, encoding='utf-8'):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def iter_csv(stream):
+    """逐行解析带表头的CSV"""
+    yield from csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+
+IMPORT_PARSERS = {
+    'json': iter_json_array,
+    'ndjson': iter_ndjson,
+    'csv': iter_csv
+}
+
+
+def _insert_product_batch(conn, cur, batch, result):
+    """插入一批已校验的商品并提交；整批失败时逐行重试以定位坏行"""
+    sql = """
+        INSERT INTO product (product_name, price, description, category_id, user_id,
+                             status, publish_time, view_count)
+        VALUES (%s, %s, %s, %s, %s, 1, NOW(), 0)
+    """
+
+    def apply_stats(rows):
+        category_deltas = {}
+        bucket_deltas = {}
+        trend_deltas = {}
+        for _, (_, price, _, category_id, _) in rows:
+            category_deltas[category_id] = category_deltas.get(category_id, 0) + 1
+            bucket = price_bucket(price)
+            bucket_deltas[bucket] = bucket_deltas.get(bucket, 0) + 1
+            count, amount = trend_deltas.get(category_id, (0, 0))
+            trend_deltas[category_id] = (count + 1, amount + price)
+        apply_product_stats(cur, category_deltas, bucket_deltas)
+        apply_trend_stats(cur, 'publish', trend_deltas)
+        return category_deltas, bucket_deltas
+
+    def committed(rows, deltas):
+        # 提交之后的记账不能再抛回重试逻辑，否则已写入的商品会被逐行重复插入
+        result['inserted'] += len(rows)
+        try:
+            publish_stats_delta(cur, *deltas)
+        except Exception:
+            print(f"推送统计变化异常：{traceback.format_exc()}")
+
+    try:
+        cur.executemany(sql, [params for _, params in batch])
+        deltas = apply_stats(batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+    else:
+        committed(batch, deltas)
+        return
+
+    inserted = []
+    for row_no, params in batch:
+        try:
+            cur.execute(sql, params)
+            inserted.append((row_no, params))
+        except Exception as e:
+            result['failed'] += 1
+            add_import_error(result, row_no, f"写入失败: {str(e)}")
+    if not inserted:
+        conn.rollback()
+        return
+    try:
+        deltas = apply_stats(inserted)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        result['failed'] += len(inserted)
+        for row_no, _ in inserted:
+            add_import_error(result, row_no, f"写入失败: {str(e)}")
+        return
+    committed(inserted, deltas)
+
+
+def add_import_error(result, row_no, message):
+    if len(result['errors']) < IMPORT_MAX_ERRORS:
+        result['errors'].append({"row": row_no, "message": message})
+
+
+def bulk_publish_products(conn, records, batch_size=IMPORT_BATCH_SIZE):
+    """批量发布商品：逐条校验，按batch_size分批executemany，每批提交一次
+
+    records为可迭代的商品字典（可以是流式解析器），单行校验或写入失败只记录错误，不中断整体导入。
+    解析错误无法恢复后续位置，记录后终止。返回统计结果与逐行错误（最多IMPORT_MAX_ERRORS条）。
+    """
+    result = {"total": 0, "inserted": 0, "failed": 0, "errors": []}
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MAX(product_id), 0) FROM product")
+    max_id_before = cur.fetchone()[0]
+    conn.commit()
+
+    batch = []
+    sellers = set()
+    row_no = 0
+    try:
+        for row_no, data in enumerate(records, 1):
+            result['total'] += 1
+            params, error = validate_product(data) if isinstance(data, dict) else (None, "行格式错误")
+            if error:
+                result['failed'] += 1
+                add_import_error(result, row_no, error)
+                continue
+            batch.append((row_no, params))
+            sellers.add(params[4])
+            if len(batch) >= batch_size:
+                _insert_product_batch(conn, cur, batch, result)
+                batch = []
+    except (ValueError, csv.Error) as e:
+        result['failed'] += 1
+        add_import_error(result, row_no + 1, f"解析失败: {str(e)}")
+    if batch:
+        _insert_product_batch(conn, cur, batch, result)
+
+    if result['inserted']:
+        resource_versions.bump('products')
+        query_cache.invalidate('category_stats', 'price_bucket_stats',
+                               *(f"product:user:{user_id}" for user_id in sorted(sellers)))
+        event_broker.publish('products_imported', {"count": result['inserted']})
+    # 命令行导入时本进程的索引没有加载，不必刷新；运行中的服务要等下次对账才看到这些商品
+    if CATALOG_INDEX_ENABLED and catalog_index.ready and result['inserted']:
+        try:
+            catalog_index.refresh_since(cur, max_id_before)
+        except Exception:
+            print(f"更新商品目录索引异常：{traceback.format_exc()}")
+    cur.close()
+    return result
+
+
+# ==================== 商品图片 ====================
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', '.jpg', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', '.png', 'image/png'),
+    (b'GIF87a', '.gif', 'image/gif'),
+    (b'GIF89a', '.gif', 'image/gif'),
+]
+IMAGE_MIMETYPES = {'.jpg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif', '.webp': 'image/webp'}
+IMAGE_NAME = re.compile(r'([0-9a-f]{64})(\.(?:jpg|png|gif|webp))')
+
+
+def sniff_image_type(head):
+    """按文件头识别图片格式，返回扩展名，不认识时返回None（不信任客户端的Content-Type）"""
+    for signature, ext, _ in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+def image_path(kind, digest, ext):
+    """kind为'original'或缩略图名；按哈希前两位分目录，避免单个目录文件过多"""
+    return os.path.join(IMAGE_STORE_ROOT, kind, digest[:2], digest + ext)
+
+
+def image_urls(digest, ext):
+    """图片的原图与各尺寸缩略图URL，缩略图统一为JPEG"""
+    return {
+        "id": digest + ext,
+        "url": f"/media/original/{digest[:2]}/{digest}{ext}",
+        "thumbs": {size: f"/media/{size}/{digest[:2]}/{digest}.jpg" for size in IMAGE_THUMB_SIZES}
+    }
+
+
+def render_thumbnails(original, targets):
+    """在进程池中生成缩略图：targets为[(最长边像素, 输出路径)]"""
+    with Image.open(original) as im:
+        # JPEG按最大目标尺寸降采样解码，大图省去大部分解码开销
+        largest = max(size for size, _ in targets)
+        im.draft('RGB', (largest, largest))
+        im = ImageOps.exif_transpose(im)
+        if im.mode in ('RGBA', 'LA', 'P'):
+            im = im.convert('RGBA')
+            background = Image.new('RGB', im.size, (255, 255, 255))
+            background.paste(im, mask=im.getchannel('A'))
+            im = background
+        elif im.mode != 'RGB':
+            im = im.convert('RGB')
+        # 从大到小逐级缩放，小图以上一级结果为输入
+        for size, path in sorted(targets, reverse=True):
+            im.thumbnail((size, size), Image.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            im.save(tmp, 'JPEG', quality=IMAGE_THUMB_QUALITY, optimize=True, progressive=True)
+            os.replace(tmp, path)
+    return len(targets)
+
+
+class ThumbnailPipeline:
+    """把缩略图任务提交到进程池，同一张图片只排队一次"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = {}  # digest -> Future
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, digest, ext):
+        """为缺少的缩略图排队，返回Future；无需生成或未安装Pillow时返回None"""
+        if Image is None:
+            return None
+        targets = [(px, image_path(size, digest, '.jpg')) for size, px in IMAGE_THUMB_SIZES.items()]
+        targets = [(px, path) for px, path in targets if not os.path.exists(path)]
+        if not targets:
+            return None
+        with self._lock:
+            future = self._jobs.get(digest)
+            if future is not None:
+                return future
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            future = self._executor.submit(render_thumbnails, image_path('original', digest, ext), targets)
+            self._jobs[digest] = future
+        future.add_done_callback(lambda f: self._done(digest, f))
+        return future
+
+    def _done(self, digest, future):
+        with self._lock:
+            self._jobs.pop(digest, None)
+            if future.exception() is None:
+                self.completed += 1
+                return
+            self.failed += 1
+        print(f"生成缩略图失败 {digest}：{future.exception()}")
+
+    def wait(self, digest, timeout):
+        """等待正在生成的缩略图，返回是否已完成"""
+        with self._lock:
+            future = self._jobs.get(digest)
+        if future is None:
+            return True
+        try:
+            future.result(timeout)
+            return True
+        except FutureTimeout:
+            return False
+        except Exception:
+            return False
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._jobs),
+                "completed": self.completed,
+                "failed": self.failed,
+                "pillow_available": Image is not None
+            }
+
+
+thumbnail_pipeline = ThumbnailPipeline(IMAGE_WORKERS)
+atexit.register(thumbnail_pipeline.shutdown)
+
+
+def store_image(stream):
+    """把上传的图片流式写入内容寻址存储，返回(图片信息, 错误信息)
+
+    边读边计算SHA-256并写入临时文件，内存占用与图片大小无关；相同内容只保存一份。
+    """
+    tmp_dir = os.path.join(IMAGE_STORE_ROOT, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    digest = hashlib.sha256()
+    size = 0
+    ext = None
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(IMAGE_UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                if ext is None:
+                    ext = sniff_image_type(chunk)
+                    if ext is None:
+                        return None, "只支持JPEG、PNG、GIF、WebP格式的图片"
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    return None, f"图片不能超过{IMAGE_MAX_BYTES // (1024 * 1024)}MB"
+                digest.update(chunk)
+                f.write(chunk)
+        if size == 0:
+            return None, "图片内容为空"
+
+        digest = digest.hexdigest()
+        final_path = image_path('original', digest, ext)
+        if os.path.exists(final_path):
+            deduplicated = True
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            deduplicated = False
+        image = image_urls(digest, ext)
+        image.update({"size": size, "deduplicated": deduplicated})
+        return image, None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def parse_product_images(value):
+    """校验发布商品时的images参数，返回(写入images列的JSON文本或None, 错误信息)
+
+    接受上传接口返回的图片id或URL，只允许引用已上传的图片，URL由服务端重新生成。
+    """
+    if value in (None, '', []):
+        return None, None
+    if not isinstance(value, list):
+        return None, "images必须是数组"
+    if len(value) > IMAGE_MAX_PER_PRODUCT:
+        return None, f"最多上传{IMAGE_MAX_PER_PRODUCT}张图片"
+    images = []
+    for item in value:
+        match = IMAGE_NAME.search(item) if isinstance(item, str) else None
+        if not match or not os.path.exists(image_path('original', *match.groups())):
+            return None, "图片不存在，请重新上传"
+        urls = image_urls(*match.groups())
+        del urls['id']
+        images.append(urls)
+    return json.dumps(images, ensure_ascii=False, separators=(',', ':')), None
+
+
+# ==================== 浏览量计数 ====================
+class ViewCounter:
+    """product.view_count 的写后缓冲计数器
+
+    浏览只在内存中累加；后台任务每VIEW_FLUSH_INTERVAL秒（或累计VIEW_FLUSH_THRESHOLD次浏览时提前）
+    把增量合并成批量多行UPDATE写回，避免热门商品行上的同步UPDATE互相排队。
+    """
+
+    def __init__(self, flush_threshold=1000, max_keys=100000):
+        self.flush_threshold = flush_threshold
+        self.max_keys = max_keys
+        self.wake = threading.Event()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._pending_views = 0
+        self.flushed_views = 0
+        self.flushes = 0
+        self.dropped_views = 0
+
+    def _add_locked(self, product_id, count):
+        if product_id not in self._pending and len(self._pending) >= self.max_keys:
+            self.dropped_views += count
+            return False
+        self._pending[product_id] = self._pending.get(product_id, 0) + count
+        self._pending_views += count
+        return True
+
+    def incr(self, product_id, count=1):
+        """累加浏览；缓冲区商品数已满时丢弃新商品的浏览并返回False"""
+        with self._lock:
+            added = self._add_locked(product_id, count)
+            if not added or self._pending_views >= self.flush_threshold:
+                self.wake.set()
+            return added
+
+    def pending(self, product_id):
+        """尚未写回数据库的浏览增量"""
+        with self._lock:
+            return self._pending.get(product_id, 0)
+
+    def flush(self):
+        """把累计的增量写回数据库；失败时把增量合并回缓冲区，下次重试"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._pending = self._pending, {}
+                self._pending_views = 0
+            if not counts:
+                return True
+
+            conn = get_db_connection()
+            cur = None
+            try:
+                if not conn:
+                    raise OperationalError("数据库连接失败")
+                cur = conn.cursor()
+                items = sorted(counts.items())  # 按主键顺序加锁，避免与其他批量更新死锁
+                for i in range(0, len(items), VIEW_FLUSH_CHUNK):
+                    chunk = items[i:i + VIEW_FLUSH_CHUNK]
+                    cases = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+                    placeholders = ', '.join(['%s'] * len(chunk))
+                    params = [v for item in chunk for v in item] + [pid for pid, _ in chunk]
+                    cur.execute(f"""
+                        UPDATE product SET view_count = view_count + CASE product_id {cases} END
+                        WHERE product_id IN ({placeholders})
+                    """, params)
+                conn.commit()
+            except Exception:
+                if conn:
+                    conn.rollback()
+                print(f"写回浏览量异常：{traceback.format_exc()}")
+                with self._lock:
+                    for pid, count in counts.items():
+                        self._add_locked(pid, count)
+                return False
+            finally:
+                if conn:
+                    close_db_resource(conn, cur)
+
+            if CATALOG_INDEX_ENABLED:
+                catalog_index.add_views(counts)
+            resource_versions.bump('views')
+            with self._lock:
+                self.flushed_views += sum(counts.values())
+                self.flushes += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending_products": len(self._pending),
+                "pending_views": self._pending_views,
+                "flushed_views": self.flushed_views,
+                "flushes": self.flushes,
+                "dropped_views": self.dropped_views
+            }
+
+
+view_counter = ViewCounter(VIEW_FLUSH_THRESHOLD, VIEW_PENDING_MAX_KEYS)
+
+
+def init_view_counter():
+    """启动浏览量写回任务，进程退出时写回剩余增量"""
+    start_background_job('view-flush', VIEW_FLUSH_INTERVAL, view_counter.flush, wake=view_counter.wake)
+    atexit.register(view_counter.flush)
+
+
+# ==================== 商品全文检索 ====================
+_SEARCH_SPLIT = re.compile(r'[\s,，。.、;；:：!！?？()（）\[\]【】\-_/]+')
+
+
+def search_tokens(text):
+    """把文本切分为检索词元：每个片段内取相邻字符二元组，单字符片段取自身
+
+    中文不分词也能匹配（"二手iPhone 12" -> 二手, 手i, ip, ..., 12），
+    与MySQL ngram解析器（ngram_token_size=2）的切分方式一致。
+    """
+    tokens = []
+    for seg in _SEARCH_SPLIT.split((text or '').lower()):
+        if len(seg) == 1:
+            tokens.append(seg)
+        else:
+            tokens.extend(seg[i:i + 2] for i in range(len(seg) - 1))
+    return tokens
+
+
+def fulltext_boolean_query(keyword):
+    """把关键词转换为FULLTEXT布尔模式查询：每个词元都加+且作为短语引用，与SearchIndex一样要求全部命中
+
+    自然语言模式命中任一词元即可，同一关键词在索引就绪前后会返回不同的结果。
+    引号包裹使词元中的+-*~<>@()等字符不被当作布尔运算符；含引号的词元无法表示，跳过。
+    """
+    return ' '.join(f'+"{token}"' for token in dict.fromkeys(search_tokens(keyword)) if '"' not in token)
+
+
+class SearchIndex:
+    """商品名称/描述的二元组倒排索引
+
+    每个词元对应两个并行数组：商品ID与该商品中的权重（名称命中计3，描述命中计1）。
+    倒排表按商品ID有序，便于二分查找。只增不删，已售出商品在查询时由商品目录过滤，
+    随目录对账整体重建。
+    """
+    NAME_WEIGHT = 3
+    DESCRIPTION_WEIGHT = 1
+
+    def __init__(self):
+        self._ids = {}
+        self._weights = {}
+        self._char_tokens = {}  # 单字 -> 包含该字的词元，用于单字查询
+        self._indexed = set()
+
+    def add(self, product_id, product_name, description):
+        if product_id in self._indexed:
+            return
+        self._indexed.add(product_id)
+        weights = {}
+        for token in search_tokens(product_name):
+            weights[token] = weights.get(token, 0) + self.NAME_WEIGHT
+        for token in search_tokens(description):
+            weights[token] = weights.get(token, 0) + self.DESCRIPTION_WEIGHT
+        for token, weight in weights.items():
+            ids = self._ids.get(token)
+            if ids is None:
+                ids = self._ids[token] = array('I')
+                self._weights[token] = array('B')
+                for ch in token:
+                    self._char_tokens.setdefault(ch, set()).add(token)
+            # 倒排表按product_id有序，新商品ID递增时直接追加
+            if ids and ids[-1] > product_id:
+                i = bisect.bisect_left(ids, product_id)
+                ids.insert(i, product_id)
+                self._weights[token].insert(i, min(weight, 255))
+            else:
+                ids.append(product_id)
+                self._weights[token].append(min(weight, 255))
+
+    def token_count(self):
+        return len(self._ids)
+
+    def _expand(self, token):
+        """单字词元展开为所有包含该字的二元组"""
+        if len(token) == 1:
+            return [t for t in self._char_tokens.get(token, ()) if t in self._ids]
+        return [token] if token in self._ids else []
+
+    def _postings(self, tokens):
+        """合并若干词元的倒排表，返回{product_id: 权重}"""
+        postings = {}
+        for t in tokens:
+            for pid, weight in zip(self._ids[t], self._weights[t]):
+                postings[pid] = postings.get(pid, 0) + weight
+        return postings
+
+    def _lookup(self, tokens, product_id):
+        """在有序倒排表中二分查找product_id的权重，未命中返回0"""
+        weight = 0
+        for t in tokens:
+            ids = self._ids[t]
+            i = bisect.bisect_left(ids, product_id)
+            if i < len(ids) and ids[i] == product_id:
+                weight += self._weights[t][i]
+        return weight
+
+    def search(self, keyword):
+        """返回{product_id: 相关度}，要求命中关键词的全部词元（AND语义）
+
+        相关度 = Σ 词元权重 × idf。从文档频率最低的词元展开候选集，
+        候选集较小时其余词元只对候选商品做二分查找，不必遍历整条倒排表。
+        """
+        terms = []
+        for token in dict.fromkeys(search_tokens(keyword)):
+            expanded = self._expand(token)
+            df = sum(len(self._ids[t]) for t in expanded)
+            if not df:
+                return {}
+            terms.append((df, expanded))
+        if not terms:
+            return {}
+        terms.sort(key=lambda term: term[0])
+
+        total = len(self._indexed) or 1
+        df, expanded = terms[0]
+        idf = math.log(1 + total / df)
+        scores = {pid: w * idf for pid, w in self._postings(expanded).items()}
+        for df, expanded in terms[1:]:
+            idf = math.log(1 + total / df)
+            matched = {}
+            if len(scores) * 16 < df:
+                # 候选集远小于倒排表时逐个二分查找
+                for pid, score in scores.items():
+                    weight = self._lookup(expanded, pid)
+                    if weight:
+                        matched[pid] = score + weight * idf
+            else:
+                postings = self._postings(expanded)
+                for pid, score in scores.items():
+                    weight = postings.get(pid)
+                    if weight:
+                        matched[pid] = score + weight * idf
+            scores = matched
+            if not scores:
+                break
+        return scores
+
+
+# ==================== 商品目录内存索引 ====================
+class CatalogRow:
+    """在售商品的紧凑行，字段与PRODUCT_LIST_FIELDS一致"""
+    __slots__ = ('product_id', 'product_name', 'price', 'description', 'category_id',
+                 'category_name', 'seller_name', 'publish_time', 'view_count', 'thumbnail', 'favorite_count')
+
+    COLUMNS = f"""
+        SELECT p.product_id, p.product_name, p.price, p.description, p.category_id,
+               c.category_name, u.username, p.publish_time, p.view_count, {PRODUCT_LIST_FIELDS['thumbnail']},
+               p.favorite_count
+        FROM product p
+        JOIN category c ON p.category_id = c.category_id
+        JOIN user u ON p.user_id = u.user_id
+        WHERE p.status = 1
+    """
+
+    def __init__(self, product_id, product_name, price, description, category_id,
+                 category_name, seller_name, publish_time, view_count, thumbnail, favorite_count):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.price = price
+        self.description = description
+        self.category_id = category_id
+        self.category_name = category_name
+        self.seller_name = seller_name
+        self.publish_time = publish_time
+        self.view_count = view_count
+        self.thumbnail = thumbnail
+        self.favorite_count = favorite_count
+
+
+class CatalogIndex:
+    """在售商品的内存索引
+
+    - 按类别（None表示全部）维护(publish_time, product_id)升序列表，倒序遍历即为列表页顺序
+    - 按类别维护(price, product_id)升序列表，价格区间筛选用bisect定位
+    - 名称/描述的二元组倒排索引，供关键词搜索
+    写接口提交后同步更新索引，后台任务定期与MySQL全量对账。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rows = {}
+        self._by_time = {None: []}
+        self._by_price = {None: []}
+        self.search_index = SearchIndex()
+        self._loading = False
+        self._replay = []
+        self.ready = False
+        self.loaded_at = None
+
+    def _insert_locked(self, row):
+        self._remove_locked(row.product_id)
+        self._rows[row.product_id] = row
+        time_key = (row.publish_time, row.product_id)
+        price_key = (row.price, row.product_id)
+        for cat in (None, row.category_id):
+            bisect.insort(self._by_time.setdefault(cat, []), time_key)
+            bisect.insort(self._by_price.setdefault(cat, []), price_key)
+        self.search_index.add(row.product_id, row.product_name, row.description)
+
+    def _remove_locked(self, product_id):
+        row = self._rows.pop(product_id, None)
+        if row is None:
+            return
+        time_key = (row.publish_time, row.product_id)
+        price_key = (row.price, row.product_id)
+        for cat in (None, row.category_id):
+            for lst, key in ((self._by_time[cat], time_key), (self._by_price[cat], price_key)):
+                i = bisect.bisect_left(lst, key)
+                if i < len(lst) and lst[i] == key:
+                    del lst[i]
+
+    def upsert(self, row):
+        """写入或更新一条在售商品"""
+        with self._lock:
+            if self._loading:
+                self._replay.append(('upsert', row))
+            self._insert_locked(row)
+
+    def remove(self, product_id):
+        """移除一条商品（已售出/下架）"""
+        with self._lock:
+            if self._loading:
+                self._replay.append(('remove', product_id))
+            self._remove_locked(product_id)
+
+    def load(self):
+        """从MySQL全量加载，构建完成后原子替换；加载期间的写入在替换后重放"""
+        conn = get_db_connection()
+        if not conn:
+            return False
+
+        cur = None
+        try:
+            with self._lock:
+                self._loading = True
+                self._replay = []
+            # 无缓冲游标逐行读取，避免先把整张表物化为字典列表
+            cur = conn.cursor(MySQLdb.cursors.SSCursor)
+            cur.execute(CatalogRow.COLUMNS)
+            rows = {}
+            by_time = {None: []}
+            by_price = {None: []}
+            for r in cur:
+                row = CatalogRow(*r)
+                rows[row.product_id] = row
+                for cat in (None, row.category_id):
+                    by_time.setdefault(cat, []).append((row.publish_time, row.product_id))
+                    by_price.setdefault(cat, []).append((row.price, row.product_id))
+            for lst in by_time.values():
+                lst.sort()
+            for lst in by_price.values():
+                lst.sort()
+            search_index = SearchIndex()
+            for product_id in sorted(rows):
+                row = rows[product_id]
+                search_index.add(product_id, row.product_name, row.description)
+
+            with self._lock:
+                self._rows, self._by_time, self._by_price = rows, by_time, by_price
+                self.search_index = search_index
+                for op, arg in self._replay:
+                    if op == 'upsert':
+                        self._insert_locked(arg)
+                    else:
+                        self._remove_locked(arg)
+                self._replay = []
+                self.ready = True
+                self.loaded_at = datetime.now()
+            return True
+        except Exception:
+            print(f"加载商品目录索引异常：{traceback.format_exc()}")
+            return False
+        finally:
+            with self._lock:
+                self._loading = False
+            close_db_resource(conn, cur)
+
+    def refresh_product(self, cur, product_id):
+        """用当前游标重新读取一条商品并写入索引（发布后调用）"""
+        cur.execute(CatalogRow.COLUMNS + " AND p.product_id = %s", (product_id,))
+        r = cur.fetchone()
+        if r:
+            self.upsert(CatalogRow(*r))
+        else:
+            self.remove(product_id)
+
+    def contains(self, product_id):
+        with self._lock:
+            return product_id in self._rows
+
+    def get_many(self, product_ids):
+        """返回{product_id: CatalogRow}，不在售的商品不包含在内"""
+        with self._lock:
+            rows = self._rows
+            return {pid: rows[pid] for pid in product_ids if pid in rows}
+
+    def refresh_since(self, cur, product_id):
+        """把product_id之后新增的在售商品写入索引（批量导入后调用）"""
+        cur.execute(CatalogRow.COLUMNS + " AND p.product_id > %s", (product_id,))
+        while True:
+            rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                return
+            for r in rows:
+                self.upsert(CatalogRow(*r))
+
+    def add_views(self, counts):
+        """浏览量写回数据库后同步到索引行"""
+        with self._lock:
+            for pid, count in counts.items():
+                row = self._rows.get(pid)
+                if row is not None:
+                    row.view_count = (row.view_count or 0) + count
+
+    def add_favorite(self, product_id, delta):
+        """收藏/取消收藏提交后同步索引行的收藏数"""
+        with self._lock:
+            row = self._rows.get(product_id)
+            if row is not None:
+                row.favorite_count = max(0, (row.favorite_count or 0) + delta)
+
+    def query(self, category_id=None, min_price=None, max_price=None, after=None, limit=20):
+        """按列表页顺序（publish_time, product_id倒序）返回最多limit条CatalogRow"""
+        with self._lock:
+            if min_price is None and max_price is None:
+                lst = self._by_time.get(category_id, [])
+                end = bisect.bisect_left(lst, after) if after else len(lst)
+                keys = lst[max(0, end - limit):end]
+                keys.reverse()
+            else:
+                lst = self._by_price.get(category_id, [])
+                lo = bisect.bisect_left(lst, (min_price,)) if min_price is not None else 0
+                hi = bisect.bisect_right(lst, (max_price, float('inf'))) if max_price is not None else len(lst)
+                rows = self._rows
+                times = ((rows[pid].publish_time, pid) for _, pid in lst[lo:hi])
+                if after:
+                    times = (k for k in times if k < after)
+                keys = heapq.nlargest(limit, times)
+            return [self._rows[pid] for _, pid in keys]
+
+    def search(self, keyword, category_id=None, min_price=None, max_price=None, limit=20, offset=0):
+        """关键词搜索在售商品，按相关度（同分按发布时间）倒序，返回(命中总数, [(CatalogRow, 相关度)])"""
+        with self._lock:
+            hits = []
+            for pid, score in self.search_index.search(keyword).items():
+                row = self._rows.get(pid)
+                if row is None:
+                    continue
+                if category_id is not None and row.category_id != category_id:
+                    continue
+                if min_price is not None and row.price < min_price:
+                    continue
+                if max_price is not None and row.price > max_price:
+                    continue
+                hits.append((score, row.publish_time, pid))
+            top = heapq.nlargest(offset + limit, hits)[offset:]
+            return len(hits), [(self._rows[pid], score) for score, _, pid in top]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "products": len(self._rows),
+                "search_tokens": self.search_index.token_count(),
+                "categories": len(self._by_time) - 1,
+                "loaded_at": self.loaded_at.strftime("%Y-%m-%d %H:%M:%S") if self.loaded_at else None
+            }
+
+
+catalog_index = CatalogIndex()
+
+
+def init_catalog_index():
+    """启动时加载商品目录索引，并启动定期对账任务"""
+    if not CATALOG_INDEX_ENABLED:
+        return
+    catalog_index.load()
+    start_background_job('catalog-reconcile', CATALOG_RECONCILE_INTERVAL, catalog_index.load)
+
+
+# ==================== 相似商品推荐 ====================
+RECOMMEND_FIELDS = ['product_id', 'product_name', 'price', 'category_name', 'seller_name', 'thumbnail']
+
+
+class SimilarityModel:
+    """一次批量计算得到的商品Top-K近邻表，构建完成后只读
+
+    商品ID升序存放在item_ids中，第i件商品的近邻为neighbors/scores[offsets[i]:offsets[i+1]]，
+    按相似度降序；sellers[i]为其卖家。全部为紧凑的array，查询只需一次二分加K次读取。
+    """
+    __slots__ = ('item_ids', 'sellers', 'offsets', 'neighbors', 'scores')
+
+    def __init__(self):
+        self.item_ids = array('i')
+        self.sellers = array('i')
+        self.offsets = array('l', [0])
+        self.neighbors = array('i')
+        self.scores = array('f')
+
+    def _position(self, product_id):
+        i = bisect.bisect_left(self.item_ids, product_id)
+        if i < len(self.item_ids) and self.item_ids[i] == product_id:
+            return i
+        return None
+
+    def seller(self, product_id):
+        i = self._position(product_id)
+        return self.sellers[i] if i is not None else None
+
+    def similar(self, product_id):
+        """返回[(近邻商品ID, 相似度)]，按相似度降序"""
+        i = self._position(product_id)
+        if i is None:
+            return []
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return list(zip(self.neighbors[start:end], self.scores[start:end]))
+
+
+def _top_k_scipy(user_idx, item_idx, weights, n_users, n_items, k):
+    """稀疏矩阵版：A为用户×商品交互矩阵，A.T @ A为商品共现，按余弦归一化后逐行取Top-K"""
+    a = sparse.csr_matrix((np.asarray(weights, dtype=np.float32),
+                           (np.asarray(user_idx, dtype=np.int32), np.asarray(item_idx, dtype=np.int32))),
+                          shape=(n_users, n_items))
+    a = a[np.diff(a.indptr) <= RECOMMEND_MAX_USER_ITEMS]
+    co = (a.T @ a).tocsr()
+    norms = np.sqrt(co.diagonal())
+    inv = sparse.diags(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0))
+    co = (inv @ co @ inv).tocsr()
+    co.setdiag(0)
+    co.eliminate_zeros()
+    for i in range(n_items):
+        start, end = co.indptr[i], co.indptr[i + 1]
+        data = co.data[start:end]
+        idx = np.argpartition(-data, k)[:k] if end - start > k else np.arange(end - start)
+        idx = idx[np.argsort(-data[idx], kind='stable')]
+        yield co.indices[start:end][idx], data[idx]
+
+
+def _top_k_python(user_idx, item_idx, weights, n_users, n_items, k):
+    """纯Python版：逐用户累加共现与向量模长，结果与稀疏矩阵版一致"""
+    baskets = [None] * n_users
+    for u, i, w in zip(user_idx, item_idx, weights):
+        basket = baskets[u]
+        if basket is None:
+            basket = baskets[u] = {}
+        basket[i] = basket.get(i, 0.0) + w
+    norms = [0.0] * n_items
+    co = {}
+    for basket in baskets:
+        if basket is None or len(basket) > RECOMMEND_MAX_USER_ITEMS:
+            continue
+        items = list(basket.items())
+        for i, wi in items:
+            norms[i] += wi * wi
+            row = co.setdefault(i, {})
+            for j, wj in items:
+                if i != j:
+                    row[j] = row.get(j, 0.0) + wi * wj
+    for i in range(n_items):
+        row = co.get(i)
+        if not row:
+            yield (), ()
+            continue
+        top = heapq.nlargest(k, ((c / math.sqrt(norms[i] * norms[j]), j) for j, c in row.items()))
+        yield [j for _, j in top], [score for score, _ in top]
+
+
+class SimilarProducts:
+    """基于收藏/购买共现的相似商品
+
+    后台任务定期读取favorites与orders，批量计算商品间的余弦相似度并保留每件商品的Top-K近邻，
+    构建完成后整体替换模型；请求路径只读当前模型，不做SQL聚合。
+    """
+
+    def __init__(self):
+        self.model = SimilarityModel()
+        self.backend = 'scipy' if sparse is not None else 'python'
+        self.ready = False
+        self.built_at = None
+        self.build_seconds = None
+        self.interactions = 0
+
+    def _load_interactions(self):
+        """读取(用户, 商品, 权重)交互与商品卖家；收藏记1，未取消的购买记RECOMMEND_ORDER_WEIGHT"""
+        conn = get_db_connection()
+        if not conn:
+            return None
+
+        users, items, weights, sellers = array('i'), array('i'), array('f'), {}
+        cur = None
+        try:
+            cur = conn.cursor(MySQLdb.cursors.SSCursor)
+            for sql, weight in (
+                ("SELECT f.user_id, f.product_id, p.user_id FROM favorites f "
+                 "JOIN product p ON f.product_id = p.product_id", 1.0),
+                ("SELECT o.buyer_id, o.product_id, o.seller_id FROM orders o WHERE o.status <> 5",
+                 RECOMMEND_ORDER_WEIGHT)
+            ):
+                cur.execute(sql)
+                for user_id, product_id, seller_id in cur:
+                    users.append(user_id)
+                    items.append(product_id)
+                    weights.append(weight)
+                    sellers[product_id] = seller_id
+            return users, items, weights, sellers
+        finally:
+            close_db_resource(conn, cur)
+
+    def rebuild(self):
+        """重新计算相似度矩阵并替换当前模型"""
+        start = time.perf_counter()
+        try:
+            loaded = self._load_interactions()
+            if loaded is None:
+                return False
+            users, items, weights, sellers = loaded
+
+            item_ids = sorted(sellers)
+            position = {pid: i for i, pid in enumerate(item_ids)}
+            user_position = {}
+            user_idx = array('i', (user_position.setdefault(u, len(user_position)) for u in users))
+            item_idx = array('i', (position[pid] for pid in items))
+            top_k = _top_k_scipy if sparse is not None else _top_k_python
+
+            model = SimilarityModel()
+            model.item_ids = array('i', item_ids)
+            model.sellers = array('i', (sellers[pid] for pid in item_ids))
+            for neighbors, scores in top_k(user_idx, item_idx, weights, len(user_position), len(item_ids),
+                                           RECOMMEND_TOP_K):
+                model.neighbors.extend(item_ids[j] for j in neighbors)
+                model.scores.extend(float(score) for score in scores)
+                model.offsets.append(len(model.neighbors))
+
+            self.model = model
+            self.interactions = len(users)
+            self.ready = True
+            self.built_at = datetime.now()
+            self.build_seconds = round(time.perf_counter() - start, 3)
+            return True
+        except Exception:
+            print(f"计算相似商品异常：{traceback.format_exc()}")
+            return False
+
+    def stats(self):
+        model = self.model
+        return {
+            "ready": self.ready,
+            "backend": self.backend,
+            "items": len(model.item_ids),
+            "neighbors": len(model.neighbors),
+            "interactions": self.interactions,
+            "build_seconds": self.build_seconds,
+            "built_at": self.built_at.strftime("%Y-%m-%d %H:%M:%S") if self.built_at else None
+        }
+
+
+similar_products = SimilarProducts()
+
+
+def init_similar_products():
+    """启动相似商品的定期重算任务；首次计算立即在后台执行，不阻塞启动"""
+    wake = threading.Event()
+    wake.set()
+    start_background_job('similar-products', RECOMMEND_REBUILD_INTERVAL, similar_products.rebuild, wake)
+
+
+def on_sale_rows(product_ids):
+    """返回{product_id: CatalogRow}，只含在售商品；目录索引就绪时不访问数据库，否则按主键查询一次"""
+    if CATALOG_INDEX_ENABLED and catalog_index.ready:
+        return catalog_index.get_many(product_ids)
+    if not product_ids:
+        return {}
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return None
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(CatalogRow.COLUMNS + f" AND p.product_id IN ({', '.join(['%s'] * len(product_ids))})",
+                    list(product_ids))
+        return {r[0]: CatalogRow(*r) for r in cur.fetchall()}
+    finally:
+        close_db_resource(conn, cur)
 
-# 设置系统编码
-if sys.version_info[0] >= 3:
-    import io
 
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+def recommended_products(candidates, limit, exclude_seller=None):
+    """按得分顺序过滤候选[(product_id, 得分)]：去掉已售出/下架与exclude_seller自己发布的商品
 
-# 使用PyMySQL作为MySQLdb的替代
-import pymysql
+    数据库不可用时返回None。
+    """
+    model = similar_products.model
+    if exclude_seller is not None:
+        candidates = [(pid, score) for pid, score in candidates if model.seller(pid) != exclude_seller]
+    rows = on_sale_rows([pid for pid, _ in candidates])
+    if rows is None:
+        return None
+    products = []
+    for pid, score in candidates:
+        row = rows.get(pid)
+        if row is None:
+            continue
+        item = {f: getattr(row, f) for f in RECOMMEND_FIELDS}
+        item['score'] = round(score, 4)
+        products.append(item)
+        if len(products) >= limit:
+            break
+    return products
 
-pymysql.install_as_MySQLdb()
-import MySQLdb
-from MySQLdb import OperationalError, ProgrammingError, IntegrityError
-import traceback
 
-# 初始化Flask应用
-app = Flask(__name__, static_folder='.', static_url_path='')
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+# ==================== 静态文件服务 ====================
+class StaticAsset:
+    """一个静态资源：内容哈希与各编码的预压缩内容"""
+    __slots__ = ('path', 'content_type', 'digest', 'data', 'variants')
 
-# 数据库配置
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'passwd': '123456',
-    'db': 'campus_secondhand_simple',
-    'charset': 'utf8mb4',
-    'autocommit': False
-}
+    def __init__(self, path, content_type, digest, data, variants):
+        self.path = path
+        self.content_type = content_type
+        self.digest = digest
+        self.data = data          # 原文；None表示大文件，从磁盘经sendfile发送
+        self.variants = variants  # {'br'/'gzip': 压缩后的内容}
 
 
-# ==================== 辅助函数 ====================
-def json_response(data, status_code=200):
-    """自定义JSON响应，确保中文不被转义"""
-    response = make_response(
-        json.dumps(data, ensure_ascii=False, indent=2, separators=(',', ': '))
-    )
-    response.headers['Content-Type'] = 'application/json; charset=utf-8'
-    response.status_code = status_code
-    return response
+class StaticManifest:
+    """静态资源清单：启动时扫描STATIC_ROOT，预计算内容哈希、gzip/brotli压缩版本与带指纹的文件名
 
+    HTML中对本地资源的引用改写为带指纹的文件名（如 common.3f2a9c1d.js），这类URL的内容
+    永不改变，可以长期缓存；HTML自身与原文件名每次都用强ETag校验。
+    只有清单中的文件才能被访问，源码和配置不会被当作静态文件下发。
+    """
 
-def get_db_connection():
-    """获取数据库连接"""
-    try:
-        conn = MySQLdb.connect(**DB_CONFIG)
-        conn.ping(reconnect=True)
-        return conn
-    except OperationalError as e:
-        print(f"数据库连接失败：{str(e)}")
-        return None
-    except Exception as e:
-        print(f"数据库连接异常：{traceback.format_exc()}")
-        return None
+    _REFERENCE = re.compile(rb'((?:src|href)=["\'])([^"\':?#]+)(["\'])')
 
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._assets = {}        # URL路径 -> (StaticAsset, 是否为带指纹的路径)
+        self._signature = None   # [(文件路径, mtime, 大小)]，debug模式下用于检测文件变更
 
-def close_db_resource(conn, cur):
-    """关闭数据库资源"""
-    if cur:
-        try:
-            cur.close()
-        except:
-            pass
-    if conn:
-        try:
-            conn.close()
-        except:
-            pass
+    def _scan(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(('.', '__'))
+                                 and os.path.join(dirpath, d) != IMAGE_STORE_ROOT)
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in STATIC_TYPES:
+                    path = os.path.join(dirpath, filename)
+                    st = os.stat(path)
+                    files.append((path, st.st_mtime, st.st_size))
+        files.sort()
+        return files
 
+    @staticmethod
+    def _make_asset(path, ext, data, rewritten):
+        variants = {}
+        if ext in STATIC_COMPRESSIBLE and len(data) >= STATIC_COMPRESS_MIN_SIZE:
+            candidates = [('gzip', gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                candidates.append(('br', brotli.compress(data, quality=11)))
+            for encoding, body in candidates:
+                # 压缩收益不到10%时不值得客户端解压
+                if len(body) < len(data) * 0.9:
+                    variants[encoding] = body
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        # 改写过引用的HTML与磁盘内容不同，只能从内存发送
+        if len(data) >= STATIC_SENDFILE_MIN_SIZE and not rewritten:
+            data = None
+        return StaticAsset(path, STATIC_TYPES[ext], digest, data, variants)
 
-@app.after_request
-def after_request(response):
-    """添加CORS头部"""
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
+    def _rewrite_references(self, name, data, fingerprinted):
+        base = posixpath.dirname(name)
+
+        def replace(match):
+            target = posixpath.normpath(posixpath.join(base, match.group(2).decode('utf-8')))
+            new = fingerprinted.get(target)
+            if new is None:
+                return match.group(0)
+            return match.group(1) + posixpath.relpath(new, base or '.').encode('utf-8') + match.group(3)
+
+        return self._REFERENCE.sub(replace, data)
+
+    def build(self):
+        """扫描并重建清单，返回资源数"""
+        files = self._scan()
+        assets = {}
+        fingerprinted = {}
+        pages = []
+        for path, _, _ in files:
+            name = os.path.relpath(path, self.root).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1].lower()
+            with open(path, 'rb') as f:
+                data = f.read()
+            if ext == '.html':
+                # HTML要等其他资源的指纹都确定后再改写引用
+                pages.append((name, path, data))
+                continue
+            asset = self._make_asset(path, ext, data, False)
+            fingerprint = f"{name[:-len(ext)]}.{asset.digest[:8]}{ext}"
+            assets[name] = (asset, False)
+            assets[fingerprint] = (asset, True)
+            fingerprinted[name] = fingerprint
+        for name, path, data in pages:
+            data = self._rewrite_references(name, data, fingerprinted)
+            assets[name] = (self._make_asset(path, '.html', data, True), False)
+
+        with self._lock:
+            self._assets = assets
+            self._signature = files
+        return len(files)
+
+    def get(self, name):
+        """按URL路径查找资源，返回(StaticAsset, 是否带指纹)或None"""
+        if self._signature is None or app.debug:
+            with self._lock:
+                stale = self._signature is None or (app.debug and self._scan() != self._signature)
+            if stale:
+                self.build()
+        return self._assets.get(name)
+
+    def stats(self):
+        assets = {id(asset): asset for asset, _ in self._assets.values()}.values()
+        return {
+            "assets": len(assets),
+            "paths": len(self._assets),
+            "bytes": sum(len(a.data) for a in assets if a.data is not None),
+            "compressed_bytes": {enc: sum(len(a.variants[enc]) for a in assets if enc in a.variants)
+                                 for enc in ('gzip', 'br')},
+            "sendfile_assets": sum(1 for a in assets if a.data is None),
+            "brotli_available": brotli is not None
+        }
+
+
+static_manifest = StaticManifest(STATIC_ROOT)
+
+
+def init_static_assets():
+    """启动时建立静态资源清单并预压缩"""
+    start = time.perf_counter()
+    count = static_manifest.build()
+    print(f"静态资源清单：{count}个文件，耗时{(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+def send_static_asset(name):
+    """按Accept-Encoding选择预压缩版本发送静态资源，支持If-None-Match"""
+    entry = static_manifest.get(name)
+    if entry is None:
+        return json_response({"code": 404, "message": "文件不存在"}, 404)
+    asset, immutable = entry
+
+    encoding = None
+    for candidate in ('br', 'gzip'):
+        if candidate in asset.variants and request.accept_encodings[candidate] > 0:
+            encoding = candidate
+            break
+    # 强ETag必须区分编码，不同编码的字节不同
+    etag = f"{asset.digest}-{encoding}" if encoding else asset.digest
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif encoding:
+        response = Response(asset.variants[encoding], content_type=asset.content_type)
+        response.headers['Content-Encoding'] = encoding
+    elif asset.data is None:
+        # 部署在gunicorn等服务器下时，wsgi.file_wrapper用sendfile零拷贝发送，并支持Range请求
+        response = send_file(asset.path, mimetype=asset.content_type, etag=False, conditional=True)
+    else:
+        response = Response(asset.data, content_type=asset.content_type)
+
+    response.set_etag(etag)
+    if asset.variants:
+        response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers['Cache-Control'] = "no-cache"
     return response
 
 
-# ==================== 静态文件服务 ====================
 @app.route('/')
 def index():
     """默认页面"""
-    return send_from_directory('.', 'login.html')
+    return send_static_asset('login.html')
 
 
 @app.route('/<path:filename>')
 def serve_static(filename):
     """静态文件服务"""
-    if os.path.exists(filename):
-        return send_from_directory('.', filename)
-    else:
-        return json_response({"code": 404, "message": "文件不存在"}, 404)
+    return send_static_asset(filename)
 
 
 # ==================== API接口 ====================
@@ -130,7 +3799,7 @@ def login():
 
     conn = get_db_connection()
     if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
+        return db_unavailable_response()
 
     cur = None
     try:
@@ -178,7 +3847,7 @@ def register():
 
     conn = get_db_connection()
     if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
+        return db_unavailable_response()
 
     cur = None
     try:
@@ -207,7 +3876,19 @@ def register():
         close_db_resource(conn, cur)
 
 
+def product_list_resources():
+    """浏览量、收藏数单独计版本，只有请求了对应字段的列表才随其变化而失效"""
+    fields = request.args.get('fields', '')
+    resources = ('products',)
+    if 'view_count' in fields:
+        resources += ('views',)
+    if 'favorite_count' in fields:
+        resources += ('favorites',)
+    return resources
+
+
 @app.route('/product_list', methods=['GET'])
+@conditional_get(product_list_resources)
 def product_list():
     """获取商品列表 - 修复版本"""
     # 获取查询参数
@@ -215,130 +3896,360 @@ def product_list():
     min_price = request.args.get('min_price', '')
     max_price = request.args.get('max_price', '')
 
+    cursor = request.args.get('cursor', '')
+    limit = request.args.get('limit', '')
+
     print(f"收到 /product_list 请求，参数: category_id={category_id}, min_price={min_price}, max_price={max_price}")
 
-    # 先连接数据库获取真实数据
-    conn = get_db_connection()
-    if not conn:
-        # 如果数据库连接失败，返回测试数据（为了前端能显示）
-        products = [
-            {
-                "product_id": 1,
-                "product_name": "Python编程从入门到实践",
-                "price": 68.50,
-                "category_name": "书籍",
-                "seller_name": "张三"
-            },
-            {
-                "product_id": 2,
-                "product_name": "二手iPhone 12",
-                "price": 2999.00,
-                "category_name": "电子产品",
-                "seller_name": "李四"
-            },
-            {
-                "product_id": 3,
-                "product_name": "保温杯",
-                "price": 45.00,
-                "category_name": "生活用品",
-                "seller_name": "王五"
-            },
-            {
-                "product_id": 4,
-                "product_name": "Java核心技术",
-                "price": 89.00,
-                "category_name": "书籍",
-                "seller_name": "赵六"
-            },
-            {
-                "product_id": 5,
-                "product_name": "小米充电宝",
-                "price": 79.00,
-                "category_name": "电子产品",
-                "seller_name": "钱七"
-            }
-        ]
+    # 分页参数：游标为上一页最后一条的(publish_time, product_id)
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return json_response({"code": 400, "success": False, "message": "分页游标无效"}, 400)
+    if limit:
+        if not limit.isdigit() or int(limit) <= 0:
+            return json_response({"code": 400, "success": False, "message": "limit必须为正整数"}, 400)
+        limit = min(int(limit), PRODUCT_PAGE_SIZE_MAX)
+    else:
+        limit = PRODUCT_PAGE_SIZE
 
-        # 简单的过滤逻辑
-        filtered_products = products
-        if min_price:
-            try:
-                min_price_float = float(min_price)
-                filtered_products = [p for p in filtered_products if p['price'] >= min_price_float]
-            except:
-                pass
-        if max_price:
-            try:
-                max_price_float = float(max_price)
-                filtered_products = [p for p in filtered_products if p['price'] <= max_price_float]
-            except:
-                pass
+    fields = parse_fields(request.args.get('fields', ''))
+    if fields is None:
+        return json_response({"code": 400, "success": False, "message": "fields包含不支持的字段"}, 400)
+    try:
+        min_price = parse_price(min_price)
+        max_price = parse_price(max_price)
+    except ValueError as e:
+        return json_response({"code": 400, "success": False, "message": str(e)}, 400)
+
+    # 内存索引就绪时直接应答，无需访问数据库
+    if CATALOG_INDEX_ENABLED and catalog_index.ready:
+        rows = catalog_index.query(
+            category_id=int(category_id) if category_id.isdigit() else None,
+            min_price=min_price,
+            max_price=max_price,
+            after=after,
+            limit=limit + 1
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return json_response({
+            "products": [{f: getattr(row, f) for f in fields} for row in rows],
+            "count": len(rows),
+            "has_more": has_more,
+            "next_cursor": encode_cursor(rows[-1].publish_time, rows[-1].product_id) if has_more else None
+        })
+
+    try:
+        # 构建查询SQL，只JOIN投影字段需要的表
+        columns = [PRODUCT_LIST_FIELDS[f] for f in fields]
+        columns.append('p.publish_time AS _cursor_time')
+        sql = f"SELECT {', '.join(columns)} FROM product p"
+        if 'category_name' in fields:
+            sql += " JOIN category c ON p.category_id = c.category_id"
+        if 'seller_name' in fields:
+            sql += " JOIN user u ON p.user_id = u.user_id"
+        sql += " WHERE p.status = 1"
+        params = []
+
+        # 添加筛选条件
+        if category_id and category_id.isdigit():
+            sql += " AND p.category_id = %s"
+            params.append(int(category_id))
+        if min_price is not None:
+            sql += " AND p.price >= %s"
+            params.append(min_price)
+        if max_price is not None:
+            sql += " AND p.price <= %s"
+            params.append(max_price)
+
+        # 键集分页：从游标之后继续，走(status, category_id, publish_time, product_id)索引
+        if after:
+            sql += " AND (p.publish_time < %s OR (p.publish_time = %s AND p.product_id < %s))"
+            params.extend([after[0], after[0], after[1]])
+
+        # 多取一条用于判断是否还有下一页
+        sql += " ORDER BY p.publish_time DESC, p.product_id DESC LIMIT %s"
+        params.append(limit + 1)
+
+        # 筛选/分页组合太多，不缓存新鲜结果；只合并并发的相同查询，并在数据库不可用时返回上次的结果
+        rows = query_cache.fetchall(sql, params, ttl=0, dict_rows=True)
+
+        has_more = len(rows) > limit
+        products = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if has_more:
+            last = products[-1]
+            next_cursor = encode_cursor(last['_cursor_time'], last['product_id'])
+        for p in products:
+            del p['_cursor_time']
 
         # 返回前端期望的格式
-        return {
-            "products": filtered_products,
-            "count": len(filtered_products)
-        }
+        return json_response({
+            "products": products,
+            "count": len(products),
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        })
+
+    except DatabaseUnavailable:
+        return db_unavailable_response()
+    except Exception as e:
+        print(f"查询商品列表异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
+
+
+@app.route('/api/search', methods=['GET'])
+def search_products():
+    """关键词搜索商品，可与类别、价格筛选组合，按相关度排序"""
+    keyword = request.args.get('q', '').strip()
+    category_id = request.args.get('category_id', '')
+    try:
+        min_price = parse_price(request.args.get('min_price', ''))
+        max_price = parse_price(request.args.get('max_price', ''))
+    except ValueError as e:
+        return json_response({"code": 400, "success": False, "message": str(e)}, 400)
+    limit = request.args.get('limit', '')
+    offset = request.args.get('offset', '0')
+
+    if not keyword:
+        return json_response({"code": 400, "success": False, "message": "搜索关键词不能为空"}, 400)
+    keyword = keyword[:SEARCH_KEYWORD_MAX_LENGTH]
+    if limit:
+        if not limit.isdigit() or int(limit) <= 0:
+            return json_response({"code": 400, "success": False, "message": "limit必须为正整数"}, 400)
+        limit = min(int(limit), PRODUCT_PAGE_SIZE_MAX)
+    else:
+        limit = PRODUCT_PAGE_SIZE
+    if not offset.isdigit() or int(offset) > SEARCH_MAX_OFFSET:
+        return json_response({"code": 400, "success": False, "message": f"offset必须为0-{SEARCH_MAX_OFFSET}的整数"}, 400)
+    offset = int(offset)
+    category_id = int(category_id) if category_id.isdigit() else None
+
+    fields = parse_fields(request.args.get('fields', ''))
+    if fields is None:
+        return json_response({"code": 400, "success": False, "message": "fields包含不支持的字段"}, 400)
+
+    # 优先使用内存倒排索引
+    if CATALOG_INDEX_ENABLED and catalog_index.ready:
+        total, hits = catalog_index.search(keyword, category_id, min_price, max_price, limit, offset)
+        products = []
+        for row, score in hits:
+            product = {f: getattr(row, f) for f in fields}
+            product['score'] = round(score, 4)
+            products.append(product)
+        return json_response({
+            "code": 200,
+            "success": True,
+            "products": products,
+            "count": len(products),
+            "total": total,
+            "source": "index"
+        })
+
+    # 索引未就绪时使用MySQL FULLTEXT（ngram解析器）索引
+    conn = get_db_connection()
+    if not conn:
+        return db_unavailable_response()
 
-    # 如果有数据库连接，查询真实数据
     cur = None
     try:
         cur = conn.cursor(MySQLdb.cursors.DictCursor)
+        columns = [PRODUCT_LIST_FIELDS[f] for f in fields]
+        columns.append("MATCH(p.product_name, p.description) AGAINST (%s IN BOOLEAN MODE) AS score")
+        sql = f"SELECT {', '.join(columns)} FROM product p"
+        if 'category_name' in fields:
+            sql += " JOIN category c ON p.category_id = c.category_id"
+        if 'seller_name' in fields:
+            sql += " JOIN user u ON p.user_id = u.user_id"
+        sql += " WHERE p.status = 1 AND MATCH(p.product_name, p.description) AGAINST (%s IN BOOLEAN MODE)"
+        query = fulltext_boolean_query(keyword)
+        params = [query, query]
+
+        if category_id is not None:
+            sql += " AND p.category_id = %s"
+            params.append(category_id)
+        if min_price is not None:
+            sql += " AND p.price >= %s"
+            params.append(min_price)
+        if max_price is not None:
+            sql += " AND p.price <= %s"
+            params.append(max_price)
+
+        sql += " ORDER BY score DESC, p.publish_time DESC LIMIT %s OFFSET %s"
+        params.extend([limit, offset])
+
+        cur.execute(sql, params)
+        products = cur.fetchall()
+        for p in products:
+            p['score'] = round(float(p['score']), 4)
 
-        # 构建查询SQL
+        return json_response({
+            "code": 200,
+            "success": True,
+            "products": products,
+            "count": len(products),
+            "total": None,
+            "source": "mysql"
+        })
+
+    except Exception as e:
+        print(f"搜索商品异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "搜索失败"}, 500)
+    finally:
+        close_db_resource(conn, cur)
+
+
+@app.route('/api/product_view/<int:product_id>', methods=['POST'])
+def product_view(product_id):
+    """记录一次商品浏览，只累加内存计数，由后台任务批量写回
+
+    目录索引未就绪时无法校验商品ID，缓冲区的商品数由VIEW_PENDING_MAX_KEYS封顶，超出的浏览计数丢弃。
+    """
+    if CATALOG_INDEX_ENABLED and catalog_index.ready and not catalog_index.contains(product_id):
+        return json_response({"code": 404, "success": False, "message": "商品不存在或已售出"}, 404)
+    view_counter.incr(product_id)
+    return json_response({"code": 200, "success": True})
+
+
+@app.route('/api/popular_products', methods=['GET'])
+def popular_products():
+    """按浏览量（sort=views，默认）或收藏数（sort=favorites）排序的热门在售商品"""
+    category_id = request.args.get('category_id', '')
+    sort = request.args.get('sort', 'views')
+    if sort not in ('views', 'favorites'):
+        return json_response({"code": 400, "success": False, "message": "sort应为views或favorites"}, 400)
+    limit = request.args.get('limit', '')
+    if limit:
+        if not limit.isdigit() or int(limit) <= 0:
+            return json_response({"code": 400, "success": False, "message": "limit必须为正整数"}, 400)
+        limit = min(int(limit), PRODUCT_PAGE_SIZE_MAX)
+    else:
+        limit = PRODUCT_PAGE_SIZE
+
+    conn = get_db_connection()
+    if not conn:
+        return db_unavailable_response()
+
+    cur = None
+    try:
+        cur = conn.cursor(MySQLdb.cursors.DictCursor)
+        # 走(status, view_count)或(status, favorite_count)索引倒序读取前limit条
         sql = """
-            SELECT 
-                p.product_id,
-                p.product_name,
-                p.price,
-                p.description,
-                c.category_name,
-                u.username as seller_name
+            SELECT p.product_id, p.product_name, p.price, p.view_count, p.favorite_count,
+                   c.category_name, u.username as seller_name
             FROM product p
             JOIN category c ON p.category_id = c.category_id
             JOIN user u ON p.user_id = u.user_id
             WHERE p.status = 1
         """
         params = []
-
-        # 添加筛选条件
-        if category_id and category_id.isdigit():
+        if category_id.isdigit():
             sql += " AND p.category_id = %s"
             params.append(int(category_id))
-        if min_price:
-            try:
-                sql += " AND p.price >= %s"
-                params.append(float(min_price))
-            except:
-                pass
-        if max_price:
-            try:
-                sql += " AND p.price <= %s"
-                params.append(float(max_price))
-            except:
-                pass
-
-        sql += " ORDER BY p.publish_time DESC"
-
+        order_column = 'p.view_count' if sort == 'views' else 'p.favorite_count'
+        sql += f" ORDER BY {order_column} DESC, p.product_id DESC LIMIT %s"
+        params.append(limit)
         cur.execute(sql, params)
         products = cur.fetchall()
 
-        # 返回前端期望的格式
-        return {
+        # 叠加尚未写回的浏览增量
+        for p in products:
+            p['view_count'] = (p['view_count'] or 0) + view_counter.pending(p['product_id'])
+
+        return json_response({
+            "code": 200,
+            "success": True,
             "products": products,
             "count": len(products)
-        }
+        })
 
     except Exception as e:
-        print(f"查询商品列表异常：{traceback.format_exc()}")
-        # 出错时返回空数组
-        return {
-            "products": [],
-            "count": 0
-        }
+        print(f"热门商品查询异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
+    finally:
+        close_db_resource(conn, cur)
+
+
+def parse_recommend_limit():
+    """解析推荐接口的limit参数，返回(limit, 错误响应)"""
+    limit = request.args.get('limit', '')
+    if not limit:
+        return RECOMMEND_PAGE_SIZE, None
+    if not limit.isdigit() or int(limit) <= 0:
+        return None, json_response({"code": 400, "success": False, "message": "limit必须为正整数"}, 400)
+    return min(int(limit), RECOMMEND_TOP_K), None
+
+
+@app.route('/api/similar/<int:product_id>', methods=['GET'])
+def similar_to_product(product_id):
+    """与指定商品相似的在售商品（常被同一批用户收藏/购买），可传user_id排除该用户自己发布的商品"""
+    limit, error = parse_recommend_limit()
+    if error:
+        return error
+    user_id = request.args.get('user_id', type=int)
+
+    products = recommended_products(similar_products.model.similar(product_id), limit, user_id)
+    if products is None:
+        return db_unavailable_response()
+    return json_response({
+        "code": 200,
+        "success": True,
+        "product_id": product_id,
+        "products": products,
+        "count": len(products)
+    })
+
+
+@app.route('/api/recommendations/<int:user_id>', methods=['GET'])
+def recommendations(user_id):
+    """个性化推荐：以用户最近的收藏/购买为种子，累加各种子的近邻相似度
+
+    只按索引读取最多RECOMMEND_MAX_SEEDS个种子商品ID，打分与过滤都在内存中完成。
+    """
+    limit, error = parse_recommend_limit()
+    if error:
+        return error
+
+    conn = get_db_connection(read_only=True, user_id=user_id)
+    if not conn:
+        return db_unavailable_response()
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            (SELECT product_id FROM favorites WHERE user_id = %s ORDER BY created_at DESC LIMIT %s)
+            UNION
+            (SELECT product_id FROM orders WHERE buyer_id = %s ORDER BY order_id DESC LIMIT %s)
+        """, (user_id, RECOMMEND_MAX_SEEDS, user_id, RECOMMEND_MAX_SEEDS))
+        seeds = {row[0] for row in cur.fetchall()}
+    except Exception as e:
+        print(f"推荐种子查询异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
     finally:
         close_db_resource(conn, cur)
 
+    model = similar_products.model
+    scores = {}
+    for seed in seeds:
+        for pid, score in model.similar(seed):
+            if pid not in seeds:
+                scores[pid] = scores.get(pid, 0.0) + score
+    candidates = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+    products = recommended_products(candidates, limit, user_id)
+    if products is None:
+        return db_unavailable_response()
+    return json_response({
+        "code": 200,
+        "success": True,
+        "user_id": user_id,
+        "products": products,
+        "count": len(products)
+    })
+
 
 @app.route('/api/publish_product', methods=['POST'])
 def publish_product():
@@ -346,73 +4257,171 @@ def publish_product():
     if not request.is_json:
         return json_response({"code": 400, "success": False, "message": "请求格式错误"}, 400)
 
-    data = request.json
-    product_name = data.get('product_name', '').strip()
-    price = data.get('price')
-    category_id = data.get('category_id')
-    user_id = data.get('user_id')
-    description = data.get('description', '')
-
     # 验证数据
-    if not product_name:
-        return json_response({"code": 400, "success": False, "message": "商品名称不能为空"}, 400)
-    if not price or price <= 0:
-        return json_response({"code": 400, "success": False, "message": "价格必须大于0"}, 400)
-    if not category_id:
-        return json_response({"code": 400, "success": False, "message": "请选择商品类别"}, 400)
-    if not user_id:
-        return json_response({"code": 400, "success": False, "message": "用户信息错误"}, 400)
+    params, error = validate_product(request.json)
+    if error:
+        return json_response({"code": 400, "success": False, "message": error}, 400)
+    product_name, price, description, category_id, user_id = params
+    images, error = parse_product_images(request.json.get('images'))
+    if error:
+        return json_response({"code": 400, "success": False, "message": error}, 400)
+
+    conn = get_db_connection()
+    if not conn:
+        return db_unavailable_response()
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO product (product_name, price, description, category_id, user_id, 
+                               images, status, publish_time, view_count) 
+            VALUES (%s, %s, %s, %s, %s, %s, 1, NOW(), 0)
+        """, (product_name, price, description, category_id, user_id, images))
+        update_product_stats(cur, category_id, price, 1)
+        apply_trend_stats(cur, 'publish', {category_id: (1, price)})
+        conn.commit()
+
+        product_id = cur.lastrowid
+        mark_user_write(user_id)
+        resource_versions.bump('products')
+        query_cache.invalidate('category_stats', 'price_bucket_stats', f"product:user:{user_id}")
+        event_broker.publish('product_published', {
+            "product_id": product_id,
+            "product_name": product_name,
+            "price": price,
+            "category_id": category_id,
+            "category_name": category_name(cur, category_id),
+            "seller_id": user_id
+        })
+        publish_stats_delta(cur, {category_id: 1}, {price_bucket(price): 1})
+        if CATALOG_INDEX_ENABLED:
+            try:
+                catalog_index.refresh_product(cur, product_id)
+            except Exception:
+                print(f"更新商品目录索引异常：{traceback.format_exc()}")
+        return json_response({
+            "code": 200,
+            "success": True,
+            "message": "发布成功",
+            "product_id": product_id
+        })
+
+    except Exception as e:
+        conn.rollback()
+        print(f"发布商品异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "发布失败"}, 500)
+    finally:
+        close_db_resource(conn, cur)
+
+
+@app.route('/api/upload_image', methods=['POST'])
+def upload_image():
+    """上传商品图片
+
+    请求体为图片原始字节（Content-Type: image/*），或multipart表单的image字段。
+    原图同步写盘后立即返回，缩略图在后台进程池中生成，生成前访问缩略图URL会返回原图。
+    """
+    if request.content_length is not None and request.content_length > IMAGE_MAX_BYTES + 64 * 1024:
+        return json_response({"code": 413, "success": False,
+                              "message": f"图片不能超过{IMAGE_MAX_BYTES // (1024 * 1024)}MB"}, 413)
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        if upload is None:
+            return json_response({"code": 400, "success": False, "message": "缺少image字段"}, 400)
+        stream = upload.stream
+    else:
+        stream = request.stream
+
+    try:
+        image, error = store_image(stream)
+    except OSError:
+        print(f"保存图片异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "保存图片失败"}, 500)
+    if error:
+        return json_response({"code": 400, "success": False, "message": error}, 400)
+
+    digest, ext = IMAGE_NAME.match(image['id']).groups()
+    image['thumbnails_ready'] = thumbnail_pipeline.submit(digest, ext) is None and Image is not None
+    return json_response({"code": 200, "success": True, "image": image})
+
+
+@app.route('/media/<kind>/<shard>/<filename>', methods=['GET'])
+def serve_media(kind, shard, filename):
+    """图片与缩略图：URL由内容哈希决定、内容永不改变，长期缓存"""
+    match = IMAGE_NAME.fullmatch(filename)
+    if not match or shard != filename[:2] or (kind != 'original' and kind not in IMAGE_THUMB_SIZES):
+        return json_response({"code": 404, "message": "文件不存在"}, 404)
+    digest, ext = match.groups()
+
+    path = image_path(kind, digest, ext)
+    immutable = True
+    if kind != 'original' and not os.path.exists(path):
+        # 缩略图还在生成：稍等片刻，仍未完成则先返回原图，且不让客户端缓存
+        thumbnail_pipeline.wait(digest, IMAGE_THUMB_WAIT)
+        if not os.path.exists(path):
+            originals = [image_path('original', digest, e) for e in IMAGE_MIMETYPES]
+            path = next((p for p in originals if os.path.exists(p)), None)
+            immutable = False
+            if path is None:
+                return json_response({"code": 404, "message": "文件不存在"}, 404)
+    elif not os.path.exists(path):
+        return json_response({"code": 404, "message": "文件不存在"}, 404)
+
+    response = send_file(path, mimetype=IMAGE_MIMETYPES[os.path.splitext(path)[1]],
+                         etag=f"{digest}-{kind}" if immutable else False, conditional=True)
+    if immutable:
+        response.headers['Cache-Control'] = f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers['Cache-Control'] = "no-store"
+    return response
+
+
+@app.route('/api/bulk_publish', methods=['POST'])
+def bulk_publish():
+    """批量发布商品，请求体为流式读取的JSON数组、NDJSON或CSV
+
+    格式由?format=指定，缺省按Content-Type判断；batch_size控制每批插入与提交的行数。
+    """
+    fmt = request.args.get('format', '')
+    if not fmt:
+        mimetype = request.mimetype or ''
+        fmt = 'csv' if 'csv' in mimetype else 'ndjson' if 'ndjson' in mimetype else 'json'
+    if fmt not in IMPORT_PARSERS:
+        return json_response({"code": 400, "success": False, "message": "format仅支持json、ndjson或csv"}, 400)
+
+    batch_size = request.args.get('batch_size', '')
+    if batch_size:
+        if not batch_size.isdigit() or int(batch_size) <= 0:
+            return json_response({"code": 400, "success": False, "message": "batch_size必须为正整数"}, 400)
+        batch_size = min(int(batch_size), IMPORT_BATCH_SIZE_MAX)
+    else:
+        batch_size = IMPORT_BATCH_SIZE
 
     conn = get_db_connection()
     if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
+        return db_unavailable_response()
 
-    cur = None
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO product (product_name, price, description, category_id, user_id, 
-                               status, publish_time, view_count) 
-            VALUES (%s, %s, %s, %s, %s, 1, NOW(), 0)
-        """, (product_name, price, description, category_id, user_id))
-        conn.commit()
-
-        product_id = cur.lastrowid
-        return json_response({
-            "code": 200,
-            "success": True,
-            "message": "发布成功",
-            "product_id": product_id
-        })
-
+        result = bulk_publish_products(conn, IMPORT_PARSERS[fmt](request.stream), batch_size)
+        return json_response({"code": 200, "success": True, "message": "导入完成", **result})
     except Exception as e:
         conn.rollback()
-        print(f"发布商品异常：{traceback.format_exc()}")
-        return json_response({"code": 500, "success": False, "message": "发布失败"}, 500)
+        print(f"批量发布异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "导入失败"}, 500)
     finally:
-        close_db_resource(conn, cur)
+        close_db_resource(conn, None)
 
 
 @app.route('/api/categories', methods=['GET'])
+@conditional_get(('categories',))
 def get_categories():
     """获取所有商品类别"""
-    conn = get_db_connection()
-    if not conn:
-        return json_response({
-            "categories": [
-                {"category_id": 1, "category_name": "书籍"},
-                {"category_id": 2, "category_name": "电子产品"},
-                {"category_id": 3, "category_name": "生活用品"},
-                {"category_id": 4, "category_name": "服饰"},
-                {"category_id": 5, "category_name": "其他"}
-            ]
-        })
-
-    cur = None
     try:
-        cur = conn.cursor(MySQLdb.cursors.DictCursor)
-        cur.execute("SELECT category_id, category_name, description FROM category ORDER BY category_name")
-        categories = cur.fetchall()
+        # 类别没有写接口，只靠有效期刷新
+        categories = query_cache.fetchall(
+            "SELECT category_id, category_name, description FROM category ORDER BY category_name",
+            tags=('category',), ttl=300, dict_rows=True)
 
         return json_response({
             "code": 200,
@@ -420,19 +4429,11 @@ def get_categories():
             "categories": categories
         })
 
+    except DatabaseUnavailable:
+        return db_unavailable_response()
     except Exception as e:
         print(f"获取类别异常：{traceback.format_exc()}")
-        return json_response({
-            "categories": [
-                {"category_id": 1, "category_name": "书籍"},
-                {"category_id": 2, "category_name": "电子产品"},
-                {"category_id": 3, "category_name": "生活用品"},
-                {"category_id": 4, "category_name": "服饰"},
-                {"category_id": 5, "category_name": "其他"}
-            ]
-        })
-    finally:
-        close_db_resource(conn, cur)
+        return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
 
 
 @app.route('/api/toggle_favorite', methods=['POST'])
@@ -447,15 +4448,29 @@ def toggle_favorite():
 
     if not user_id or not product_id:
         return json_response({"code": 400, "success": False, "message": "参数不完整"}, 400)
+    try:
+        user_id = int(user_id)
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        return json_response({"code": 400, "success": False, "message": "参数格式错误"}, 400)
 
     conn = get_db_connection()
     if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
+        return db_unavailable_response()
 
     cur = None
     try:
         cur = conn.cursor()
 
+        # 先锁住商品行：同一商品的收藏操作串行执行，检查与增减收藏数之间不会插入其他事务。
+        # 与下单一致先锁product再写子表，避免插入favorites时的外键共享锁升级为排他锁而死锁
+        cur.execute("SELECT user_id FROM product WHERE product_id=%s FOR UPDATE", (product_id,))
+        product = cur.fetchone()
+        if not product:
+            conn.rollback()
+            return json_response({"code": 404, "success": False, "message": "商品不存在"}, 404)
+        seller_id = product[0]
+
         # 检查是否已收藏
         cur.execute("SELECT favorite_id FROM favorites WHERE user_id=%s AND product_id=%s",
                     (user_id, product_id))
@@ -467,14 +4482,24 @@ def toggle_favorite():
                         (user_id, product_id))
             message = "已取消收藏"
             is_favorite = False
+            delta = -1
         else:
             # 添加收藏
             cur.execute("INSERT INTO favorites (user_id, product_id) VALUES (%s, %s)",
                         (user_id, product_id))
             message = "收藏成功"
             is_favorite = True
+            delta = 1
+        cur.execute("UPDATE product SET favorite_count = GREATEST(favorite_count + %s, 0) WHERE product_id=%s",
+                    (delta, product_id))
 
         conn.commit()
+        mark_user_write(user_id)
+        resource_versions.bump('favorites')
+        favorite_cache.invalidate(user_id)
+        query_cache.invalidate(f"favorites:user:{user_id}", f"product:user:{seller_id}")
+        if CATALOG_INDEX_ENABLED:
+            catalog_index.add_favorite(product_id, delta)
         return json_response({
             "code": 200,
             "success": True,
@@ -493,14 +4518,9 @@ def toggle_favorite():
 @app.route('/api/user_favorites/<int:user_id>', methods=['GET'])
 def user_favorites(user_id):
     """获取用户收藏列表"""
-    conn = get_db_connection()
-    if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
-
-    cur = None
     try:
-        cur = conn.cursor(MySQLdb.cursors.DictCursor)
-        cur.execute("""
+        # 随该用户的收藏操作与商品售出失效
+        favorites = query_cache.fetchall("""
             SELECT 
                 p.product_id,
                 p.product_name,
@@ -513,9 +4533,8 @@ def user_favorites(user_id):
             JOIN category c ON p.category_id = c.category_id
             WHERE f.user_id = %s AND p.status = 1
             ORDER BY f.created_at DESC
-        """, (user_id,))
+        """, (user_id,), tags=(f"favorites:user:{user_id}", 'product_status'), dict_rows=True, user_id=user_id)
 
-        favorites = cur.fetchall()
         return json_response({
             "code": 200,
             "success": True,
@@ -523,11 +4542,11 @@ def user_favorites(user_id):
             "count": len(favorites)
         })
 
+    except DatabaseUnavailable:
+        return db_unavailable_response()
     except Exception as e:
         print(f"获取收藏列表异常：{traceback.format_exc()}")
         return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
-    finally:
-        close_db_resource(conn, cur)
 
 
 @app.route('/api/create_order', methods=['POST'])
@@ -543,50 +4562,74 @@ def create_order():
     if not product_id or not buyer_id:
         return json_response({"code": 400, "success": False, "message": "参数不完整"}, 400)
 
+    try:
+        product_id = int(product_id)
+        buyer_id = int(buyer_id)
+    except (TypeError, ValueError):
+        return json_response({"code": 400, "success": False, "message": "参数格式错误"}, 400)
+
     conn = get_db_connection()
     if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
+        return db_unavailable_response()
 
     cur = None
     try:
         cur = conn.cursor()
+        for attempt in range(ORDER_MAX_RETRIES + 1):
+            try:
+                # 检查商品是否存在
+                cur.execute("SELECT user_id, price, product_name, category_id FROM product WHERE product_id=%s AND status=1",
+                            (product_id,))
+                product = cur.fetchone()
 
-        # 检查商品是否存在
-        cur.execute("SELECT user_id, price, product_name FROM product WHERE product_id=%s AND status=1",
-                    (product_id,))
-        product = cur.fetchone()
-
-        if not product:
-            return json_response({"code": 404, "success": False, "message": "商品不存在或已售出"}, 404)
+                if not product:
+                    return json_response({"code": 404, "success": False, "message": "商品不存在或已售出"}, 404)
 
-        seller_id, price, product_name = product
+                seller_id, price, product_name, category_id = product
 
-        # 不能购买自己的商品
-        if seller_id == buyer_id:
-            return json_response({"code": 400, "success": False, "message": "不能购买自己的商品"}, 400)
+                # 不能购买自己的商品
+                if seller_id == buyer_id:
+                    return json_response({"code": 400, "success": False, "message": "不能购买自己的商品"}, 400)
 
-        # 检查是否已有未完成的订单
-        cur.execute("SELECT order_id FROM orders WHERE product_id=%s AND status IN (1,2,3)",
-                    (product_id,))
-        existing_order = cur.fetchone()
-        if existing_order:
-            return json_response({"code": 400, "success": False, "message": "该商品已有未完成的订单"}, 400)
+                # 原子占用商品：仅当仍在售且没有未完成订单时置为已售出，由受影响行数判断是否抢到。
+                # 并发买家在该行锁上排队，前者提交后后者读到status=0直接失败，不会产生重复订单
+                cur.execute("""
+                    UPDATE product SET status=0
+                    WHERE product_id=%s AND status=1
+                      AND NOT EXISTS (SELECT 1 FROM orders WHERE product_id=%s AND status IN (1,2,3))
+                """, (product_id, product_id))
+                if cur.rowcount == 0:
+                    conn.rollback()
+                    return json_response({"code": 409, "success": False, "message": "商品已售出或已有未完成的订单"}, 409)
 
-        # 创建订单
-        cur.execute("""
-            INSERT INTO orders (product_id, buyer_id, seller_id, price, order_time, status) 
-            VALUES (%s, %s, %s, %s, NOW(), 1)
-        """, (product_id, buyer_id, seller_id, price))
+                # 创建订单
+                cur.execute("""
+                    INSERT INTO orders (product_id, buyer_id, seller_id, price, order_time, status) 
+                    VALUES (%s, %s, %s, %s, NOW(), 1)
+                """, (product_id, buyer_id, seller_id, price))
+                order_id = cur.lastrowid
+                update_product_stats(cur, category_id, price, -1)
+                apply_trend_stats(cur, 'order', {category_id: (1, price)})
 
-        # 更新商品状态为已售出
-        cur.execute("UPDATE product SET status=0 WHERE product_id=%s", (product_id,))
+                conn.commit()
+                break
+            except MySQLdb.MySQLError as e:
+                conn.rollback()
+                if not is_lock_conflict(e) or attempt == ORDER_MAX_RETRIES:
+                    raise
+                time.sleep(ORDER_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
 
-        conn.commit()
+        resource_versions.bump('products')
+        query_cache.invalidate('category_stats', 'price_bucket_stats', 'product_status', f"product:user:{seller_id}")
+        event_broker.publish('product_sold', {"product_id": product_id, "category_id": category_id})
+        publish_stats_delta(cur, {category_id: -1}, {price_bucket(price): -1})
+        if CATALOG_INDEX_ENABLED:
+            catalog_index.remove(product_id)
         return json_response({
             "code": 200,
             "success": True,
             "message": "下单成功",
-            "order_id": cur.lastrowid,
+            "order_id": order_id,
             "product_name": product_name,
             "price": price
         })
@@ -600,26 +4643,17 @@ def create_order():
 
 
 @app.route('/api/hot_categories', methods=['GET'])
+@conditional_get(('products',))
 def hot_categories():
     """热门商品类别统计"""
-    conn = get_db_connection()
-    if not conn:
-        return json_response({
-            "categories": ["书籍", "电子产品", "生活用品", "服饰", "其他"],
-            "counts": [15, 10, 8, 5, 3]
-        })
-
-    cur = None
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT c.category_name, COUNT(p.product_id) as count
+        # 读取增量维护的汇总表，行数与类别数成正比
+        rows = query_cache.fetchall("""
+            SELECT c.category_name, COALESCE(s.on_sale_count, 0) as count
             FROM category c
-            LEFT JOIN product p ON c.category_id = p.category_id AND p.status = 1
-            GROUP BY c.category_id, c.category_name
+            LEFT JOIN category_stats s ON c.category_id = s.category_id
             ORDER BY count DESC
-        """)
-        rows = cur.fetchall()
+        """, tags=('category', 'category_stats'))
 
         categories = []
         counts = []
@@ -631,79 +4665,203 @@ def hot_categories():
             "categories": categories,
             "counts": counts
         })
+    except DatabaseUnavailable:
+        return db_unavailable_response()
     except Exception as e:
         print(f"热门类别查询异常：{traceback.format_exc()}")
-        return json_response({
-            "categories": ["书籍", "电子产品", "生活用品"],
-            "counts": [15, 10, 8]
-        })
-    finally:
-        close_db_resource(conn, cur)
+        return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
 
 
 @app.route('/api/price_distribution', methods=['GET'])
+@conditional_get(('products',))
 def price_distribution():
     """价格分布统计"""
-    conn = get_db_connection()
-    if not conn:
-        return json_response({
-            "price_ranges": ["0-50元", "51-100元", "101-200元", "201-500元", "501元以上"],
-            "counts": [20, 15, 10, 5, 2]
-        })
-
-    cur = None
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT 
-                CASE 
-                    WHEN price <= 50 THEN '0-50元'
-                    WHEN price <= 100 THEN '51-100元'
-                    WHEN price <= 200 THEN '101-200元'
-                    WHEN price <= 500 THEN '201-500元'
-                    ELSE '501元以上'
-                END as price_range,
-                COUNT(*) as count
-            FROM product
-            WHERE status = 1
-            GROUP BY price_range
-            ORDER BY 
-                CASE price_range
-                    WHEN '0-50元' THEN 1
-                    WHEN '51-100元' THEN 2
-                    WHEN '101-200元' THEN 3
-                    WHEN '201-500元' THEN 4
-                    ELSE 5
-                END
-        """)
-        rows = cur.fetchall()
+        # 读取增量维护的汇总表，行数与价格区间数成正比
+        bucket_counts = dict(query_cache.fetchall(
+            "SELECT bucket_id, on_sale_count FROM price_bucket_stats WHERE on_sale_count > 0",
+            tags=('price_bucket_stats',)))
 
         price_ranges = []
         counts = []
-        for row in rows:
-            price_ranges.append(row[0])
-            counts.append(row[1])
+        for bucket_id, _, label in PRICE_BUCKETS:
+            if bucket_id in bucket_counts:
+                price_ranges.append(label)
+                counts.append(bucket_counts[bucket_id])
 
         return json_response({
             "price_ranges": price_ranges,
             "counts": counts
         })
+    except DatabaseUnavailable:
+        return db_unavailable_response()
     except Exception as e:
         print(f"价格分布查询异常：{traceback.format_exc()}")
-        return json_response({
-            "price_ranges": ["0-50元", "51-100元", "101元以上"],
-            "counts": [20, 15, 5]
-        })
+        return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
+
+
+@app.route('/api/stats/trends', methods=['GET'])
+@conditional_get(('products',))
+def stats_trends():
+    """发布量、订单量/成交额与完成订单趋势
+
+    参数：granularity=day|week|month（默认day），from/to为YYYY-MM-DD（含，to默认今天，
+    from默认往前TRENDS_DEFAULT_BUCKETS个桶），category_id可选。读取按天、类别预聚合的
+    daily_stats，扫描行数只与时间范围内的天数和类别数有关，不随商品/订单总量增长。
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in TREND_BUCKET_SQL:
+        return json_response({"code": 400, "success": False, "message": "granularity应为day、week或month"}, 400)
+    try:
+        to_arg = request.args.get('to')
+        from_arg = request.args.get('from')
+        end = datetime.strptime(to_arg, '%Y-%m-%d').date() if to_arg else date.today()
+        last = trend_bucket_start(end, granularity)
+        if from_arg:
+            first = trend_bucket_start(datetime.strptime(from_arg, '%Y-%m-%d').date(), granularity)
+        else:
+            first = shift_trend_bucket(last, granularity, 1 - TRENDS_DEFAULT_BUCKETS[granularity])
+        category_id = request.args.get('category_id', type=int)
+    except ValueError:
+        return json_response({"code": 400, "success": False, "message": "日期格式错误，应为YYYY-MM-DD"}, 400)
+    if first > last:
+        return json_response({"code": 400, "success": False, "message": "from不能晚于to"}, 400)
+
+    buckets = [first]
+    while buckets[-1] < last:
+        if len(buckets) >= TRENDS_MAX_BUCKETS:
+            return json_response({"code": 400, "success": False,
+                                  "message": f"时间范围过大，最多{TRENDS_MAX_BUCKETS}个{granularity}"}, 400)
+        buckets.append(shift_trend_bucket(buckets[-1], granularity, 1))
+
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return db_unavailable_response()
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        columns = [col for cols in TREND_METRICS.values() for col in cols]
+        sql = f"""
+            SELECT {TREND_BUCKET_SQL[granularity]} AS bucket, {', '.join(f'SUM({c})' for c in columns)}
+            FROM daily_stats
+            WHERE stat_date BETWEEN %s AND %s
+        """
+        args = [first, end]
+        if category_id is not None:
+            sql += " AND category_id = %s"
+            args.append(category_id)
+        cur.execute(sql + " GROUP BY bucket", args)
+        totals = {row[0]: row[1:] for row in cur.fetchall()}
+
+        empty = (0,) * len(columns)
+        series = list(zip(*(totals.get(bucket, empty) for bucket in buckets)))
+        data = {"granularity": granularity, "dates": buckets}
+        for column, values in zip(columns, series):
+            data[column + 's'] = [v or 0 for v in values]
+        return json_response(data)
+    except Exception as e:
+        print(f"趋势查询异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
     finally:
         close_db_resource(conn, cur)
 
 
+@app.route('/api/stream', methods=['GET'])
+def event_stream():
+    """Server-Sent Events推送：新商品发布、商品售出与类别/价格区间在售数变化
+
+    ?types=product_published,product_sold 只订阅指定事件；断线重连时浏览器自动带上Last-Event-ID补发。
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    types = set(filter(None, request.args.get('types', '').split(',')))
+
+    last_id = event_broker.subscribe(last_event_id, SSE_MAX_CONNECTIONS)
+    if last_id is None:
+        response = json_response({"code": 503, "success": False, "message": "推送连接数已满，请稍后重试"}, 503)
+        response.headers['Retry-After'] = str(SSE_RETRY_MS // 1000 or 1)
+        return response
+
+    def generate(last_id):
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n".encode('utf-8')
+            while True:
+                result = event_broker.read(last_id, SSE_HEARTBEAT_INTERVAL)
+                if result is None:
+                    return
+                last_id, events = result
+                if not events:
+                    yield b": ping\n\n"
+                    continue
+                chunk = b''.join(message for event_type, message in events
+                                 if not types or event_type in types or event_type == 'reset')
+                # 全部被过滤时只发送id字段（浏览器不派发事件但会记下ID），避免重连时从更早的位置补发
+                yield chunk or f"id: {last_id}\n\n".encode('utf-8')
+        finally:
+            event_broker.unsubscribe()
+
+    response = Response(generate(last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 关闭nginx代理缓冲，事件即时下发
+    return response
+
+
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    """流式导出product/orders/favorites表，支持CSV/NDJSON、增量导出与gzip压缩"""
+    fmt = request.args.get('format', 'csv')
+    since_arg = request.args.get('since', '')
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    if table not in EXPORT_TABLES:
+        return json_response({"code": 404, "success": False, "message": "不支持导出该表"}, 404)
+    if fmt not in EXPORT_ENCODERS:
+        return json_response({"code": 400, "success": False, "message": "format仅支持csv或ndjson"}, 400)
+    since = None
+    if since_arg:
+        since = parse_since(since_arg)
+        if since is None:
+            return json_response({"code": 400, "success": False, "message": "since时间格式错误"}, 400)
+
+    conn = get_db_connection()
+    if not conn:
+        return db_unavailable_response()
+
+    stream = export_stream(conn, table, fmt, since, compress)
+    try:
+        first = next(stream)
+    except StopIteration:
+        # 没有任何行时NDJSON编码器不产出数据，返回空文件
+        first = b''
+    except Exception as e:
+        print(f"导出异常：{traceback.format_exc()}")
+        return json_response({"code": 500, "success": False, "message": "导出失败"}, 500)
+
+    filename = f"{table}.{fmt}" + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else EXPORT_ENCODERS[fmt][1]
+    def body():
+        # 客户端断开时WSGI服务器会close()响应体，需要转交给导出生成器以归还连接
+        try:
+            yield first
+            yield from stream
+        finally:
+            stream.close()
+
+    response = Response(body(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @app.route('/api/debug/tables', methods=['GET'])
 def debug_tables():
     """数据库诊断接口"""
     conn = get_db_connection()
     if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
+        return db_unavailable_response()
 
     cur = None
     try:
@@ -740,30 +4898,119 @@ def debug_tables():
         close_db_resource(conn, cur)
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus文本格式的监控指标"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/debug/slow_queries', methods=['GET'])
+def debug_slow_queries():
+    """最近的慢查询"""
+    return json_response({
+        "code": 200,
+        "success": True,
+        "threshold_ms": SLOW_QUERY_THRESHOLD * 1000,
+        "data": list(slow_query_log)
+    })
+
+
+@app.route('/api/debug/pool', methods=['GET'])
+def debug_pool():
+    """连接池与只读副本状态"""
+    pool = _db_pool or init_db_pool()
+    return json_response({
+        "code": 200,
+        "success": True,
+        "data": pool.stats(),
+        "replication": _replica_router.stats() if _replica_router is not None else None
+    })
+
+
+@app.route('/api/debug/catalog', methods=['GET'])
+def debug_catalog():
+    """商品目录内存索引状态"""
+    return json_response({
+        "code": 200,
+        "success": True,
+        "data": catalog_index.stats()
+    })
+
+
+@app.route('/api/debug/stream', methods=['GET'])
+def debug_stream():
+    """实时推送状态"""
+    return json_response({
+        "code": 200,
+        "success": True,
+        "data": event_broker.stats()
+    })
+
+
+@app.route('/api/debug/images', methods=['GET'])
+def debug_images():
+    """缩略图生成状态"""
+    return json_response({
+        "code": 200,
+        "success": True,
+        "data": thumbnail_pipeline.stats()
+    })
+
+
+@app.route('/api/debug/query_cache', methods=['GET'])
+def debug_query_cache():
+    """查询结果缓存命中情况"""
+    return json_response({
+        "code": 200,
+        "success": True,
+        "data": query_cache.stats()
+    })
+
+
+@app.route('/api/debug/admission', methods=['GET'])
+def debug_admission():
+    """限流与并发控制状态"""
+    return json_response({
+        "code": 200,
+        "success": True,
+        "data": admission.stats()
+    })
+
+
+@app.route('/api/debug/recommendations', methods=['GET'])
+def debug_recommendations():
+    """相似商品模型状态"""
+    return json_response({
+        "code": 200,
+        "success": True,
+        "data": similar_products.stats()
+    })
+
+
+@app.route('/api/debug/static', methods=['GET'])
+def debug_static():
+    """静态资源清单状态"""
+    return json_response({
+        "code": 200,
+        "success": True,
+        "data": static_manifest.stats()
+    })
+
+
 @app.route('/api/user_products/<int:user_id>', methods=['GET'])
 def user_products(user_id):
     """获取用户发布的商品"""
-    conn = get_db_connection()
-    if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
-
-    cur = None
     try:
-        cur = conn.cursor(MySQLdb.cursors.DictCursor)
-        cur.execute("""
-            SELECT 
-                p.*,
-                c.category_name,
-                COUNT(DISTINCT f.favorite_id) as favorite_count
+        # favorite_count为toggle_favorite维护的冗余计数，按idx_user读取卖家的商品，无需聚合favorites。
+        # 随该卖家的发布、售出与其商品被收藏失效
+        products = query_cache.fetchall("""
+            SELECT p.*, c.category_name
             FROM product p
             JOIN category c ON p.category_id = c.category_id
-            LEFT JOIN favorites f ON p.product_id = f.product_id
             WHERE p.user_id = %s
-            GROUP BY p.product_id
             ORDER BY p.publish_time DESC
-        """, (user_id,))
+        """, (user_id,), tags=(f"product:user:{user_id}",), dict_rows=True, user_id=user_id)
 
-        products = cur.fetchall()
         return json_response({
             "code": 200,
             "success": True,
@@ -771,31 +5018,43 @@ def user_products(user_id):
             "count": len(products)
         })
 
+    except DatabaseUnavailable:
+        return db_unavailable_response()
     except Exception as e:
         print(f"获取用户商品异常：{traceback.format_exc()}")
         return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
-    finally:
-        close_db_resource(conn, cur)
 
 
 @app.route('/api/check_favorite/<int:user_id>/<int:product_id>', methods=['GET'])
 def check_favorite(user_id, product_id):
     """检查是否已收藏"""
-    conn = get_db_connection()
+    favorited = favorite_cache.get(user_id)
+    if favorited is not None:
+        return json_response({
+            "code": 200,
+            "success": True,
+            "is_favorite": product_id in favorited
+        })
+
+    conn = get_db_connection(read_only=True, user_id=user_id)
     if not conn:
-        return json_response({"code": 500, "success": False, "message": "数据库连接失败"}, 500)
+        return db_unavailable_response()
 
     cur = None
     try:
         cur = conn.cursor()
-        cur.execute("SELECT favorite_id FROM favorites WHERE user_id=%s AND product_id=%s",
-                    (user_id, product_id))
-        existing = cur.fetchone()
+        favorited = load_favorite_set(cur, user_id)
+        if favorited is not None:
+            is_favorite = product_id in favorited
+        else:
+            cur.execute("SELECT favorite_id FROM favorites WHERE user_id=%s AND product_id=%s",
+                        (user_id, product_id))
+            is_favorite = cur.fetchone() is not None
 
         return json_response({
             "code": 200,
             "success": True,
-            "is_favorite": existing is not None
+            "is_favorite": is_favorite
         })
 
     except Exception as e:
@@ -805,15 +5064,330 @@ def check_favorite(user_id, product_id):
         close_db_resource(conn, cur)
 
 
+@app.route('/api/check_favorites', methods=['POST'])
+def check_favorites():
+    """批量检查收藏状态，返回product_ids中已收藏的子集"""
+    if not request.is_json:
+        return json_response({"code": 400, "success": False, "message": "请求格式错误"}, 400)
+
+    data = request.json
+    user_id = data.get('user_id')
+    product_ids = data.get('product_ids')
+
+    if not user_id or not isinstance(product_ids, list):
+        return json_response({"code": 400, "success": False, "message": "参数不完整"}, 400)
+    try:
+        user_id = int(user_id)
+        product_ids = list(dict.fromkeys(int(pid) for pid in product_ids))
+    except (TypeError, ValueError):
+        return json_response({"code": 400, "success": False, "message": "参数格式错误"}, 400)
+    if len(product_ids) > FAVORITE_BATCH_MAX:
+        return json_response({"code": 400, "success": False,
+                              "message": f"一次最多查询{FAVORITE_BATCH_MAX}个商品"}, 400)
+    if not product_ids:
+        return json_response({"code": 200, "success": True, "favorites": []})
+
+    favorited = favorite_cache.get(user_id)
+    if favorited is None:
+        conn = get_db_connection()
+        if not conn:
+            return db_unavailable_response()
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            favorited = load_favorite_set(cur, user_id)
+            if favorited is None:
+                # 收藏过多不缓存时，走(user_id, product_id)唯一索引的一次IN查询
+                placeholders = ', '.join(['%s'] * len(product_ids))
+                cur.execute(f"SELECT product_id FROM favorites WHERE user_id=%s AND product_id IN ({placeholders})",
+                            [user_id] + product_ids)
+                favorited = {row[0] for row in cur.fetchall()}
+        except Exception as e:
+            print(f"批量检查收藏异常：{traceback.format_exc()}")
+            return json_response({"code": 500, "success": False, "message": "查询失败"}, 500)
+        finally:
+            close_db_resource(conn, cur)
+
+    return json_response({
+        "code": 200,
+        "success": True,
+        "favorites": [pid for pid in product_ids if pid in favorited]
+    })
+
+
 # ==================== 启动服务器 ====================
+_services_started = False
+
+
+def init_services(maintenance=True):
+    """预热连接池、加载内存索引并启动后台任务
+
+    maintenance=False时不启动汇总表重算、收藏数对账这类只写数据库的维护任务，
+    多进程部署下它们只在一个工作进程中运行，避免每个进程重复执行。
+    """
+    init_db_pool()
+    init_replica_router()
+    init_catalog_index()
+    if maintenance:
+        init_product_stats()
+        init_trend_stats()
+        init_favorite_counts()
+    init_similar_products()
+    init_view_counter()
+    init_static_assets()
+    atexit.register(event_broker.close)
+
+
+def create_app(maintenance=None):
+    """返回完成预热的应用，多次调用只预热一次
+
+    供其他WSGI服务器在各工作进程中调用（不要预加载），如：gunicorn -w 4 --threads 16 'app:create_app()'
+    未指定maintenance时由环境变量APP_MAINTENANCE决定、默认不启动写库的维护任务：各工作进程看到的环境变量相同，
+    打开它会让每个进程都重复执行，应只在一个单独的实例（如 APP_MAINTENANCE=1 python app.py）中打开。
+    """
+    global _services_started
+    if maintenance is None:
+        maintenance = env('APP_MAINTENANCE', False)
+    if not _services_started:
+        _services_started = True
+        init_services(maintenance)
+    return app
+
+
+def shutdown_services():
+    """结束推送连接、停止后台任务、写回缓冲的浏览量并关闭连接池
+
+    工作进程以os._exit退出，不会执行atexit注册的清理，需显式调用。
+    """
+    event_broker.close()
+    stop_background_jobs()
+    view_counter.flush()
+    thumbnail_pipeline.shutdown()
+    if _replica_router is not None:
+        _replica_router.close_all()
+    if _db_pool is not None:
+        _db_pool.close_all()
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # 每个请求后关闭连接：空闲的keep-alive连接会一直占用线程池中的线程
+    protocol_version = 'HTTP/1.0'
+    timeout = SERVER_REQUEST_TIMEOUT
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """在已监听的套接字上接受连接，交给固定大小的线程池处理，并跟踪进行中的连接以便停止时排空
+
+    进程内最多持有threads + queue_size个连接，满了之后新连接在accept线程上直接收到503并关闭，
+    不进入Flask、不占用处理线程，客户端按Retry-After稍后重试，而不是在队列里等到超时。
+    """
+    multithread = True
+    overload_body = dumps_json({"code": 503, "success": False, "message": "服务繁忙，请稍后重试"})
+    overload_response = (
+        f"HTTP/1.0 503 Service Unavailable\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(overload_body)}\r\n"
+        f"Retry-After: {ADMISSION_RETRY_AFTER}\r\n"
+        f"Connection: close\r\n\r\n"
+    ).encode('ascii') + overload_body
+
+    def __init__(self, listener, threads, queue_size):
+        super().__init__(SERVER_HOST, SERVER_PORT, app, handler=_RequestHandler, fd=listener.fileno())
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+        self._slots = threading.BoundedSemaphore(threads + queue_size)
+        self._stopping = False
+        self._active = 0
+        self._active_cond = threading.Condition()
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            if not self._stopping:
+                self._reject(request)
+            self.shutdown_request(request)
+            return
+        with self._active_cond:
+            self._active += 1
+        self.executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+            with self._active_cond:
+                self._active -= 1
+                self._active_cond.notify_all()
+
+    def _reject(self, request):
+        REJECTED_REQUESTS.inc(1, 'accept', 'overload')
+        try:
+            # 在accept线程上发送，设置超时以免不读数据的客户端卡住accept循环
+            request.settimeout(1)
+            request.sendall(self.overload_response)
+        except OSError:
+            pass
+
+    def stop_accepting(self):
+        self._stopping = True
+        self.shutdown()
+        self.server_close()
+
+    def drain(self, timeout):
+        """等待进行中的请求完成，超时返回False"""
+        deadline = time.monotonic() + timeout
+        with self._active_cond:
+            while self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._active_cond.wait(remaining)
+        self.executor.shutdown(wait=False)
+        return True
+
+
+class GeventWorkerServer:
+    """gevent协程模式的工作进程服务器，每个连接一个协程，适合大量空闲的推送连接"""
+
+    def __init__(self, listener):
+        from gevent.pywsgi import WSGIServer
+
+        self.server = WSGIServer(listener, app)
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop_accepting(self):
+        self.server.stop_accepting()
+
+    def drain(self, timeout):
+        # stop()等待进行中的连接至多timeout秒，之后强制结束
+        self.server.stop(timeout)
+        return True
+
+
+def run_worker(listener, index):
+    """工作进程：预热本进程的连接池、内存索引与缓存，处理请求直到收到SIGTERM/SIGINT后排空退出
+
+    index为0的工作进程同时负责写数据库的维护任务。返回进程退出码。
+    """
+    global SSE_MAX_CONNECTIONS
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+    # fork出的进程继承了主进程的随机数状态，重新播种使重试抖动等在各进程间错开
+    random.seed()
+
+    if os.environ.get('APP_SERVER') == 'gevent':
+        server = GeventWorkerServer(listener)
+    else:
+        server = PooledWSGIServer(listener, SERVER_THREADS, SERVER_QUEUE_SIZE)
+        # 推送连接在线程模式下各占一个线程，最多占用一半线程，避免普通请求无线程可用
+        SSE_MAX_CONNECTIONS = min(SSE_MAX_CONNECTIONS, max(1, SERVER_THREADS // 2))
+    create_app(maintenance=(index == 0))
+    accept_thread = threading.Thread(target=server.serve_forever, name='http-accept', daemon=True)
+    accept_thread.start()
+    print(f"工作进程#{index}（pid {os.getpid()}）已就绪")
+
+    stopping.wait()
+    print(f"工作进程#{index}停止接收新连接，等待进行中的请求完成...")
+    server.stop_accepting()
+    listener.close()
+    # 先结束推送长连接，否则它们会一直占着排空等待
+    event_broker.close()
+    drained = server.drain(SERVER_SHUTDOWN_TIMEOUT)
+    if not drained:
+        print(f"工作进程#{index}等待超时，仍有请求未完成")
+    shutdown_services()
+    return 0 if drained else 1
+
+
+def serve():
+    """多进程服务入口：主进程监听端口后fork出工作进程，工作进程异常退出时重新拉起
+
+    收到SIGTERM/SIGINT时转发给工作进程，等待它们排空后退出，超过SERVER_SHUTDOWN_TIMEOUT仍未退出的强制结束。
+    不支持fork的平台或只配置一个工作进程时，在当前进程中直接运行。
+    """
+    family = socket.AF_INET6 if ':' in SERVER_HOST else socket.AF_INET
+    listener = socket.create_server((SERVER_HOST, SERVER_PORT), family=family, backlog=SERVER_BACKLOG)
+    if SERVER_WORKERS <= 1 or not hasattr(os, 'fork'):
+        return run_worker(listener, 0)
+
+    workers = {}  # pid -> 工作进程序号
+    stopping = False
+    kill_at = None
+
+    def spawn(index):
+        sys.stdout.flush()  # 避免fork后子进程重复输出主进程缓冲区中的内容
+        pid = os.fork()
+        if pid == 0:
+            # 子进程在run_worker换上自己的信号处理之前，沿用的主进程处理函数不应再向兄弟进程发信号
+            workers.clear()
+            code = 1
+            try:
+                code = run_worker(listener, index)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        workers[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping, kill_at
+        if not stopping:
+            stopping = True
+            kill_at = time.monotonic() + SERVER_SHUTDOWN_TIMEOUT + 5
+            print("正在停止，等待工作进程处理完进行中的请求...")
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(SERVER_WORKERS):
+        spawn(index)
+
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping and time.monotonic() > kill_at:
+                for pid in workers:
+                    os.kill(pid, signal.SIGKILL)
+                kill_at = float('inf')
+            time.sleep(0.2)
+            continue
+        index = workers.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"工作进程#{index}（pid {pid}）异常退出，状态{status}，1秒后重新启动")
+            time.sleep(1)
+            spawn(index)
+    listener.close()
+    return 0
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("校园二手交易平台服务器启动中...")
     print("=" * 60)
-    print("访问地址: http://localhost:5000")
-    print("健康检查: http://localhost:5000/api/health")
-    print("数据库诊断: http://localhost:5000/api/debug/tables")
-    print("商品列表: http://localhost:5000/product_list")
+    print(f"访问地址: http://localhost:{SERVER_PORT}")
+    print(f"健康检查: http://localhost:{SERVER_PORT}/api/health")
+    print(f"数据库诊断: http://localhost:{SERVER_PORT}/api/debug/tables")
+    print(f"连接池状态: http://localhost:{SERVER_PORT}/api/debug/pool")
+    print(f"监控指标: http://localhost:{SERVER_PORT}/api/metrics")
+    print(f"实时推送: http://localhost:{SERVER_PORT}/api/stream")
+    print(f"商品列表: http://localhost:{SERVER_PORT}/product_list")
     print("测试账号: test/123456, admin/admin123, 张三/123456, 李四/123456")
     print("=" * 60)
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    if env('APP_DEBUG', False):
+        # 开发模式：单进程Werkzeug开发服务器，带自动重载与调试器，不可用于生产
+        # reloader父进程只负责监控文件，不处理请求，无需预热
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            create_app(maintenance=True)
+        app.run(debug=True, host=SERVER_HOST, port=SERVER_PORT, threaded=True)
+    else:
+        print(f"{SERVER_WORKERS}个工作进程，每个{SERVER_THREADS}个线程"
+              + ("（gevent协程模式）" if os.environ.get('APP_SERVER') == 'gevent' else ""))
+        sys.exit(serve())
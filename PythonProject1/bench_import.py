@@ -0,0 +1,65 @@
+"""批量导入吞吐基准
+
+对运行中的服务分别用单条接口（/api/publish_product，每行一次请求、一次提交）
+与批量接口（/api/bulk_publish，NDJSON流式上传、按批提交）发布同样数量的商品，报告行/秒。
+
+注意：会向数据库真实写入商品，请在测试库上运行。
+
+用法：
+    python app.py                    # 先启动服务
+    python bench_import.py --rows 2000 --user-id 1
+"""
+import argparse
+import json
+import time
+import urllib.request
+
+
+def post(url, body, content_type):
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def make_rows(count, user_id, tag):
+    for i in range(count):
+        yield {
+            "product_name": f"基准测试商品{tag}-{i}",
+            "price": round(5 + (i * 37) % 2000 + 0.5, 2),
+            "category_id": i % 5 + 1,
+            "user_id": user_id,
+            "description": "bench_import.py 生成"
+        }
+
+
+def bench_single(base_url, rows, user_id):
+    start = time.perf_counter()
+    for row in make_rows(rows, user_id, 'single'):
+        post(f"{base_url}/api/publish_product", json.dumps(row).encode('utf-8'), 'application/json')
+    return time.perf_counter() - start
+
+
+def bench_bulk(base_url, rows, user_id, batch_size):
+    body = b''.join(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n'
+                    for row in make_rows(rows, user_id, 'bulk'))
+    start = time.perf_counter()
+    result = post(f"{base_url}/api/bulk_publish?batch_size={batch_size}", body, 'application/x-ndjson')
+    elapsed = time.perf_counter() - start
+    if result.get('failed'):
+        print(f"  批量导入有 {result['failed']} 行失败：{result['errors'][:3]}")
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量导入吞吐基准')
+    parser.add_argument('--url', default='http://localhost:5000', help='服务地址')
+    parser.add_argument('--rows', type=int, default=1000, help='每种方式发布的商品数')
+    parser.add_argument('--user-id', type=int, default=1, help='发布者user_id（须存在）')
+    parser.add_argument('--batch-sizes', default='100,500,2000', help='批量接口测试的batch_size，逗号分隔')
+    args = parser.parse_args()
+
+    seconds = bench_single(args.url, args.rows, args.user_id)
+    print(f"单条接口       {args.rows / seconds:10.1f} 行/秒  ({seconds:.2f}s)")
+    for batch_size in (int(b) for b in args.batch_sizes.split(',')):
+        seconds = bench_bulk(args.url, args.rows, args.user_id, batch_size)
+        print(f"批量 batch={batch_size:<5} {args.rows / seconds:10.1f} 行/秒  ({seconds:.2f}s)")
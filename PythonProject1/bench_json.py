@@ -0,0 +1,86 @@
+"""JSON序列化微基准
+
+对比各编码器对典型响应体的编码耗时与字节数：
+  - legacy：改造前的 json.dumps(indent=2)（原实现不支持Decimal/datetime，这里以default=str补齐）
+  - json / orjson：app.JSON_ENCODERS 中的紧凑与缩进输出
+
+用法：
+    python bench_json.py
+    python bench_json.py --rounds 2000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import app
+
+
+def make_products(count, full=False, seed=7):
+    """生成与DictCursor返回结构一致的商品行（Decimal价格、datetime时间）"""
+    rnd = random.Random(seed)
+    base = datetime(2024, 9, 1, 8, 0, 0)
+    rows = []
+    for pid in range(1, count + 1):
+        row = {
+            "product_id": pid,
+            "product_name": f"二手商品{pid} 九成新",
+            "price": Decimal(rnd.randint(100, 500000)) / 100,
+            "category_name": rnd.choice(['书籍', '电子产品', '生活用品', '服饰', '其他']),
+            "seller_name": f"用户{rnd.randint(1, 5000)}"
+        }
+        if full:
+            row.update({
+                "description": "功能完好，宿舍自提，可小刀。" * 3,
+                "category_id": rnd.randint(1, 5),
+                "user_id": rnd.randint(1, 5000),
+                "images": None,
+                "status": 1,
+                "publish_time": base + timedelta(minutes=pid),
+                "view_count": rnd.randint(0, 500),
+                "favorite_count": rnd.randint(0, 30)
+            })
+        rows.append(row)
+    return rows
+
+
+PAYLOADS = {
+    'product_list(20)': {"products": make_products(20), "count": 20, "has_more": True, "next_cursor": "x" * 40},
+    'product_list(100)': {"products": make_products(100), "count": 100, "has_more": True, "next_cursor": "x" * 40},
+    'user_products(200)': {"code": 200, "success": True, "products": make_products(200, full=True), "count": 200},
+    'catalog(5000)': {"products": make_products(5000, full=True), "count": 5000}
+}
+
+
+def legacy_dumps(data, pretty=True):
+    return json.dumps(data, ensure_ascii=False, indent=2, separators=(',', ': '), default=str).encode('utf-8')
+
+
+def bench(encode, data, pretty, rounds):
+    encode(data, pretty)  # 预热
+    start = time.perf_counter()
+    for _ in range(rounds):
+        body = encode(data, pretty)
+    return (time.perf_counter() - start) / rounds, len(body)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='JSON序列化微基准')
+    parser.add_argument('--rounds', type=int, default=200, help='每组测试的编码次数（catalog自动缩减）')
+    args = parser.parse_args()
+
+    encoders = [('legacy', legacy_dumps, True)]
+    for name, encode in app.JSON_ENCODERS.items():
+        encoders.append((name, encode, False))
+        encoders.append((f"{name}+pretty", encode, True))
+
+    for label, data in PAYLOADS.items():
+        rounds = max(1, args.rounds // 20) if len(data["products"]) > 1000 else args.rounds
+        print(f"{label}")
+        baseline = None
+        for name, encode, pretty in encoders:
+            seconds, size = bench(encode, data, pretty, rounds)
+            baseline = baseline or seconds
+            print(f"  {name:<14} {seconds * 1e6:10.1f}us/次  {size:>9} 字节  {baseline / seconds:5.1f}x")
@@ -0,0 +1,252 @@
+"""接口压测基准
+
+N个并发客户端在固定时长内按权重混合请求各接口，报告每个接口的吞吐、错误数与p50/p95/p99延迟。
+结果可保存为JSON，下次运行时用 --baseline 对比，p95变慢超过阈值的接口标记为回退。
+
+请求参数从数据库中已有的用户/商品ID范围随机抽取，热门卖家与热门商品按幂律倾斜，
+与 seed_data.py 生成的数据分布一致。create_order 会真实写库，默认不参与，需 --writes 开启。
+
+用法：
+    python seed_data.py                                  # 先灌入压测数据
+    python app.py                                        # 启动服务
+    python bench_load.py --clients 32 --duration 60 --save v1.json
+    python bench_load.py --clients 32 --duration 60 --baseline v1.json
+    python bench_load.py --only product_list,hot_categories --writes
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+
+import app
+
+SEARCH_KEYWORDS = ['iPhone', '教材', '九成新', '考研', '耳机', '台灯', '运动鞋', '毕业甩卖', '自行车', '书']
+
+
+def request(method, url, payload=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'} if data else {})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class Workload:
+    """按权重挑选接口并生成请求参数"""
+
+    def __init__(self, ranges, writes, only, seed):
+        self.users = ranges['users']
+        self.products = ranges['products']
+        self.categories = ranges['categories']
+        self.seed = seed
+        # (名称, 权重, 生成请求的方法, 视为正常的状态码)
+        scenarios = [
+            ('product_list', 40, self.product_list, (200,)),
+            ('product_list_page2', 10, self.product_list_page2, (200,)),
+            ('search', 15, self.search, (200,)),
+            ('user_products', 10, self.user_products, (200,)),
+            ('hot_categories', 8, self.hot_categories, (200,)),
+            ('price_distribution', 5, self.price_distribution, (200,)),
+            ('check_favorites', 12, self.check_favorites, (200,)),
+        ]
+        if writes:
+            # 随机挑选的商品可能已售出或是买家自己的，404/409/400都是正常业务结果
+            scenarios.append(('create_order', 5, self.create_order, (200, 400, 404, 409)))
+        if only:
+            scenarios = [s for s in scenarios if s[0] in only]
+        if not scenarios:
+            raise ValueError('没有可运行的接口')
+        self.scenarios = scenarios
+        self.weights = [s[1] for s in scenarios]
+
+    def pick(self, rnd):
+        return rnd.choices(self.scenarios, self.weights)[0]
+
+    def hot_user(self, rnd):
+        low, high = self.users
+        return low + min(high - low, int((high - low + 1) * rnd.random() ** 3))
+
+    def hot_product(self, rnd):
+        low, high = self.products
+        return low + min(high - low, int((high - low + 1) * rnd.random() ** 2))
+
+    def product_list(self, rnd, base_url):
+        params = []
+        if rnd.random() < 0.5:
+            params.append(f"category_id={rnd.choice(self.categories)}")
+        if rnd.random() < 0.3:
+            low = rnd.choice([0, 50, 100, 200])
+            params.append(f"min_price={low}&max_price={low * 2 + 50}")
+        return 'GET', f"{base_url}/product_list?{'&'.join(params)}", None
+
+    def product_list_page2(self, rnd, base_url):
+        # 先取首页拿到游标，只计第二页的耗时
+        category_id = rnd.choice(self.categories)
+        status, body = request('GET', f"{base_url}/product_list?category_id={category_id}")
+        cursor = json.loads(body).get('next_cursor') if status == 200 else None
+        if not cursor:
+            return self.product_list(rnd, base_url)
+        return 'GET', f"{base_url}/product_list?category_id={category_id}&cursor={cursor}", None
+
+    def search(self, rnd, base_url):
+        keyword = urllib.parse.quote(rnd.choice(SEARCH_KEYWORDS))
+        return 'GET', f"{base_url}/api/search?q={keyword}", None
+
+    def user_products(self, rnd, base_url):
+        return 'GET', f"{base_url}/api/user_products/{self.hot_user(rnd)}", None
+
+    def hot_categories(self, rnd, base_url):
+        return 'GET', f"{base_url}/api/hot_categories", None
+
+    def price_distribution(self, rnd, base_url):
+        return 'GET', f"{base_url}/api/price_distribution", None
+
+    def check_favorites(self, rnd, base_url):
+        ids = [self.hot_product(rnd) for _ in range(20)]
+        return 'POST', f"{base_url}/api/check_favorites", {"user_id": self.hot_user(rnd), "product_ids": ids}
+
+    def create_order(self, rnd, base_url):
+        return 'POST', f"{base_url}/api/create_order", {
+            "product_id": rnd.randint(*self.products), "buyer_id": rnd.randint(*self.users)
+        }
+
+
+def load_ranges():
+    conn = app.MySQLdb.connect(**app.DB_CONFIG)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT MIN(user_id), MAX(user_id) FROM user")
+        users = cur.fetchone()
+        cur.execute("SELECT MIN(product_id), MAX(product_id) FROM product")
+        products = cur.fetchone()
+        cur.execute("SELECT category_id FROM category")
+        categories = [row[0] for row in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+    if users[0] is None or products[0] is None:
+        raise SystemExit('数据库中没有用户或商品，请先运行 seed_data.py')
+    return {"users": users, "products": products, "categories": categories}
+
+
+def run(base_url, workload, clients, duration, warmup):
+    latencies = defaultdict(list)
+    errors = Counter()
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + warmup
+    deadline = measure_from + duration
+
+    def client(i):
+        rnd = random.Random(workload.seed * 1000 + i)
+        local = defaultdict(list)
+        local_errors = Counter()
+        while True:
+            name, _, build, ok_statuses = workload.pick(rnd)
+            method, url, payload = build(rnd, base_url)
+            start = time.perf_counter()
+            if start >= deadline:
+                break
+            try:
+                status, _ = request(method, url, payload)
+            except Exception:
+                status = None
+            end = time.perf_counter()
+            if start < measure_from:
+                continue
+            local[name].append(end - start)
+            if status not in ok_statuses:
+                local_errors[name] += 1
+        with lock:
+            for name, samples in local.items():
+                latencies[name].extend(samples)
+            errors.update(local_errors)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    results = {}
+    for name, samples in sorted(latencies.items()):
+        results[name] = {
+            "requests": len(samples),
+            "errors": errors[name],
+            "rps": round(len(samples) / duration, 1),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        }
+    return results
+
+
+def report(results, duration, baseline=None, threshold=0.2):
+    total = sum(r['requests'] for r in results.values())
+    print(f"{'接口':<20}{'请求数':>8}{'错误':>7}{'rps':>9}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}")
+    regressions = []
+    for name, r in results.items():
+        line = (f"{name:<20}{r['requests']:>8}{r['errors']:>7}{r['rps']:>9}"
+                f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+        old = (baseline or {}).get(name)
+        if old:
+            change = (r['p95_ms'] - old['p95_ms']) / max(old['p95_ms'], 0.01)
+            line += f"  p95 {change:+.0%}"
+            if change > threshold:
+                line += "  回退"
+                regressions.append(name)
+        print(line)
+    print(f"合计 {total} 次请求，{total / duration:.1f} 请求/秒")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='接口压测基准')
+    parser.add_argument('--url', default='http://localhost:5000', help='服务地址')
+    parser.add_argument('--clients', type=int, default=16, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=30, help='计量时长（秒）')
+    parser.add_argument('--warmup', type=float, default=5, help='预热时长（秒），不计入结果')
+    parser.add_argument('--only', help='只压测这些接口，逗号分隔')
+    parser.add_argument('--writes', action='store_true', help='包含会写库的create_order')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子，相同种子请求序列相同')
+    parser.add_argument('--save', help='把结果保存为JSON')
+    parser.add_argument('--baseline', help='与之前保存的JSON结果对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='p95变慢超过该比例视为回退')
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else None
+    workload = Workload(load_ranges(), args.writes, only, args.seed)
+    print(f"{args.clients} 个客户端，预热 {args.warmup}s，计量 {args.duration}s ...")
+    results = run(args.url, workload, args.clients, args.duration, args.warmup)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    regressions = report(results, args.duration, baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({"clients": args.clients, "duration": args.duration, "results": results},
+                      f, ensure_ascii=False, indent=2)
+    if regressions:
+        print(f"性能回退：{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""抢购并发基准
+
+每轮先发布一件商品，再让N个买家线程同时对它调用 /api/create_order，
+统计响应延迟分位数与状态码分布，并直接查库校验正确性：每件商品恰好一个订单、状态为已售出。
+
+注意：会向数据库真实写入商品和订单，请在测试库上运行。
+
+用法：
+    python app.py                    # 先启动服务
+    python bench_orders.py --buyers 50 --rounds 10 --seller-id 1 --buyer-ids 2,3,4
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+import app
+
+
+def post(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, json.loads(resp.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode('utf-8') or '{}')
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run_round(base_url, seller_id, buyer_ids, buyers, latencies, statuses):
+    _, body = post(f"{base_url}/api/publish_product", {
+        "product_name": "抢购基准商品", "price": 9.9, "category_id": 1,
+        "user_id": seller_id, "description": "bench_orders.py 生成"
+    })
+    product_id = body['product_id']
+    barrier = threading.Barrier(buyers)
+
+    def buyer(i):
+        barrier.wait()
+        start = time.perf_counter()
+        status, _ = post(f"{base_url}/api/create_order",
+                         {"product_id": product_id, "buyer_id": buyer_ids[i % len(buyer_ids)]})
+        latencies.append(time.perf_counter() - start)
+        statuses[status] += 1
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(buyers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return product_id
+
+
+def verify(product_ids):
+    """返回不正确的商品：订单数不为1或商品未标记为已售出"""
+    conn = app.MySQLdb.connect(**app.DB_CONFIG)
+    cur = conn.cursor()
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    try:
+        cur.execute(f"""
+            SELECT p.product_id, p.status, COUNT(o.order_id)
+            FROM product p LEFT JOIN orders o ON o.product_id = p.product_id
+            WHERE p.product_id IN ({placeholders})
+            GROUP BY p.product_id, p.status
+        """, product_ids)
+        return [row for row in cur.fetchall() if row[1] != 0 or row[2] != 1]
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='抢购并发基准')
+    parser.add_argument('--url', default='http://localhost:5000', help='服务地址')
+    parser.add_argument('--buyers', type=int, default=50, help='每轮并发买家数')
+    parser.add_argument('--rounds', type=int, default=10, help='轮数（每轮一件新商品）')
+    parser.add_argument('--seller-id', type=int, default=1, help='卖家user_id')
+    parser.add_argument('--buyer-ids', default='2,3,4', help='买家user_id，逗号分隔，循环使用')
+    args = parser.parse_args()
+
+    buyer_ids = [int(b) for b in args.buyer_ids.split(',')]
+    latencies = []
+    statuses = Counter()
+    product_ids = []
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        product_ids.append(run_round(args.url, args.seller_id, buyer_ids, args.buyers, latencies, statuses))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.rounds}轮 × {args.buyers}买家，共{len(latencies)}次下单，耗时{elapsed:.2f}s")
+    print(f"延迟 p50={percentile(latencies, 50) * 1000:.1f}ms  p95={percentile(latencies, 95) * 1000:.1f}ms  "
+          f"p99={percentile(latencies, 99) * 1000:.1f}ms  max={max(latencies) * 1000:.1f}ms")
+    print(f"状态码分布：{dict(statuses)}（期望 200 恰好 {args.rounds} 次）")
+
+    bad = verify(product_ids)
+    if bad or statuses[200] != args.rounds:
+        print(f"正确性校验失败：{bad}")
+    else:
+        print("正确性校验通过：每件商品恰好一个订单")
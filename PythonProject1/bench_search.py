@@ -0,0 +1,123 @@
+"""商品搜索基准测试
+
+对比三种关键词搜索方式在大规模商品目录上的耗时：
+  1. 内存二元组倒排索引（/api/search 默认路径，app.SearchIndex）
+  2. LIKE '%关键词%' 基线：逐行子串匹配，等价于MySQL对product表的全表扫描
+  3. （--mysql）直接在数据库上对比 LIKE 与 FULLTEXT ngram 索引
+
+用法：
+    python bench_search.py                      # 内存中生成100万条商品
+    python bench_search.py --products 200000 --rounds 20
+    python bench_search.py --mysql              # 需先用456.sql建库并灌入数据
+"""
+import argparse
+import random
+import statistics
+import time
+
+import app
+
+# 合成商品名/描述用的词表
+BRANDS = ['iPhone', '小米', '华为', 'ThinkPad', '戴尔', '索尼', 'Kindle', '耐克', '优衣库', '得力']
+ITEMS = ['手机', '笔记本电脑', '平板', '耳机', '充电宝', '台灯', '保温杯', '篮球', '棉衣', '运动鞋',
+         '自行车', '显示器', '键盘', '鼠标', '教材', '词汇书', '真题', '小说', '收纳箱', '电饭煲']
+SUBJECTS = ['高等数学', '线性代数', 'Java编程', 'Python', '考研英语', '大学物理', '数据结构', '操作系统']
+CONDITIONS = ['全新', '九成新', '八成新', '二手', '几乎全新', '功能完好', '有轻微划痕']
+EXTRAS = ['带原装充电器', '送书签', '含详细解析', '可小刀', '毕业甩卖', '宿舍自提', '附发票', '128GB', '蓝色', 'L码']
+
+QUERIES = ['iPhone', '二手手机', '九成新', '考研', '高等数学教材', '充电宝', 'ThinkPad', '耳机', '毕业甩卖', '书']
+
+
+def generate_products(count, seed=42):
+    """生成(product_id, product_name, description)，名称带型号数字以扩大词表"""
+    rnd = random.Random(seed)
+    for pid in range(1, count + 1):
+        if rnd.random() < 0.3:
+            name = f"{rnd.choice(SUBJECTS)}{rnd.choice(['教材', '真题', '笔记', '习题册'])}"
+        else:
+            name = f"{rnd.choice(CONDITIONS)}{rnd.choice(BRANDS)}{rnd.choice(ITEMS)} {rnd.randint(1, 99)}"
+        description = f"{rnd.choice(CONDITIONS)}，{rnd.choice(EXTRAS)}，{rnd.choice(EXTRAS)}"
+        yield pid, name, description
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def report(label, samples, hits):
+    print(f"  {label:<12} p50={percentile(samples, 50) * 1000:9.3f}ms  "
+          f"p95={percentile(samples, 95) * 1000:9.3f}ms  "
+          f"mean={statistics.mean(samples) * 1000:9.3f}ms  命中={hits}")
+
+
+def bench_memory(count, rounds):
+    print(f"生成 {count} 条商品...")
+    products = list(generate_products(count))
+
+    start = time.perf_counter()
+    index = app.SearchIndex()
+    for pid, name, description in products:
+        index.add(pid, name, description)
+    print(f"构建倒排索引：{time.perf_counter() - start:.2f}s，词元数 {index.token_count()}")
+
+    for keyword in QUERIES:
+        print(f"关键词「{keyword}」")
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            hits = len(index.search(keyword))
+            samples.append(time.perf_counter() - start)
+        report('倒排索引', samples, hits)
+
+        # LIKE基线只跑少量轮次，全表扫描太慢
+        needle = keyword.lower()
+        samples = []
+        for _ in range(max(1, rounds // 10)):
+            start = time.perf_counter()
+            hits = sum(1 for _, name, description in products
+                       if needle in name.lower() or needle in description.lower())
+            samples.append(time.perf_counter() - start)
+        report('LIKE扫描', samples, hits)
+
+
+def bench_mysql(rounds):
+    conn = app.MySQLdb.connect(**app.DB_CONFIG)
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM product WHERE status = 1")
+    print(f"数据库在售商品：{cur.fetchone()[0]} 条")
+
+    like_sql = ("SELECT product_id FROM product WHERE status = 1 "
+                "AND (product_name LIKE %s OR description LIKE %s) LIMIT 20")
+    fulltext_sql = ("SELECT product_id, MATCH(product_name, description) AGAINST (%s IN BOOLEAN MODE) AS score "
+                    "FROM product WHERE status = 1 "
+                    "AND MATCH(product_name, description) AGAINST (%s IN BOOLEAN MODE) "
+                    "ORDER BY score DESC LIMIT 20")
+    try:
+        for keyword in QUERIES:
+            print(f"关键词「{keyword}」")
+            for label, sql, params in (('LIKE', like_sql, (f"%{keyword}%", f"%{keyword}%")),
+                                       ('FULLTEXT', fulltext_sql, (app.fulltext_boolean_query(keyword),) * 2)):
+                samples = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    cur.execute(sql, params)
+                    hits = len(cur.fetchall())
+                    samples.append(time.perf_counter() - start)
+                report(label, samples, hits)
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='商品搜索基准测试')
+    parser.add_argument('--products', type=int, default=1000000, help='内存测试生成的商品数')
+    parser.add_argument('--rounds', type=int, default=50, help='每个关键词的测试轮数')
+    parser.add_argument('--mysql', action='store_true', help='在DB_CONFIG指向的数据库上对比LIKE与FULLTEXT')
+    args = parser.parse_args()
+
+    if args.mysql:
+        bench_mysql(args.rounds)
+    else:
+        bench_memory(args.products, args.rounds)
@@ -0,0 +1,57 @@
+"""数据导出命令行工具（夜间分析导出用）
+
+与 /api/export/<table> 共用 app.export_stream 流水线：无缓冲游标分块读取、
+流式编码与压缩，内存占用与表大小无关。
+
+用法：
+    python export_data.py product -o product.csv
+    python export_data.py orders --format ndjson --since 2024-09-01 --gzip -o orders.ndjson.gz
+    python export_data.py favorites --format ndjson | gzip > favorites.ndjson.gz
+"""
+import argparse
+import sys
+
+# 导出数据可能写到标准输出，app中的诊断输出（连接池、熔断等）改到标准错误，避免混入数据
+STDOUT = sys.stdout.buffer
+sys.stdout = sys.stderr
+
+import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流式导出product/orders/favorites表')
+    parser.add_argument('table', choices=sorted(app.EXPORT_TABLES), help='要导出的表')
+    parser.add_argument('--format', choices=sorted(app.EXPORT_ENCODERS), default='csv', help='导出格式')
+    parser.add_argument('--since', help='增量导出起点（按publish_time/order_time/created_at），如 2024-09-01 08:00:00')
+    parser.add_argument('--gzip', action='store_true', help='gzip压缩输出')
+    parser.add_argument('-o', '--output', help='输出文件，缺省写到标准输出')
+    args = parser.parse_args()
+
+    since = None
+    if args.since:
+        since = app.parse_since(args.since)
+        if since is None:
+            parser.error('since时间格式错误')
+
+    conn = app.get_db_connection()
+    if not conn:
+        print('数据库连接失败', file=sys.stderr)
+        return 1
+
+    out = open(args.output, 'wb') if args.output else STDOUT
+    total = 0
+    try:
+        for chunk in app.export_stream(conn, args.table, args.format, since, args.gzip):
+            out.write(chunk)
+            total += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+    print(f"导出完成：{args.table}，{total} 字节", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
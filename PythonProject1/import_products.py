@@ -0,0 +1,56 @@
+"""批量发布商品命令行工具
+
+与 /api/bulk_publish 共用 app.bulk_publish_products：流式解析输入，逐行按发布规则校验，
+按批 executemany 插入、每批提交一次，坏行只记录错误不影响其他行。
+
+在独立进程中运行，只写数据库：正在运行的服务要到下次与数据库对账（CATALOG_RECONCILE_INTERVAL，
+默认5分钟）时才把导入的商品加入列表与搜索索引，内存中缓存的统计结果也要等过期后才更新。
+
+用法：
+    python import_products.py items.ndjson
+    python import_products.py items.csv --batch-size 1000
+    cat items.json | python import_products.py - --format json
+"""
+import argparse
+import os
+import sys
+
+import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量发布商品')
+    parser.add_argument('file', help="输入文件，'-' 表示标准输入")
+    parser.add_argument('--format', choices=sorted(app.IMPORT_PARSERS),
+                        help='输入格式，缺省按文件扩展名判断（.csv/.ndjson/.jsonl/.json）')
+    parser.add_argument('--batch-size', type=int, default=app.IMPORT_BATCH_SIZE, help='每批插入并提交的行数')
+    args = parser.parse_args()
+
+    fmt = args.format
+    if not fmt:
+        ext = os.path.splitext(args.file)[1].lower()
+        fmt = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'json'}.get(ext)
+        if not fmt:
+            parser.error('无法从文件名判断格式，请指定--format')
+
+    conn = app.get_db_connection()
+    if not conn:
+        print('数据库连接失败', file=sys.stderr)
+        return 1
+
+    stream = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+    try:
+        result = app.bulk_publish_products(conn, app.IMPORT_PARSERS[fmt](stream), max(1, args.batch_size))
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        app.close_db_resource(conn, None)
+
+    print(f"共 {result['total']} 行，成功 {result['inserted']} 行，失败 {result['failed']} 行")
+    for error in result['errors']:
+        print(f"  第{error['row']}行：{error['message']}")
+    return 0 if not result['failed'] else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
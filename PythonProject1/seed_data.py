@@ -0,0 +1,250 @@
+"""合成数据生成工具（压测用）
+
+按真实分布批量生成用户、商品、收藏与订单：
+  - 类别倾斜：书籍/电子产品占大头，其他类别逐级递减
+  - 价格长尾：对数正态分布，多数在几十元，少量上千元
+  - 热门卖家：少数用户发布了大部分商品，收藏也集中在少数商品上
+  - 订单：随机一部分商品标记为已售出，每件对应一个订单
+
+写入方式：
+  - insert（默认）：executemany 多行INSERT，每批提交一次
+  - infile：生成临时TSV后 LOAD DATA LOCAL INFILE（需服务端开启 local_infile=1）
+
+主键从现有最大值之后显式分配，可在已有数据上追加。导入期间关闭外键与唯一性检查（收藏表除外，需靠唯一键去重），
+结束后重算统计汇总表、趋势汇总表与商品收藏数。写入完成后请重启 app.py，使内存目录索引重新加载。
+
+注意：会向数据库真实写入大量数据，请在测试库上运行。
+
+用法：
+    python seed_data.py                                   # 默认10万用户、100万商品
+    python seed_data.py --users 1000000 --products 3000000 --favorites 5000000 --orders 500000
+    python seed_data.py --method infile --batch 50000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime, timedelta
+
+import app
+
+# 类别权重，按category_id升序对应（书籍、电子产品、生活用品、服饰、其他）
+CATEGORY_WEIGHTS = [35, 25, 18, 14, 8]
+
+TITLES = {
+    '书籍': ['高等数学教材', '线性代数', '考研英语真题', 'Java编程思想', '数据结构', '大学物理', '小说', '英语四级词汇书'],
+    '电子产品': ['iPhone', '小米手机', '华为平板', 'ThinkPad笔记本', '蓝牙耳机', '机械键盘', '显示器', 'Kindle'],
+    '生活用品': ['台灯', '保温杯', '收纳箱', '电饭煲', '晾衣架', '小风扇', '床上桌', '插线板'],
+    '服饰': ['冬季棉衣', '运动鞋', '羽绒服', '卫衣', '牛仔裤', '双肩包', '帽子', '围巾'],
+    '其他': ['篮球', '自行车', '吉他', '羽毛球拍', '滑板', '瑜伽垫', '相机三脚架', '桌游']
+}
+CONDITIONS = ['全新', '九成新', '八成新', '二手', '几乎全新', '功能完好', '有轻微划痕']
+EXTRAS = ['带原装配件', '送书签', '含详细解析', '可小刀', '毕业甩卖', '宿舍自提', '附发票', '支持验货']
+
+# 价格分布：对数正态，中位数约60元，截断在[1, 99999]
+PRICE_MEDIAN = 60
+PRICE_SIGMA = 1.3
+
+
+def skewed_index(rnd, n, skew):
+    """返回[0, n)内的下标，skew越大越集中在靠前的下标（幂律近似）"""
+    return min(n - 1, int(n * rnd.random() ** skew))
+
+
+def long_tail_price(rnd):
+    price = rnd.lognormvariate(math.log(PRICE_MEDIAN), PRICE_SIGMA)
+    return round(min(max(price, 1), 99999), 2)
+
+
+def random_time(rnd, now, days):
+    return now - timedelta(seconds=rnd.randint(0, days * 86400))
+
+
+class Seeder:
+    def __init__(self, conn, method, batch, seed, days):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.method = method
+        self.batch = batch
+        self.rnd = random.Random(seed)
+        self.days = days
+        self.now = datetime.now().replace(microsecond=0)
+
+    def max_id(self, table, column):
+        self.cur.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+        return self.cur.fetchone()[0]
+
+    def write(self, table, columns, rows, ignore=False):
+        """写入一张表，返回写入行数"""
+        start = time.perf_counter()
+        if self.method == 'infile':
+            count = self._load_infile(table, columns, rows, ignore)
+        else:
+            count = self._insert_batches(table, columns, rows, ignore)
+        elapsed = time.perf_counter() - start
+        print(f"  {table:<10} {count:>10} 行  {elapsed:7.1f}s  {count / max(elapsed, 1e-9):>10.0f} 行/秒")
+        return count
+
+    def _insert_batches(self, table, columns, rows, ignore):
+        # pymysql的executemany会把 INSERT ... VALUES 改写为多行INSERT
+        sql = (f"INSERT {'IGNORE ' if ignore else ''}INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join(['%s'] * len(columns))})")
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch:
+                count += self.cur.executemany(sql, batch)
+                self.conn.commit()
+                batch = []
+        if batch:
+            count += self.cur.executemany(sql, batch)
+            self.conn.commit()
+        return count
+
+    def _load_infile(self, table, columns, rows, ignore):
+        fd, path = tempfile.mkstemp(prefix=f"seed_{table}_", suffix='.tsv')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+                for row in rows:
+                    f.write('\t'.join('\\N' if v is None else str(v) for v in row))
+                    f.write('\n')
+            self.cur.execute(f"""
+                LOAD DATA LOCAL INFILE %s {'IGNORE' if ignore else ''} INTO TABLE {table}
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                ({', '.join(columns)})
+            """, (path,))
+            count = self.cur.rowcount
+            self.conn.commit()
+            return count
+        finally:
+            os.remove(path)
+
+    def users(self, count):
+        first_id = self.max_id('user', 'user_id') + 1
+
+        def rows():
+            for user_id in range(first_id, first_id + count):
+                yield (user_id, f"seed_{user_id}", '123456', f"seed_{user_id}@example.com",
+                       f"139{user_id % 100000000:08d}", random_time(self.rnd, self.now, self.days))
+
+        self.write('user', ('user_id', 'username', 'password', 'email', 'phone', 'created_at'), rows())
+        return first_id
+
+    def products(self, count, first_user, user_count, sold_count):
+        """生成商品；返回(首个product_id, 卖家数组, 价格数组, 已售下标集合)供订单使用"""
+        self.cur.execute("SELECT category_id, category_name FROM category ORDER BY category_id")
+        categories = self.cur.fetchall()
+        weights = (CATEGORY_WEIGHTS + [CATEGORY_WEIGHTS[-1]] * len(categories))[:len(categories)]
+        first_id = self.max_id('product', 'product_id') + 1
+        sellers = array('i', bytes(4 * count))
+        prices = array('d', bytes(8 * count))
+        sold = set(self.rnd.sample(range(count), min(sold_count, count)))
+        rnd = self.rnd
+
+        def rows():
+            for i in range(count):
+                category_id, category_name = rnd.choices(categories, weights)[0]
+                # 热门卖家：约20%的用户发布约80%的商品
+                seller = first_user + skewed_index(rnd, user_count, 3)
+                price = long_tail_price(rnd)
+                sellers[i] = seller
+                prices[i] = price
+                if i in sold:
+                    status = 0
+                else:
+                    status = 2 if rnd.random() < 0.05 else 1
+                name = f"{rnd.choice(CONDITIONS)}{rnd.choice(TITLES.get(category_name, TITLES['其他']))}"
+                description = f"{rnd.choice(CONDITIONS)}，{rnd.choice(EXTRAS)}，{rnd.choice(EXTRAS)}"
+                views = int(rnd.paretovariate(1.2) * 3)
+                yield (first_id + i, name, f"{price:.2f}", description, category_id, seller,
+                       status, random_time(rnd, self.now, self.days), views)
+
+        self.write('product', ('product_id', 'product_name', 'price', 'description', 'category_id', 'user_id',
+                               'status', 'publish_time', 'view_count'), rows())
+        return first_id, sellers, prices, sold
+
+    def favorites(self, count, first_user, user_count, first_product, product_count):
+        rnd = self.rnd
+
+        def rows():
+            for _ in range(count):
+                # 收藏集中在少数热门商品上，重复的(user, product)由INSERT IGNORE跳过
+                yield (first_user + rnd.randrange(user_count),
+                       first_product + skewed_index(rnd, product_count, 2),
+                       random_time(rnd, self.now, self.days))
+
+        self.write('favorites', ('user_id', 'product_id', 'created_at'), rows(), ignore=True)
+
+    def orders(self, first_user, user_count, first_product, sellers, prices, sold):
+        rnd = self.rnd
+
+        def rows():
+            for i in sorted(sold):
+                buyer = first_user + rnd.randrange(user_count)
+                if buyer == sellers[i]:
+                    buyer = first_user + (buyer - first_user + 1) % user_count
+                order_time = random_time(rnd, self.now, self.days)
+                status = rnd.choices((1, 2, 3, 4), (5, 5, 10, 80))[0]
+                pay_time = order_time + timedelta(minutes=rnd.randint(1, 120)) if status > 1 else None
+                complete_time = pay_time + timedelta(days=rnd.randint(1, 7)) if status == 4 else None
+                yield (first_product + i, buyer, sellers[i], f"{prices[i]:.2f}", status,
+                       order_time, pay_time, complete_time)
+
+        self.write('orders', ('product_id', 'buyer_id', 'seller_id', 'price', 'status',
+                              'order_time', 'pay_time', 'complete_time'), rows())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量生成压测数据')
+    parser.add_argument('--users', type=int, default=100000, help='新增用户数')
+    parser.add_argument('--products', type=int, default=1000000, help='新增商品数')
+    parser.add_argument('--favorites', type=int, default=2000000, help='尝试生成的收藏数（重复对会被跳过）')
+    parser.add_argument('--orders', type=int, default=100000, help='订单数（对应商品标记为已售出）')
+    parser.add_argument('--method', choices=['insert', 'infile'], default='insert', help='写入方式')
+    parser.add_argument('--batch', type=int, default=5000, help='insert方式每批行数')
+    parser.add_argument('--days', type=int, default=365, help='时间字段分布在最近多少天内')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子，相同参数生成相同数据')
+    args = parser.parse_args()
+
+    if args.users < 2 or args.products < 1:
+        parser.error('至少需要2个用户和1件商品')
+
+    conn = app.MySQLdb.connect(**app.DB_CONFIG, local_infile=(args.method == 'infile'))
+    seeder = Seeder(conn, args.method, args.batch, args.seed, args.days)
+    start = time.perf_counter()
+    try:
+        seeder.cur.execute("SET foreign_key_checks = 0, unique_checks = 0")
+        first_user = seeder.users(args.users)
+        first_product, sellers, prices, sold = seeder.products(args.products, first_user, args.users, args.orders)
+        # 收藏的重复(user, product)依赖unique_favorite唯一键由INSERT IGNORE跳过，
+        # unique_checks=0时InnoDB可能不检查二级唯一索引而写入重复行，这一阶段需打开
+        seeder.cur.execute("SET unique_checks = 1")
+        seeder.favorites(args.favorites, first_user, args.users, first_product, args.products)
+        seeder.cur.execute("SET unique_checks = 0")
+        seeder.orders(first_user, args.users, first_product, sellers, prices, sold)
+    finally:
+        seeder.cur.execute("SET foreign_key_checks = 1, unique_checks = 1")
+        seeder.cur.close()
+        conn.close()
+
+    print("重算统计汇总表...")
+    if not app.recompute_product_stats():
+        print("统计汇总表重算失败，请稍后重启app.py由后台任务修正", file=sys.stderr)
+    # 生成的时间分布在最近--days天内，重算全部历史
+    if not app.recompute_trend_stats():
+        print("趋势汇总表重算失败，请稍后重启app.py由后台任务修正", file=sys.stderr)
+    # 收藏由INSERT IGNORE直接写入，未经过收藏接口维护favorite_count
+    if app.reconcile_favorite_counts() is None:
+        print("商品收藏数对账失败，请稍后重启app.py由后台任务修正", file=sys.stderr)
+    print(f"完成，总耗时 {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())